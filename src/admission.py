@@ -0,0 +1,493 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from metrics import REGISTRY, register_stats
+
+ADMISSION = REGISTRY.counter('openai_admission_total', 'OpenAI calls by admission outcome.', ('outcome',))
+ADMISSION_WAIT = REGISTRY.histogram('openai_admission_wait_seconds',
+                                    'Time OpenAI calls waited for the local rate limiter.')
+
+# Statuses worth retrying: timeouts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 429}
+
+# Errors that prove the request never reached OpenAI, so even a write may be sent again
+NOT_DELIVERED_STATUSES = {429}
+NOT_DELIVERED_ERRORS = ('APIConnectionError', 'ConnectError', 'ConnectTimeout')
+
+# Methods that create something upstream; a timed-out or failed one may still have done so
+WRITE_METHODS = {'create', 'create_and_poll', 'create_and_run', 'submit_tool_outputs',
+                 'submit_tool_outputs_and_poll'}
+
+# Resources whose writes leave nothing behind, so repeating one is harmless
+STATELESS_RESOURCES = {'chat', 'completions', 'embeddings', 'moderations'}
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    Raised instead of calling OpenAI when the circuit breaker is open, the local
+    rate limit would delay the call past its budget, or retries ran out.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` units per minute.
+
+    Reservations may take the bucket negative; the caller then waits until the
+    debt is repaid, so waiting callers are served in reservation order.
+
+    Args:
+        per_minute (float): Refill rate; 0 or less disables the limit.
+        capacity (float): Burst size; defaults to one minute's worth.
+        clock (Callable): Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` units and return how many seconds to wait before using them.
+        """
+        if not self.enabled or amount <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._level -= amount
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def cancel(self, amount: float) -> None:
+        """Return units from a reservation that was not used."""
+        if self.enabled and amount:
+            with self._lock:
+                self._refill()
+                self._level = min(self.capacity, self._level + amount)
+
+    def level(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._level
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures, rejects calls
+    for `reset_timeout` seconds, then lets a single trial call through
+    (half-open) and closes again if it succeeds.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds to stay open before a trial call.
+        clock (Callable): Monotonic clock, injectable for tests.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return whether a call may go upstream now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a call admitted by `allow` that was never made."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info("OpenAI circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning(f"OpenAI circuit breaker opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an OpenAI error is transient (rate limit, timeout, connection or server error)."""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUSES or status >= 500
+    name = type(error).__name__
+    return name in NOT_DELIVERED_ERRORS + ('APITimeoutError', 'ReadTimeout', 'TimeoutError')
+
+
+def was_not_delivered(error: Exception) -> bool:
+    """Whether an OpenAI error proves the request was not acted on (rate limited or never connected)."""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in NOT_DELIVERED_STATUSES
+    return type(error).__name__ in NOT_DELIVERED_ERRORS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms headers), if any."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class AdmissionController:
+    """
+    Shared admission control in front of every OpenAI call: request and token
+    per-minute buckets, jittered retries within a per-request time budget that
+    honour Retry-After, and a circuit breaker.
+
+    Args:
+        requests_per_minute (float): Request budget (0 disables).
+        tokens_per_minute (float): Token budget (0 disables).
+        max_attempts (int): Attempts per call, including the first.
+        retry_budget (float): Seconds a call may spend waiting (rate limiter and
+            retries together) before giving up.
+        base_delay (float): First retry delay; later ones double, with full jitter.
+        max_delay (float): Upper bound for one retry delay.
+        breaker (CircuitBreaker): Circuit breaker; a default one is created if None.
+        sleep (Callable): Sleep function, injectable for tests.
+        clock (Callable): Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self,
+                 requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0,
+                 max_attempts: int = 4,
+                 retry_budget: float = 20.0,
+                 base_delay: float = 0.5,
+                 max_delay: float = 8.0,
+                 breaker: CircuitBreaker = None,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+
+    def call(self, func: Callable[[], Any], tokens: int = 0, idempotent: bool = True) -> Any:
+        """
+        Run `func` (one OpenAI request) under admission control.
+
+        Args:
+            func (Callable): Performs the request.
+            tokens (int): Estimated tokens the request will use.
+            idempotent (bool): Whether repeating the request is harmless. If not, it is
+                only retried after errors proving the first attempt never landed
+                (429s and connection errors), never after timeouts or 5xx errors.
+
+        Returns:
+            The result of `func`.
+
+        Raises:
+            UpstreamUnavailableError: The breaker is open, the rate limiter or retries
+                would exceed the budget, or every attempt failed transiently.
+            Exception: Non-retryable errors from `func` are raised unchanged.
+        """
+        started = self.clock()
+        for attempt in range(self.max_attempts):
+            self.sleep(self._admit(started, tokens))
+            try:
+                result = func()
+            except Exception as e:
+                delay = self._after_failure(e, attempt, started, idempotent)
+                self.sleep(delay)
+                continue
+            self._after_success(result, tokens)
+            return result
+        raise AssertionError("unreachable")
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]], tokens: int = 0, idempotent: bool = True) -> Any:
+        """Async variant of `call`; waits with `asyncio.sleep`."""
+        started = self.clock()
+        for attempt in range(self.max_attempts):
+            await asyncio.sleep(self._admit(started, tokens))
+            try:
+                result = await func()
+            except Exception as e:
+                delay = self._after_failure(e, attempt, started, idempotent)
+                await asyncio.sleep(delay)
+                continue
+            self._after_success(result, tokens)
+            return result
+        raise AssertionError("unreachable")
+
+    def check(self, tokens: int = 0) -> None:
+        """
+        Admit a call that cannot be delayed or retried here (e.g. opening a stream):
+        reject it if the breaker is open, otherwise charge the buckets without waiting.
+        The caller must report how the call went with `record_outcome`, since a
+        half-open breaker admits it as its trial call.
+        """
+        if not self.breaker.allow():
+            ADMISSION.inc(outcome='rejected_open')
+            raise UpstreamUnavailableError("OpenAI circuit breaker is open")
+        self.requests.reserve(1)
+        self.tokens.reserve(tokens)
+        ADMISSION.inc(outcome='admitted')
+
+    def record_outcome(self, error: Optional[Exception] = None) -> None:
+        """Tell the breaker how a call admitted by `check` went (`error` is None on success)."""
+        if error is not None and is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # Non-retryable errors mean the upstream answered.
+            self.breaker.record_success()
+
+    def record_usage(self, usage, estimated: int = 0) -> None:
+        """Charge the token bucket for tokens actually used beyond the estimate."""
+        total = usage.get('total_tokens') if isinstance(usage, dict) else getattr(usage, 'total_tokens', None)
+        if total and total > estimated:
+            self.tokens.reserve(total - estimated)
+
+    def stats(self) -> dict:
+        return {'breaker_open': int(self.breaker.state != CircuitBreaker.CLOSED),
+                'consecutive_failures': self.breaker.failures,
+                'request_tokens_available': self.requests.level() if self.requests.enabled else 0,
+                'tokens_available': self.tokens.level() if self.tokens.enabled else 0}
+
+    def _admit(self, started: float, tokens: int) -> float:
+        if not self.breaker.allow():
+            ADMISSION.inc(outcome='rejected_open')
+            raise UpstreamUnavailableError("OpenAI circuit breaker is open")
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait and self.clock() + wait - started > self.retry_budget:
+            self.requests.cancel(1)
+            self.tokens.cancel(tokens)
+            self.breaker.release()
+            ADMISSION.inc(outcome='throttled')
+            raise UpstreamUnavailableError(f"Local OpenAI rate limit would delay the call by {wait:.1f}s")
+        if wait:
+            ADMISSION_WAIT.observe(wait)
+        ADMISSION.inc(outcome='admitted')
+        return wait
+
+    def _after_success(self, result, tokens: int) -> None:
+        self.breaker.record_success()
+        self.record_usage(getattr(result, 'usage', None), tokens)
+
+    def _after_failure(self, error: Exception, attempt: int, started: float, idempotent: bool = True) -> float:
+        """Return how long to wait before retrying, or raise if the call should not be retried."""
+        if not is_retryable(error):
+            # The upstream answered; the request itself was bad.
+            self.breaker.record_success()
+            ADMISSION.inc(outcome='failed')
+            raise error
+        self.breaker.record_failure()
+        if not idempotent and not was_not_delivered(error):
+            # The write may have landed (e.g. a message was added before a 502); sending
+            # it again could duplicate it, so the caller gets the failure instead.
+            ADMISSION.inc(outcome='failed')
+            raise UpstreamUnavailableError(f"OpenAI write failed and was not retried: {error}") from error
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if attempt + 1 >= self.max_attempts or self.clock() + delay - started > self.retry_budget:
+            ADMISSION.inc(outcome='exhausted')
+            raise UpstreamUnavailableError(f"OpenAI request failed after {attempt + 1} attempts: {error}") from error
+        ADMISSION.inc(outcome='retried')
+        logging.warning(f"Retrying OpenAI request in {delay:.2f}s after: {error}")
+        return delay
+
+
+def estimate_request_tokens(kwargs: dict) -> int:
+    """Rough token estimate for a chat completion or embedding request, from its inputs."""
+    text = 0
+    for message in kwargs.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        text += len(content) if isinstance(content, str) else 0
+    model_input = kwargs.get('input')
+    if isinstance(model_input, str):
+        text += len(model_input)
+    return text // 4 + int(kwargs.get('max_tokens') or kwargs.get('max_completion_tokens') or 0)
+
+
+_PLAIN_TYPES = (str, bytes, int, float, bool, type(None), dict, list, tuple)
+
+
+class _CheckedStream:
+    """
+    Wraps a stream manager (e.g. the one `runs.stream` returns) and reports to the
+    controller whether the stream opened, and whether it later failed upstream.
+    """
+
+    def __init__(self, manager, controller: AdmissionController):
+        self._manager = manager
+        self._controller = controller
+
+    def __getattr__(self, name: str):
+        return getattr(self._manager, name)
+
+    def __enter__(self):
+        try:
+            stream = self._manager.__enter__()
+        except Exception as e:
+            self._controller.record_outcome(e)
+            raise
+        self._controller.record_outcome()
+        return stream
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, Exception):
+            self._controller.record_outcome(exc)
+        return self._manager.__exit__(exc_type, exc, tb)
+
+    async def __aenter__(self):
+        try:
+            stream = await self._manager.__aenter__()
+        except Exception as e:
+            self._controller.record_outcome(e)
+            raise
+        self._controller.record_outcome()
+        return stream
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if isinstance(exc, Exception):
+            self._controller.record_outcome(exc)
+        return await self._manager.__aexit__(exc_type, exc, tb)
+
+
+class AdmittedClient:
+    """
+    Proxy for an OpenAI (or AsyncOpenAI) client that routes every API method
+    through an `AdmissionController`. Resources (`chat`, `beta.threads`, ...) are
+    proxied recursively; streaming helpers (`runs.stream`) are only checked
+    against the breaker and buckets, since they open their connection later, and
+    report to the breaker once the stream opens or fails. Writes to stateful
+    resources (`threads.create`, `messages.create`, `runs.create`, ...) are
+    admitted as non-idempotent calls.
+
+    Args:
+        client: The client to wrap.
+        controller (AdmissionController): The shared controller.
+        is_async (bool): Whether the client's methods return coroutines.
+        path (tuple): Attribute names leading from the client to this resource.
+    """
+
+    def __init__(self, client, controller: AdmissionController, is_async: bool = False, path: tuple = ()):
+        self._target = client
+        self._controller = controller
+        self._is_async = is_async
+        self._path = path
+
+    @property
+    def client(self):
+        return self._target
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if isinstance(attr, _PLAIN_TYPES) or name.startswith('_'):
+            return attr
+        if not callable(attr):
+            return AdmittedClient(attr, self._controller, self._is_async, self._path + (name,))
+        controller = self._controller
+        if name == 'stream':
+            def checked(*args, **kwargs):
+                controller.check()
+                try:
+                    manager = attr(*args, **kwargs)
+                except Exception as e:
+                    controller.record_outcome(e)
+                    raise
+                return _CheckedStream(manager, controller)
+            return checked
+        idempotent = name not in WRITE_METHODS or bool(self._path) and self._path[0] in STATELESS_RESOURCES
+        if self._is_async:
+            async def admitted_async(*args, **kwargs):
+                return await controller.call_async(lambda: attr(*args, **kwargs), estimate_request_tokens(kwargs),
+                                                   idempotent)
+            return admitted_async
+
+        def admitted(*args, **kwargs):
+            return controller.call(lambda: attr(*args, **kwargs), estimate_request_tokens(kwargs), idempotent)
+        return admitted
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Return the process-wide admission controller, configured from OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT, OPENAI_RETRY_ATTEMPTS, OPENAI_RETRY_BUDGET_SECONDS,
+    OPENAI_BREAKER_FAILURES and OPENAI_BREAKER_RESET_SECONDS.
+    """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                requests_per_minute=float(os.getenv('OPENAI_RPM_LIMIT', '0')),
+                tokens_per_minute=float(os.getenv('OPENAI_TPM_LIMIT', '0')),
+                max_attempts=int(os.getenv('OPENAI_RETRY_ATTEMPTS', '4')),
+                retry_budget=float(os.getenv('OPENAI_RETRY_BUDGET_SECONDS', '20')),
+                breaker=CircuitBreaker(failure_threshold=int(os.getenv('OPENAI_BREAKER_FAILURES', '5')),
+                                       reset_timeout=float(os.getenv('OPENAI_BREAKER_RESET_SECONDS', '30'))),
+            )
+            register_stats('openai_admission', 'OpenAI admission control state.', _controller.stats)
+        return _controller
+
+
+def set_admission_controller(controller: Optional[AdmissionController]) -> None:
+    """Replace the process-wide controller (None rebuilds it from the environment on next use)."""
+    global _controller
+    with _controller_lock:
+        _controller = controller
+    if controller is not None:
+        register_stats('openai_admission', 'OpenAI admission control state.', controller.stats)
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from quart import Quart, Response, request
+from twilio.twiml.messaging_response import MessagingResponse
+
+from admission import UpstreamUnavailableError
+from async_utils import query_chatgpt_assistant_async
+from coalescer import AsyncMessageCoalescer, create_conversation_leases
+from conversation_context import create_context_window
+from conversation_store import create_conversation_store
+from delivery import pack_message
+from idempotency import create_webhook_deduplicator
+from instrumentation import configure_logging, payload, stage
+from metrics import CONTENT_TYPE, REGISTRY, REQUESTS, register_stats
+from response_cache import context_free, create_response_cache
+from router import create_model_router
+from run_completion import RunFailedError
+from threads import get_thread_manager
+import warmup
+from utils import create_prompt_mentor_bot, summarize_conversation, embed_text, completion_strategy
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+# Log records are written by a background thread, never on the event loop
+configure_logging()
+
+# Settings only implemented by the Flask app (whatsapp_bot.py)
+FLASK_ONLY_SETTINGS = ('ASYNC_REPLIES', 'STREAM_REPLIES')
+
+
+def check_settings(environ=os.environ) -> None:
+    """
+    Refuse to start with settings this server does not implement, instead of
+    silently answering inside the webhook and running into Twilio's 15s timeout.
+
+    Raises:
+        RuntimeError: If any of FLASK_ONLY_SETTINGS is enabled.
+    """
+    enabled = [name for name in FLASK_ONLY_SETTINGS if environ.get(name, 'false').lower() == 'true']
+    if enabled:
+        raise RuntimeError(f"{', '.join(enabled)} is not supported by asgi_bot; "
+                           f"serve whatsapp_bot:app (the Flask app) to use it")
+
+
+check_settings()
+
+# ASGI app serving the same /whatsapp contract as whatsapp_bot.py. Every LLM wait
+# is awaited on the event loop, so one process holds many conversations at once.
+app = Quart(__name__)
+
+conversation_store = create_conversation_store()
+# Pre-created threads for new conversations; idle threads are swept against the store
+thread_manager = get_thread_manager()
+thread_manager.attach_store(conversation_store)
+context_window = create_context_window(conversation_store, summarize_conversation)
+response_cache = create_response_cache(embed_text)
+ASSISTANT_CACHE_KEY = "mentor-assistant"
+# Sends trivial messages to the fast model and hedges slow assistant runs (ROUTER_ENABLED)
+model_router = create_model_router()
+# Twilio retries slow webhooks; deliveries are deduplicated on MessageSid
+webhook_deduplicator = create_webhook_deduplicator(ack_response=str(MessagingResponse()))
+DEGRADED_MESSAGE = ("Sorry, I'm having trouble answering right now because of high demand. "
+                    "Please send your message again in a few minutes.")
+# Replies go back in the webhook response, so bursts are only serialized unless a debounce is set
+COALESCE_DEBOUNCE_SECONDS = float(os.getenv('COALESCE_DEBOUNCE_SECONDS', '0'))
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv('COALESCE_MAX_WAIT_SECONDS', '4.0'))
+
+
+@app.before_serving
+async def start_background_warmup() -> None:
+    # Runs on a daemon thread, so the server opens its port without waiting for it
+    warmup.start_warmup(async_server=True)
+
+
+@app.after_serving
+async def close_thread_pool() -> None:
+    # Pooled threads are in no conversation, so only this deletes them when the worker exits
+    await asyncio.to_thread(thread_manager.close)
+
+
+@app.route('/whatsapp', methods=['POST'])
+async def whatsapp_bot() -> str:
+    """
+    Endpoint for receiving incoming WhatsApp messages.
+
+    The incoming WhatsApp message is processed, and an appropriate response is generated
+    and sent back using Twilio's MessagingResponse API.
+
+    Returns:
+        str: The TwiML XML response to be sent to the Twilio API.
+    """
+    with stage('webhook'):
+        form = await request.form
+        response, duplicate = await webhook_deduplicator.handle_async(form.get('MessageSid'),
+                                                                      lambda: _whatsapp_bot(form))
+        if duplicate:
+            REQUESTS.inc(outcome='duplicate')
+        return response
+
+
+async def _whatsapp_bot(form) -> str:
+    incoming_msg = form.get('Body')
+    from_number = form.get('From')
+
+    logging.info(f"Received message from {from_number}: {payload(incoming_msg)}")
+
+    resp = MessagingResponse()
+
+    if incoming_msg:
+        logging.info("Attempting to create a response to the received message...")
+        # Followers of an in-progress turn for this sender get an empty response;
+        # their message is answered together with the leader's.
+        replies = await message_coalescer.submit(from_number, incoming_msg)
+        REQUESTS.inc(outcome='replied' if replies else 'coalesced')
+        for response_text in replies:
+            logging.info(f"Response created: {payload(response_text)}")
+
+            with stage('pack_message'):
+                split_responses = pack_message(response_text)
+            for split_response in split_responses:
+                msg = resp.message()
+                msg.body(split_response)
+    else:
+        logging.info("No valid message received. Sending default error response.")
+        REQUESTS.inc(outcome='invalid')
+        resp.message("I couldn't understand that. Please try again.")
+
+    with stage('twiml'):
+        return str(resp)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics() -> Response:
+    """Prometheus scrape endpoint: stage latencies, token usage, poll counts, cache and queue stats."""
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+
+async def handle_message(message: str, conversation_history: List[Dict[str, str]], thread_id: str,
+                         conversation_id: str = None):
+    """
+    Coroutine version of `whatsapp_bot.handle_message`.
+
+    Blocking steps (the response cache's embedding lookup and the occasional
+    summarization call) run in the default thread pool; the assistant run is awaited.
+
+    Args:
+        message (str): The user's message text.
+        conversation_history (List[Dict[str, str]]): List of previous exchanges.
+        thread_id (str): Existing thread ID; None if it's a new conversation.
+        conversation_id (str): Key of the conversation, used to cache its running summary.
+
+    Returns:
+        tuple: (response text, updated conversation history, thread ID)
+    """
+    with stage('handle_message'):
+        return await _handle_message(message, conversation_history, thread_id, conversation_id)
+
+
+async def _handle_message(message: str, conversation_history: List[Dict[str, str]], thread_id: str,
+                          conversation_id: str = None):
+    # Only opening questions are shared between users; later answers depend on the history
+    cacheable = response_cache is not None and context_free(conversation_history, thread_id)
+    if cacheable:
+        cached = await asyncio.to_thread(response_cache.get, message, ASSISTANT_CACHE_KEY)
+        if cached is not None:
+            logging.info("Answered from the response cache")
+            conversation_history.append({'role': 'user', 'content': message})
+            conversation_history.append({'role': 'assistant', 'content': cached})
+            return cached, conversation_history, thread_id
+
+    with stage('prompt_build'):
+        context = await asyncio.to_thread(context_window.build, conversation_id, conversation_history, thread_id)
+        prompt = create_prompt_mentor_bot(context.recent_turns, message, summary=context.summary)
+
+    # Add user message to conversation history
+    conversation_history.append({'role': 'user', 'content': message})
+
+    # Query the assistant, or the fast model when the router picks it
+    with stage('llm_wait'):
+        if model_router is not None:
+            # Without the thread, the fast model needs the history in its prompt; it is
+            # only built (possibly summarizing the history) if the fast path is used
+            fast_prompt = None
+            if context_window.skip_history_with_thread and thread_id is not None:
+                previous_turns = conversation_history[:-1]
+
+                async def fast_prompt():
+                    fast_context = await asyncio.to_thread(context_window.build, conversation_id,
+                                                           previous_turns, None)
+                    return create_prompt_mentor_bot(fast_context.recent_turns, message,
+                                                    summary=fast_context.summary)
+            response, thread_id = await model_router.answer_async(message, prompt, thread_id,
+                                                                  fast_prompt=fast_prompt)
+        else:
+            response, thread_id = await query_chatgpt_assistant_async(prompt, thread_id=thread_id)
+    if cacheable:
+        await asyncio.to_thread(response_cache.put, message, ASSISTANT_CACHE_KEY, response)
+
+    # Add assistant response to history
+    conversation_history.append({'role': 'assistant', 'content': response})
+
+    return response, conversation_history, thread_id
+
+
+async def respond_to_message(from_number: str, message: str) -> str:
+    """
+    Coroutine version of `whatsapp_bot.respond_to_message`.
+
+    Args:
+        from_number (str): The sender's WhatsApp number, used as the conversation key.
+        message (str): The user's message text.
+
+    Returns:
+        str: The assistant's reply.
+    """
+    with stage('session_load'):
+        conversation = await asyncio.to_thread(conversation_store.load, from_number)
+    previous_length = len(conversation.history)
+
+    try:
+        response_text, updated_conversation_history, thread_id = await handle_message(
+            message, conversation.history, conversation.thread_id, conversation_id=from_number
+        )
+    except (UpstreamUnavailableError, RunFailedError) as e:
+        logging.warning(f"Sending the degraded reply to {from_number}: {e}")
+        REQUESTS.inc(outcome='degraded')
+        return DEGRADED_MESSAGE
+
+    with stage('session_save'):
+        await asyncio.to_thread(conversation_store.append_turns, from_number,
+                                updated_conversation_history[previous_length:], thread_id)
+    return response_text
+
+
+# One turn at a time per sender, across all workers sharing the conversation database,
+# with bursts of messages merged into one turn
+message_coalescer = AsyncMessageCoalescer(respond_to_message, debounce=COALESCE_DEBOUNCE_SECONDS,
+                                          max_wait=COALESCE_MAX_WAIT_SECONDS, leases=create_conversation_leases())
+
+# Gauges read at scrape time
+register_stats('assistant_runs', 'Assistant run and poll totals.', completion_strategy.stats.snapshot)
+register_stats('webhook_duplicates', 'Twilio retries answered without handling the message again.',
+               webhook_deduplicator.stats)
+if model_router is not None:
+    register_stats('router', 'Rolling backend latency and hedging delay.', model_router.stats)
+register_stats('coalescer', 'Messages merged into an earlier turn, and turns that waited for another worker.',
+               lambda: {'coalesced_messages': message_coalescer.coalesced_messages,
+                        'lease_waits': message_coalescer.leases.waits})
+register_stats('warmup', 'Seconds each background warm-up step took.', lambda: dict(warmup.timings))
+register_stats('assistant_threads', 'Pre-created thread pool and expired threads.', thread_manager.stats)
+if hasattr(conversation_store, 'stats'):
+    register_stats('conversation_cache', 'In-memory conversation cache.', conversation_store.stats)
+if response_cache is not None:
+    register_stats('response_cache', 'Response cache entries and hit rate.', response_cache.stats)
@@ -0,0 +1,143 @@
+import logging
+from typing import AsyncIterator, Tuple
+
+from clients import get_async_openai_client
+from constants import MENTOR_BOT_PROMPT
+from instrumentation import stage
+from metrics import record_usage
+from run_completion import aiter_run_deltas
+from threads import afetch_run_reply, get_thread_manager
+from utils import ASSISTANT_ID, _superseded_message, completion_strategy
+
+
+async def query_chatgpt_async(prompt: str,
+                              model="gpt-4o-mini",
+                              system_prompt: str = MENTOR_BOT_PROMPT,
+                              cache=None) -> str:
+    """
+    Async variant of `utils.query_chatgpt` using the shared AsyncOpenAI client.
+
+    Parameters:
+    prompt (str): The prompt to send to the ChatGPT API.
+    system_prompt (str): The system message; defaults to the mentor persona.
+    cache (ResponseCache): Optional response cache consulted before calling the API.
+
+    Returns:
+    str: The response from the ChatGPT API.
+    """
+    if cache is not None:
+        cached = cache.get(prompt, model)
+        if cached is not None:
+            return cached
+    response = await get_async_openai_client().chat.completions.create(
+        model=model,
+        stream=False,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7
+    )
+    record_usage(model, getattr(response, 'usage', None))
+    answer = response.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(prompt, model, answer)
+    return answer
+
+
+async def query_chatgpt_stream_async(prompt: str,
+                                     model="gpt-4o-mini",
+                                     system_prompt: str = MENTOR_BOT_PROMPT) -> AsyncIterator[str]:
+    """
+    Async variant of `utils.query_chatgpt_stream`: yields response text deltas as they arrive.
+    """
+    stream = await get_async_openai_client().chat.completions.create(
+        model=model,
+        stream=True,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def query_chatgpt_assistant_async(question: str, assistant_id: str = ASSISTANT_ID, thread_id: str = None,
+                                        strategy=None) -> Tuple[str, str]:
+    """
+    Async variant of `utils.query_chatgpt_assistant`. While the run is in progress
+    the coroutine yields to the event loop, so one worker can wait on many runs.
+
+    Args:
+        question (str): The question or prompt to send to the assistant.
+        assistant_id (str): The unique identifier for the custom assistant created on OpenAI.
+        thread_id (str): Optional existing thread ID for the conversation. If None, a new thread is created.
+        strategy: Optional completion strategy; must provide `run_async`.
+
+    Returns:
+        tuple: (assistant's response, thread ID used in the interaction)
+    """
+    strategy = strategy or completion_strategy
+    client = get_async_openai_client()
+    try:
+        if thread_id is None:
+            thread_id = await get_thread_manager().acquire_async(client)
+
+        with stage('assistant.message_create'):
+            await client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=question
+            )
+
+        with stage('assistant.run'):
+            outcome = await strategy.run_async(client, thread_id, assistant_id)
+        logging.info(f"Run {outcome.run_id} completed after {outcome.polls} polls")
+        record_usage(assistant_id, outcome.usage)
+
+        if outcome.text is not None:
+            return f"{outcome.text}\n", thread_id
+
+        content = await afetch_run_reply(client, thread_id, outcome.run_id)
+        return (f"{content}\n" if content else ""), thread_id
+
+    except Exception as e:
+        logging.error(f"Error querying the assistant: {e}")
+        raise
+
+
+async def query_chatgpt_assistant_stream_async(question: str, assistant_id: str = ASSISTANT_ID,
+                                               thread_id: str = None) -> Tuple[AsyncIterator[str], str]:
+    """
+    Async variant of `utils.query_chatgpt_assistant_stream`.
+
+    Returns:
+        tuple: (async iterator of response text deltas, thread ID used in the interaction)
+    """
+    client = get_async_openai_client()
+    if thread_id is None:
+        thread_id = await get_thread_manager().acquire_async(client)
+
+    await client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="user",
+        content=question
+    )
+    return aiter_run_deltas(client, thread_id, assistant_id), thread_id
+
+
+async def record_assistant_exchange_async(thread_id: str, answer: str, question: str = None,
+                                          superseded: str = None) -> None:
+    """Async variant of `utils.record_assistant_exchange`."""
+    client = get_async_openai_client()
+    if superseded is not None:
+        messages = await client.beta.threads.messages.list(thread_id=thread_id, limit=1, order='desc')
+        stale = _superseded_message(messages, superseded)
+        if stale is not None:
+            await client.beta.threads.messages.delete(stale, thread_id=thread_id)
+    if question is not None:
+        await client.beta.threads.messages.create(thread_id=thread_id, role="user", content=question)
+    await client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=answer)
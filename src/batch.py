@@ -0,0 +1,580 @@
+"""
+Offline business plan generation for stored conversations.
+
+Streams conversations from the conversation store and builds the same
+per-section prompts as the interactive path, with the section context chosen by
+BUSINESS_PLAN_SECTION_CONTEXT (see business_plan.py). The prompts
+are completed through one of two backends:
+- `concurrent`: the chat completions API, with a bounded number of requests in flight.
+- `batch`: OpenAI Batch API jobs, submitted as JSONL. Batches cost half as much
+  but can take up to 24 hours.
+
+The finished plans are rendered and uploaded to Cloud Storage in parallel.
+Progress is journaled to a JSONL checkpoint file, so an interrupted run can be
+started again with the same arguments and will resume. Documents that are
+already uploaded and sections that are already generated are not redone, and
+submitted batches are collected instead of resubmitted. Work is only redone
+when a conversation has changed since. Each uploaded document's URL is recorded
+in the checkpoint.
+
+With --fake, the OpenAI and Cloud Storage APIs are replaced by in-process fakes
+(see fakes.py), so a run (with --synthetic conversations) measures the
+pipeline's own throughput.
+
+Example:
+    python src/batch.py --backend batch --checkpoint plans.jsonl
+    python src/batch.py --fake --synthetic 500 --backend concurrent --workers 32
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from business_plan import BUSINESS_PLAN_SYSTEM_PROMPT, create_section_context, history_fingerprint, merge_sections
+from documents import DocumentPipeline
+from metrics import record_usage
+from utils import BUSINESS_PLAN_SECTIONS, create_prompt_business_plan_section, query_chatgpt
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+
+class BatchRequest(NamedTuple):
+    """One prompt to complete, identified by `custom_id` ("<conversation_id>#<section index>")."""
+    custom_id: str
+    prompt: str
+
+
+class BatchResult(NamedTuple):
+    """The completion of a request; `text` is None and `error` set if it failed."""
+    custom_id: str
+    text: Optional[str]
+    error: Optional[str] = None
+
+
+class ConcurrentBackend:
+    """
+    Completes requests through the chat completions API, with at most
+    `max_in_flight` requests outstanding. Requests are read from the input
+    lazily, so the input can be an unbounded stream.
+
+    Args:
+        complete (Callable): `complete(prompt) -> str`; defaults to `query_chatgpt`
+            with the business plan system prompt.
+        max_in_flight (int): Maximum number of concurrent requests.
+    """
+
+    def __init__(self, complete: Callable[[str], str] = None, max_in_flight: int = 8):
+        self.complete = complete or (lambda prompt: query_chatgpt(prompt, system_prompt=BUSINESS_PLAN_SYSTEM_PROMPT))
+        self.max_in_flight = max_in_flight
+
+    def run(self, requests: Iterable[BatchRequest], on_submitted: Callable = None,
+            on_collected: Callable = None) -> Iterator[BatchResult]:
+        """Yield a result for every request, in completion order."""
+        in_flight: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='batch') as executor:
+            for request in requests:
+                if len(in_flight) >= self.max_in_flight:
+                    yield from self._finished(in_flight)
+                in_flight[executor.submit(self.complete, request.prompt)] = request.custom_id
+            while in_flight:
+                yield from self._finished(in_flight)
+
+    @staticmethod
+    def _finished(in_flight: Dict[Future, str]) -> Iterator[BatchResult]:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            custom_id = in_flight.pop(future)
+            try:
+                yield BatchResult(custom_id, future.result().strip())
+            except Exception as e:
+                yield BatchResult(custom_id, None, str(e))
+
+
+class BatchAPIBackend:
+    """
+    Completes requests as OpenAI Batch API jobs.
+
+    Requests are grouped into batches of up to `batch_size` and written as JSONL
+    chat completion requests. Each batch is uploaded and started, with up to
+    `max_batches` in progress at once. A batch's results are downloaded once it
+    ends. Requests missing from a batch's output (for example because the batch
+    expired) get no result.
+
+    Args:
+        client: OpenAI client; defaults to the shared one.
+        model (str): Model to complete the prompts with.
+        system_prompt (str): System message of every request.
+        batch_size (int): Maximum requests per batch.
+        max_batches (int): Maximum batches in progress at once.
+        poll_interval (float): Seconds between batch status checks.
+        completion_window (str): How long OpenAI may take to finish a batch.
+        sleep (Callable): Sleep function, injectable for tests.
+    """
+
+    TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+    def __init__(self, client=None, model: str = 'gpt-4o-mini', system_prompt: str = BUSINESS_PLAN_SYSTEM_PROMPT,
+                 batch_size: int = 1000, max_batches: int = 4, poll_interval: float = 30.0,
+                 completion_window: str = '24h', sleep: Callable[[float], None] = time.sleep):
+        if client is None:
+            from clients import get_openai_client
+
+            client = get_openai_client()
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.sleep = sleep
+
+    def run(self, requests: Iterable[BatchRequest], on_submitted: Callable[[str, List[str]], None] = None,
+            on_collected: Callable[[str], None] = None) -> Iterator[BatchResult]:
+        """
+        Submit the requests as batches and yield their results as batches end.
+
+        Args:
+            requests (Iterable[BatchRequest]): The requests, read lazily.
+            on_submitted (Callable): Called with (batch_id, custom_ids) once a batch is started.
+            on_collected (Callable): Called with the batch ID once all of its results were yielded.
+        """
+        pending: List[str] = []
+        requests = iter(requests)
+        while True:
+            chunk = list(itertools.islice(requests, self.batch_size))
+            if not chunk:
+                break
+            while len(pending) >= self.max_batches:
+                yield from self._next_finished(pending, on_collected)
+            batch_id = self.submit(chunk)
+            if on_submitted is not None:
+                on_submitted(batch_id, [request.custom_id for request in chunk])
+            pending.append(batch_id)
+        while pending:
+            yield from self._next_finished(pending, on_collected)
+
+    def collect(self, batch_ids: Sequence[str], on_collected: Callable[[str], None] = None) -> Iterator[BatchResult]:
+        """Wait for batches submitted earlier, e.g. by an interrupted run, and yield their results."""
+        pending = list(batch_ids)
+        while pending:
+            yield from self._next_finished(pending, on_collected)
+
+    def submit(self, requests: Sequence[BatchRequest]) -> str:
+        """
+        Upload `requests` as a JSONL batch input file and start a batch on it.
+
+        Returns:
+            str: The batch ID.
+        """
+        lines = [json.dumps({
+            'custom_id': request.custom_id,
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': {'model': self.model, 'temperature': 0.7,
+                     'messages': [{'role': 'system', 'content': self.system_prompt},
+                                  {'role': 'user', 'content': request.prompt}]},
+        }, ensure_ascii=False) for request in requests]
+        upload = self.client.files.create(file=('batch.jsonl', '\n'.join(lines).encode('utf-8')), purpose='batch')
+        batch = self.client.batches.create(input_file_id=upload.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=self.completion_window)
+        logging.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def _next_finished(self, pending: List[str], on_collected: Optional[Callable[[str], None]]) -> Iterator[BatchResult]:
+        while True:
+            for batch_id in list(pending):
+                try:
+                    batch = self.client.batches.retrieve(batch_id)
+                except Exception as e:
+                    if getattr(e, 'status_code', None) != 404:
+                        raise
+                    # Its requests get no result, so they are requested again by the next run
+                    logging.warning(f"Batch {batch_id} no longer exists")
+                    pending.remove(batch_id)
+                    if on_collected is not None:
+                        on_collected(batch_id)
+                    return
+                if batch.status in self.TERMINAL_STATUSES:
+                    pending.remove(batch_id)
+                    if batch.status != 'completed':
+                        logging.warning(f"Batch {batch_id} ended with status {batch.status}")
+                    yield from self._results(batch)
+                    if on_collected is not None:
+                        on_collected(batch_id)
+                    return
+            self.sleep(self.poll_interval)
+
+    def _results(self, batch) -> Iterator[BatchResult]:
+        for file_id in (batch.output_file_id, getattr(batch, 'error_file_id', None)):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                body = response.get('body') or {}
+                if response.get('status_code') == 200 and body.get('choices'):
+                    record_usage(self.model, body.get('usage'))
+                    yield BatchResult(record['custom_id'], body['choices'][0]['message']['content'].strip())
+                else:
+                    error = record.get('error') or body.get('error') or {}
+                    yield BatchResult(record['custom_id'], None,
+                                      error.get('message') or f"status {response.get('status_code')}")
+
+
+class Checkpoint:
+    """
+    Append-only JSONL journal of a batch run, read back to resume it.
+
+    It records generated sections, submitted and collected batches, and
+    uploaded documents. Every line is flushed as it is written, so killing the
+    process loses at most the line being written. A truncated last line is
+    ignored when the journal is read.
+
+    Args:
+        path (str): The journal file; created if missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # conversation_id -> {custom_id: (fingerprint of the turns it was written from, section text)}
+        self.sections: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        # conversation_id -> fingerprint of the conversation its uploaded document was written from
+        self.documents: Dict[str, str] = {}
+        # batch_id -> {custom_id: fingerprint} for batches not collected yet
+        self.open_batches: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self) -> None:
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                kind = record.get('type')
+                if kind == 'section':
+                    self._add_section(record['custom_id'], record['fingerprint'], record['text'])
+                elif kind == 'batch':
+                    self.open_batches[record['batch_id']] = record['requests']
+                elif kind == 'collected':
+                    self.open_batches.pop(record['batch_id'], None)
+                elif kind == 'document':
+                    self.documents[record['conversation_id']] = record['fingerprint']
+                    # Sections of uploaded documents are not needed again
+                    self.sections.pop(record['conversation_id'], None)
+
+    def section(self, custom_id: str) -> Optional[Tuple[str, str]]:
+        """The (fingerprint, text) of a generated section, or None."""
+        return self.sections.get(custom_id.rpartition('#')[0], {}).get(custom_id)
+
+    def _add_section(self, custom_id: str, fingerprint: str, text: str) -> None:
+        self.sections.setdefault(custom_id.rpartition('#')[0], {})[custom_id] = (fingerprint, text)
+
+    def record_section(self, custom_id: str, fingerprint: str, text: str) -> None:
+        self._add_section(custom_id, fingerprint, text)
+        self._write({'type': 'section', 'custom_id': custom_id, 'fingerprint': fingerprint, 'text': text})
+
+    def record_batch(self, batch_id: str, requests: Dict[str, str]) -> None:
+        self.open_batches[batch_id] = requests
+        self._write({'type': 'batch', 'batch_id': batch_id, 'requests': requests})
+
+    def record_collected(self, batch_id: str) -> None:
+        self.open_batches.pop(batch_id, None)
+        self._write({'type': 'collected', 'batch_id': batch_id})
+
+    def record_document(self, conversation_id: str, fingerprint: str, url: str) -> None:
+        self.documents[conversation_id] = fingerprint
+        self.sections.pop(conversation_id, None)
+        self._write({'type': 'document', 'conversation_id': conversation_id, 'fingerprint': fingerprint,
+                     'url': url, 'uploaded_at': time.time()})
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _Plan:
+    """Sections collected so far for one conversation's plan."""
+
+    def __init__(self, conversation_id: str, fingerprint: str):
+        self.conversation_id = conversation_id
+        self.fingerprint = fingerprint
+        self.sections: Dict[str, str] = {}
+        # custom_id -> fingerprint of the section requests sent for this plan
+        self.requested: Dict[str, str] = {}
+        self.outstanding = 0
+        self.failed = False
+
+
+class BusinessPlanBatch:
+    """
+    Generates, renders and uploads business plans for a stream of conversations.
+
+    Section requests go to the backend as the conversations are read. A plan is
+    sent to the document pipeline as soon as all of its sections are in, so
+    rendering and uploading overlap with generation. At most
+    `max_pending_uploads` documents wait for upload at once.
+
+    Args:
+        conversations (Iterable): (conversation_id, history) pairs, e.g. from
+            `iter_conversations()` of the conversation store.
+        backend: `ConcurrentBackend` or `BatchAPIBackend`.
+        checkpoint (Checkpoint): Journal used to skip finished work and record progress.
+        pipeline (DocumentPipeline): Renders and uploads the documents.
+        sections (Sequence[str]): Section titles in document order.
+        file_format (str): "docx" or "txt".
+        max_pending_uploads (int): Bound on documents queued for upload.
+        context (Callable): `context(section, history) -> history` selecting the turns a
+            section is written from, as for `BusinessPlanGenerator`; defaults to the whole history.
+    """
+
+    def __init__(self, conversations: Iterable[Tuple[str, List[Dict[str, str]]]], backend, checkpoint: Checkpoint,
+                 pipeline: DocumentPipeline, sections: Sequence[str] = BUSINESS_PLAN_SECTIONS,
+                 file_format: str = 'docx', max_pending_uploads: int = 16,
+                 context: Callable[[str, List[Dict[str, str]]], List[Dict[str, str]]] = None):
+        self.conversations = conversations
+        self.backend = backend
+        self.checkpoint = checkpoint
+        self.pipeline = pipeline
+        self.sections = list(sections)
+        self.file_format = file_format
+        self.max_pending_uploads = max_pending_uploads
+        self.context = context or (lambda section, history: history)
+        self._plans: Dict[str, _Plan] = {}
+        # custom_id -> fingerprint of the turns each outstanding request was built from
+        self._requested: Dict[str, str] = {}
+        self._uploads: Dict[Future, _Plan] = {}
+        self.counts = dict.fromkeys(('conversations', 'unchanged', 'empty', 'requests', 'reused_sections',
+                                     'failed_sections', 'documents', 'failed_documents'), 0)
+
+    def run(self) -> Dict[str, int]:
+        """
+        Process every conversation, waiting until all documents are uploaded.
+
+        Returns:
+            Dict[str, int]: Counts of conversations, requests and documents.
+        """
+        if self.checkpoint.open_batches and hasattr(self.backend, 'collect'):
+            logging.info(f"Collecting {len(self.checkpoint.open_batches)} batches from an earlier run")
+            fingerprints = {custom_id: fingerprint for requests in self.checkpoint.open_batches.values()
+                            for custom_id, fingerprint in requests.items()}
+            for result in self.backend.collect(list(self.checkpoint.open_batches),
+                                               on_collected=self.checkpoint.record_collected):
+                if result.text is not None and result.custom_id in fingerprints:
+                    self.checkpoint.record_section(result.custom_id, fingerprints[result.custom_id], result.text)
+
+        for result in self.backend.run(self._requests(), on_submitted=self._submitted,
+                                       on_collected=self.checkpoint.record_collected):
+            self._completed(result)
+        # Requests the backend returned no result for
+        for custom_id in list(self._requested):
+            self._completed(BatchResult(custom_id, None, 'no result'))
+        while self._uploads:
+            self._wait_for_upload()
+        return dict(self.counts)
+
+    def _requests(self) -> Iterator[BatchRequest]:
+        for conversation_id, history in self.conversations:
+            self.counts['conversations'] += 1
+            if not history:
+                self.counts['empty'] += 1
+                continue
+            fingerprint = history_fingerprint(history)
+            if self.checkpoint.documents.get(conversation_id) == fingerprint:
+                self.counts['unchanged'] += 1
+                continue
+            plan = _Plan(conversation_id, fingerprint)
+            self._plans[conversation_id] = plan
+            requests = []
+            for index, section in enumerate(self.sections):
+                custom_id = f"{conversation_id}#{index}"
+                section_history = self.context(section, history)
+                section_fingerprint = history_fingerprint(section_history)
+                saved = self.checkpoint.section(custom_id)
+                if saved is not None and saved[0] == section_fingerprint:
+                    plan.sections[section] = saved[1]
+                    self.counts['reused_sections'] += 1
+                    continue
+                self._requested[custom_id] = section_fingerprint
+                plan.requested[custom_id] = section_fingerprint
+                requests.append(BatchRequest(custom_id, create_prompt_business_plan_section(section,
+                                                                                             section_history)))
+            plan.outstanding = len(requests)
+            if not requests:
+                self._export(plan)
+            self.counts['requests'] += len(requests)
+            yield from requests
+
+    def _submitted(self, batch_id: str, custom_ids: List[str]) -> None:
+        self.checkpoint.record_batch(batch_id, {custom_id: self._requested[custom_id] for custom_id in custom_ids})
+
+    def _completed(self, result: BatchResult) -> None:
+        fingerprint = self._requested.pop(result.custom_id, None)
+        if fingerprint is None:
+            return
+        conversation_id, _, index = result.custom_id.rpartition('#')
+        plan = self._plans.get(conversation_id)
+        if result.text is None:
+            logging.error(f"Failed to generate {result.custom_id}: {result.error}")
+            self.counts['failed_sections'] += 1
+        else:
+            self.checkpoint.record_section(result.custom_id, fingerprint, result.text)
+        if plan is None or plan.requested.get(result.custom_id) != fingerprint:
+            return
+        plan.outstanding -= 1
+        if result.text is None:
+            plan.failed = True
+        else:
+            plan.sections[self.sections[int(index)]] = result.text
+        if plan.outstanding == 0:
+            if plan.failed:
+                # Its generated sections are checkpointed; the next run only requests the failed ones
+                del self._plans[conversation_id]
+                self.counts['failed_documents'] += 1
+            else:
+                self._export(plan)
+
+    def _export(self, plan: _Plan) -> None:
+        del self._plans[plan.conversation_id]
+        while len(self._uploads) >= self.max_pending_uploads:
+            self._wait_for_upload()
+        business_plan = merge_sections({section: plan.sections[section] for section in self.sections})
+        self._uploads[self.pipeline.submit(plan.conversation_id, business_plan, self.file_format)] = plan
+
+    def _wait_for_upload(self) -> None:
+        done, _ = wait(self._uploads, return_when=FIRST_COMPLETED)
+        for future in done:
+            plan = self._uploads.pop(future)
+            if future.exception() is not None:
+                self.counts['failed_documents'] += 1
+                continue
+            self.checkpoint.record_document(plan.conversation_id, plan.fingerprint, future.result())
+            self.counts['documents'] += 1
+            if self.counts['documents'] % 100 == 0:
+                logging.info(f"Uploaded {self.counts['documents']} business plans")
+
+
+def create_synthetic_conversations(store, count: int, seed: int = 7) -> None:
+    """Fill `store` with `count` short founder interviews, for benchmarking."""
+    import random
+
+    from load_test import QUESTIONS
+
+    rng = random.Random(seed)
+    for number in range(count):
+        turns = []
+        for question in rng.sample(QUESTIONS, 4):
+            turns.append({'role': 'user', 'content': question})
+            turns.append({'role': 'assistant', 'content': f"Tell me more about {question.lower().rstrip('?!')}."})
+        store.append_turns(f"whatsapp:+1555{number:07d}", turns)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['batch', 'concurrent'], default='batch')
+    parser.add_argument('--db', help='conversation database (default: CONVERSATION_DB_PATH)')
+    parser.add_argument('--limit', type=int, help='process at most this many conversations')
+    parser.add_argument('--checkpoint', default='business_plans.checkpoint.jsonl',
+                        help='journal to resume from and record progress and document URLs in')
+    parser.add_argument('--model', default=os.getenv('BATCH_MODEL', 'gpt-4o-mini'),
+                        help='model for the batch backend')
+    parser.add_argument('--workers', type=int, default=8, help='requests in flight for the concurrent backend')
+    parser.add_argument('--batch-size', type=int, default=1000, help='requests per Batch API job')
+    parser.add_argument('--max-batches', type=int, default=4, help='Batch API jobs in progress at once')
+    parser.add_argument('--poll-interval', type=float, help='seconds between batch status checks (default 30)')
+    parser.add_argument('--format', choices=['docx', 'txt'], default='docx')
+    parser.add_argument('--bucket', default=os.getenv('GCS_BUCKET_NAME', 'hbs_foundry_demo2'))
+    parser.add_argument('--upload-workers', type=int, default=4, help='documents rendered and uploaded at once')
+    parser.add_argument('--fake', action='store_true', help='use in-process fake OpenAI and Cloud Storage clients')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='with --fake, generate this many conversations in a temporary database')
+    parser.add_argument('--run-latency', default='lognormal:2.0:0.4',
+                        help='with --fake, latency of completions and batches: fixed:S or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--storage-latency', default='fixed:0.05', help='with --fake, latency of uploads')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='where to write the JSON run summary')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    db_path = args.db or os.getenv('CONVERSATION_DB_PATH', 'conversations.db')
+    poll_interval = args.poll_interval if args.poll_interval is not None else 0.2 if args.fake else 30.0
+
+    if args.fake:
+        from fakes import LatencyModel, install_fakes
+
+        fakes = install_fakes(run_latency=LatencyModel.parse(args.run_latency, seed=args.seed),
+                              api_latency=LatencyModel.parse('fixed:0.01'),
+                              storage_latency=LatencyModel.parse(args.storage_latency, seed=args.seed + 1))
+        if args.synthetic:
+            db_path = os.path.join(tempfile.mkdtemp(prefix='whatsapp-batch-'), 'conversations.db')
+    elif args.synthetic:
+        print("--synthetic needs --fake")
+        return 2
+
+    from conversation_store import SQLiteConversationStore
+
+    store = SQLiteConversationStore(db_path)
+    if args.synthetic:
+        create_synthetic_conversations(store, args.synthetic, args.seed)
+    conversations = store.iter_conversations()
+    if args.limit is not None:
+        conversations = itertools.islice(conversations, args.limit)
+
+    if args.backend == 'batch':
+        backend = BatchAPIBackend(model=args.model, batch_size=args.batch_size, max_batches=args.max_batches,
+                                  poll_interval=poll_interval)
+    else:
+        backend = ConcurrentBackend(max_in_flight=args.workers)
+    checkpoint = Checkpoint(args.checkpoint)
+    pipeline = DocumentPipeline(args.bucket, max_workers=args.upload_workers)
+    job = BusinessPlanBatch(conversations, backend, checkpoint, pipeline, file_format=args.format,
+                            max_pending_uploads=4 * args.upload_workers, context=create_section_context())
+
+    start = time.perf_counter()
+    try:
+        counts = job.run()
+    finally:
+        pipeline.shutdown()
+        checkpoint.close()
+    elapsed = time.perf_counter() - start
+
+    results = {
+        'python': platform.python_version(),
+        'config': vars(args),
+        'counts': counts,
+        'elapsed_s': elapsed,
+        'documents_per_s': counts['documents'] / elapsed if elapsed else 0.0,
+        'requests_per_s': counts['requests'] / elapsed if elapsed else 0.0,
+    }
+    if args.fake:
+        results['openai_calls'] = fakes.openai.calls
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    print(f"{counts['documents']} business plans from {counts['conversations']} conversations in {elapsed:.1f}s "
+          f"({results['documents_per_s']:.1f}/s): {counts['requests']} requests, "
+          f"{counts['reused_sections']} sections and {counts['unchanged']} documents reused, "
+          f"{counts['failed_documents']} failed")
+    return 0 if counts['failed_documents'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from instrumentation import stage
+from interview import InterviewTracker, create_interview_tracker
+from utils import BUSINESS_PLAN_SECTIONS, create_prompt_business_plan_section, query_chatgpt
+
+BUSINESS_PLAN_SYSTEM_PROMPT = "You write clear, specific business plans for early-stage founders."
+
+
+def history_fingerprint(conversation_history: List[Dict[str, str]]) -> str:
+    """Stable hash of a conversation, used to tell whether a cached section is still current."""
+    encoded = json.dumps(conversation_history, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class BusinessPlanGenerator:
+    """
+    Generates a business plan one section per request, with all sections
+    requested concurrently, and merges them in a fixed order.
+
+    Wall-clock time is that of the slowest section rather than one long
+    completion. Each generated section is cached per conversation together with
+    the fingerprint of the conversation it was written from, so a section is
+    only regenerated when its inputs change or when it is explicitly requested.
+
+    Args:
+        complete (Callable): `complete(prompt) -> str`; defaults to `query_chatgpt`
+            with a business-plan system prompt.
+        sections (Sequence[str]): Section titles in document order.
+        max_workers (int): Maximum number of section requests in flight at once.
+        max_cached (int): Maximum number of conversations whose sections are cached.
+        context (Callable): `context(section, history) -> history` selecting the turns
+            a section is written from (and fingerprinted on); defaults to the whole history.
+    """
+
+    def __init__(self,
+                 complete: Callable[[str], str] = None,
+                 sections: Sequence[str] = BUSINESS_PLAN_SECTIONS,
+                 max_workers: int = 5,
+                 max_cached: int = 256,
+                 context: Callable[[str, List[Dict[str, str]]], List[Dict[str, str]]] = None):
+        self.complete = complete or (lambda prompt: query_chatgpt(prompt, system_prompt=BUSINESS_PLAN_SYSTEM_PROMPT))
+        self.sections = list(sections)
+        self.max_cached = max_cached
+        self.context = context or (lambda section, history: history)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='plan-sections')
+        # conversation_id -> {section: (fingerprint, text)}
+        self._cache: "OrderedDict[str, Dict[str, Tuple[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generated_sections = 0
+        self.reused_sections = 0
+
+    def generate_sections(self, conversation_id: Optional[str], conversation_history: List[Dict[str, str]],
+                          regenerate: Iterable[str] = ()) -> Dict[str, str]:
+        """
+        Generate (or reuse) every section of the plan.
+
+        Args:
+            conversation_id (str): Key the sections are cached under; None disables caching.
+            conversation_history (List[Dict[str, str]]): The interview so far.
+            regenerate (Iterable[str]): Sections to generate again even if cached.
+
+        Returns:
+            Dict[str, str]: Section title -> text, in document order.
+        """
+        regenerate = set(regenerate)
+        with self._lock:
+            cached = dict(self._cache.get(conversation_id, {})) if conversation_id is not None else {}
+
+        results: Dict[str, str] = {}
+        pending = {}
+        for section in self.sections:
+            history = self.context(section, conversation_history)
+            fingerprint = history_fingerprint(history)
+            entry = cached.get(section)
+            if entry is not None and entry[0] == fingerprint and section not in regenerate:
+                results[section] = entry[1]
+                continue
+            prompt = create_prompt_business_plan_section(section, history)
+            pending[section] = (fingerprint, self._executor.submit(self._generate_section, section, prompt))
+
+        for section, (fingerprint, future) in pending.items():
+            results[section] = future.result()
+            cached[section] = (fingerprint, results[section])
+
+        with self._lock:
+            self.generated_sections += len(pending)
+            self.reused_sections += len(self.sections) - len(pending)
+            if conversation_id is not None:
+                self._cache[conversation_id] = cached
+                self._cache.move_to_end(conversation_id)
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+
+        if pending:
+            logging.info(f"Generated {len(pending)} of {len(self.sections)} business plan sections")
+        return {section: results[section] for section in self.sections}
+
+    def generate(self, conversation_id: Optional[str], conversation_history: List[Dict[str, str]],
+                 regenerate: Iterable[str] = ()) -> str:
+        """
+        Generate the full business plan text. See `generate_sections`.
+
+        Returns:
+            str: The sections merged in document order, each under its title.
+        """
+        with stage('business_plan'):
+            sections = self.generate_sections(conversation_id, conversation_history, regenerate)
+        return merge_sections(sections)
+
+    def invalidate(self, conversation_id: str, section: str = None) -> None:
+        """Drop one cached section of a conversation, or all of them."""
+        with self._lock:
+            if section is None:
+                self._cache.pop(conversation_id, None)
+            elif conversation_id in self._cache:
+                self._cache[conversation_id].pop(section, None)
+
+    def _generate_section(self, section: str, prompt: str) -> str:
+        with stage('business_plan_section'):
+            return self.complete(prompt).strip()
+
+
+class InterviewSectionContext:
+    """
+    `context` for `BusinessPlanGenerator` that writes each section from the
+    interview exchanges relevant to it (see `InterviewTracker.section_turns`),
+    so a new turn only regenerates the sections it is about. A section nothing
+    was credited to is written from the founder's first message.
+
+    Args:
+        tracker (InterviewTracker): Credits answers to sections; no model calls are made.
+    """
+
+    def __init__(self, tracker: InterviewTracker):
+        self.tracker = tracker
+        # Split of the last conversation seen, reused for its remaining sections
+        self._last: Tuple[str, Dict[str, List[Dict[str, str]]]] = ('', {})
+        self._lock = threading.Lock()
+
+    def __call__(self, section: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        fingerprint = history_fingerprint(history)
+        with self._lock:
+            key, turns = self._last
+        if key != fingerprint:
+            turns = self.tracker.section_turns(history)
+            with self._lock:
+                self._last = (fingerprint, turns)
+        return turns.get(section) or [turn for turn in history if turn['role'] == 'user'][:1]
+
+
+def merge_sections(sections: Dict[str, str]) -> str:
+    """Join generated sections, in the order given, into one plan."""
+    return "\n\n".join(f"{title}\n{text}" for title, text in sections.items())
+
+
+_generator: Optional[BusinessPlanGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def create_section_context() -> Optional[Callable[[str, List[Dict[str, str]]], List[Dict[str, str]]]]:
+    """
+    Return the section `context` selected by BUSINESS_PLAN_SECTION_CONTEXT:
+    None for "history" (the default), which writes every section from the whole
+    conversation, or an `InterviewSectionContext` for "interview". The
+    interactive generator and the offline batch (see batch.py) both use it, so
+    they build the same prompts.
+    """
+    if os.getenv('BUSINESS_PLAN_SECTION_CONTEXT', 'history').lower() == 'interview':
+        return InterviewSectionContext(create_interview_tracker())
+    return None
+
+
+def get_business_plan_generator() -> BusinessPlanGenerator:
+    """
+    Return the process-wide business plan generator, created on first use with
+    BUSINESS_PLAN_WORKERS concurrent section requests and the section context
+    selected by BUSINESS_PLAN_SECTION_CONTEXT.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = BusinessPlanGenerator(max_workers=int(os.getenv('BUSINESS_PLAN_WORKERS', '5')),
+                                               context=create_section_context())
+        return _generator
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
+    import openai
+
+# Process-wide API clients, built once on first use and shared by every request
+# so keep-alive connections and credentials are reused. The SDKs are imported
+# by the factories, so importing this module (and everything that depends on
+# it) stays cheap on a cold start.
+_clients = {}
+_admitted_clients = {}
+_lock = threading.Lock()
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', '20'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '30'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+# Retries are done by the admission layer (admission.py), which honours Retry-After
+# and a per-request budget; SDK retries would multiply them.
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '0'))
+GCS_POOL_SIZE = int(os.getenv('GCS_POOL_SIZE', '10'))
+TWILIO_TIMEOUT = float(os.getenv('TWILIO_TIMEOUT', '10'))
+
+
+def _get_or_create(name: str, factory):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = factory()
+            _clients[name] = client
+            logging.info(f"Created shared {name} client")
+        return client
+
+
+def _openai_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY)
+
+
+def _openai_timeout() -> "httpx.Timeout":
+    import httpx
+
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def _admitted(name: str, client, is_async: bool):
+    """Return `client` wrapped in the shared admission controller, reusing the wrapper."""
+    from admission import AdmittedClient, get_admission_controller
+
+    wrapper = _admitted_clients.get(name)
+    if wrapper is None or wrapper.client is not client:
+        wrapper = AdmittedClient(client, get_admission_controller(), is_async=is_async)
+        _admitted_clients[name] = wrapper
+    return wrapper
+
+
+def get_openai_client() -> "openai.OpenAI":
+    """
+    Return the shared synchronous OpenAI client.
+
+    Every API call goes through the shared admission controller (rate limits,
+    retries and circuit breaker).
+
+    Returns:
+        openai.OpenAI: A client backed by a pooled keep-alive HTTP connection pool.
+    """
+    def factory():
+        import openai
+
+        return openai.OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=_openai_limits(), timeout=_openai_timeout()),
+        )
+
+    return _admitted('openai', _get_or_create('openai', factory), is_async=False)
+
+
+def get_async_openai_client() -> "openai.AsyncOpenAI":
+    """
+    Return the shared AsyncOpenAI client.
+
+    The underlying connection pool belongs to the event loop that first uses it,
+    so this is meant for a server running a single event loop per process.
+
+    Returns:
+        openai.AsyncOpenAI: A client backed by a pooled keep-alive HTTP connection pool.
+    """
+    def factory():
+        import openai
+
+        return openai.AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_openai_limits(), timeout=_openai_timeout()),
+        )
+
+    return _admitted('async_openai', _get_or_create('async_openai', factory), is_async=True)
+
+
+def get_storage_client():
+    """
+    Return the shared Google Cloud Storage client.
+
+    Credentials are resolved once and requests go through one authorized session
+    whose connection pool holds up to GCS_POOL_SIZE connections.
+
+    Returns:
+        google.cloud.storage.Client: The storage client.
+    """
+    def factory():
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        from requests.adapters import HTTPAdapter
+
+        credentials, project = google.auth.default(
+            scopes=['https://www.googleapis.com/auth/devstorage.read_write'])
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE)
+        session.mount('https://', adapter)
+        return storage.Client(project=project, credentials=credentials, _http=session)
+
+    return _get_or_create('storage', factory)
+
+
+def get_twilio_client():
+    """
+    Return the shared Twilio REST client, reusing pooled HTTP connections.
+
+    Returns:
+        twilio.rest.Client: The Twilio client.
+    """
+    def factory():
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+
+        return Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'),
+                      http_client=TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT))
+
+    return _get_or_create('twilio', factory)
+
+
+def set_client(name: str, client) -> None:
+    """
+    Register a client instance under `name` ("openai", "async_openai", "storage"
+    or "twilio"), e.g. to substitute a fake in tests and benchmarks.
+    """
+    with _lock:
+        _clients[name] = client
+
+
+def reset_clients() -> None:
+    """Forget all shared clients so they are rebuilt on next use."""
+    with _lock:
+        _clients.clear()
+        _admitted_clients.clear()
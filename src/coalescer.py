@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List
+
+from conversation_store import _transaction
+
+
+def combine_messages(messages: List[str]) -> str:
+    """Join messages sent in quick succession into a single assistant turn."""
+    return "\n".join(message.strip() for message in messages if message and message.strip())
+
+
+class ConversationLeases:
+    """
+    Per-conversation leases kept in SQLite, so that worker processes sharing the
+    conversation database handle one turn of a conversation at a time between
+    them. The coalescers only serialize turns within a process; they take a
+    lease around each turn.
+
+    A lease that its holder never released (e.g. its worker died) expires after
+    `ttl` seconds, which must exceed the longest turn.
+
+    Args:
+        db_path (str): Path to the SQLite database file; normally the conversation database.
+        ttl (float): Seconds a lease is held at most.
+        poll_interval (float): Seconds between attempts to take a lease held by another worker.
+    """
+
+    def __init__(self, db_path: str = 'conversations.db', ttl: float = 300.0, poll_interval: float = 0.1):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self.waits = 0
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self) -> None:
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS conversation_leases (
+                conversation_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def try_acquire(self, conversation_id: str, owner: str) -> bool:
+        """Take the conversation's lease for `owner` if it is free or expired."""
+        now = time.time()
+        conn = self._connection()
+        with _transaction(conn):
+            row = conn.execute('SELECT owner, expires_at FROM conversation_leases WHERE conversation_id = ?',
+                               (conversation_id,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                """
+                INSERT INTO conversation_leases (conversation_id, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(conversation_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                """,
+                (conversation_id, owner, now + self.ttl),
+            )
+        return True
+
+    def release(self, conversation_id: str, owner: str) -> None:
+        self._connection().execute('DELETE FROM conversation_leases WHERE conversation_id = ? AND owner = ?',
+                                   (conversation_id, owner))
+
+    @contextmanager
+    def hold(self, conversation_id: str) -> Iterator[None]:
+        """Hold the conversation's lease for the duration of the block, waiting for it if needed."""
+        owner = uuid.uuid4().hex
+        if not self.try_acquire(conversation_id, owner):
+            self.waits += 1
+            while not self.try_acquire(conversation_id, owner):
+                time.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            self._release_quietly(conversation_id, owner)
+
+    @asynccontextmanager
+    async def hold_async(self, conversation_id: str) -> AsyncIterator[None]:
+        """Async variant of `hold`; SQLite calls run in worker threads."""
+        owner = uuid.uuid4().hex
+        if not await asyncio.to_thread(self.try_acquire, conversation_id, owner):
+            self.waits += 1
+            while not await asyncio.to_thread(self.try_acquire, conversation_id, owner):
+                await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self._release_quietly, conversation_id, owner)
+
+    def _release_quietly(self, conversation_id: str, owner: str) -> None:
+        try:
+            self.release(conversation_id, owner)
+        except sqlite3.Error as e:
+            # The lease expires on its own
+            logging.warning(f"Could not release the lease on {conversation_id}: {e}")
+
+
+def create_conversation_leases() -> ConversationLeases:
+    """
+    Build the conversation leases from the environment: kept in the conversation
+    database (CONVERSATION_DB_PATH), held for at most CONVERSATION_LEASE_SECONDS.
+    """
+    return ConversationLeases(os.getenv('CONVERSATION_DB_PATH', 'conversations.db'),
+                              ttl=float(os.getenv('CONVERSATION_LEASE_SECONDS', '300')))
+
+
+class _ConversationState:
+    def __init__(self):
+        self.pending: List[str] = []
+        self.busy = False
+        self.first_arrival = 0.0
+        self.last_arrival = 0.0
+
+
+class MessageCoalescer:
+    """
+    Serializes message handling per conversation and merges bursts of messages
+    into a single assistant turn.
+
+    The first message for an idle conversation makes its caller the leader: it
+    waits until no new message has arrived for `debounce` seconds (or `max_wait`
+    has passed since the first one), then handles everything collected so far as
+    one turn. Messages arriving while the leader is waiting or generating are
+    queued and folded into the leader's next turn; their callers return at once
+    with no replies. This keeps a single active run per thread and removes the
+    lost-update race on the conversation history within a process; with
+    `leases`, each turn also holds the conversation's lease, which extends both
+    to every worker process sharing the database.
+
+    Args:
+        handler (Callable): `handler(conversation_id, combined_message) -> str`.
+        debounce (float): Quiet period in seconds that closes a burst.
+        max_wait (float): Upper bound in seconds on how long a burst is collected.
+        clock (Callable): Monotonic clock, injectable for tests.
+        leases (ConversationLeases): Serializes turns across processes; None serializes
+            them within this process only.
+    """
+
+    def __init__(self,
+                 handler: Callable[[str, str], str],
+                 debounce: float = 1.5,
+                 max_wait: float = 4.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 leases: ConversationLeases = None):
+        self.handler = handler
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.clock = clock
+        self.leases = leases
+        self._states: Dict[str, _ConversationState] = {}
+        self._cond = threading.Condition()
+        self.coalesced_messages = 0
+
+    def submit(self, conversation_id: str, message: str) -> List[str]:
+        """
+        Queue a message and, if this caller becomes the conversation's leader,
+        generate the replies.
+
+        Args:
+            conversation_id (str): The conversation key (the sender's number).
+            message (str): The user's message text.
+
+        Returns:
+            List[str]: The replies generated by this caller, one per turn; empty if
+                the message was handed to a leader that is already active.
+        """
+        with self._cond:
+            state = self._states.setdefault(conversation_id, _ConversationState())
+            now = self.clock()
+            if not state.pending:
+                state.first_arrival = now
+            state.pending.append(message)
+            state.last_arrival = now
+            if state.busy:
+                self._cond.notify_all()
+                return []
+            state.busy = True
+
+        replies = []
+        try:
+            while True:
+                batch = self._collect(state)
+                if len(batch) > 1:
+                    logging.info(f"Coalesced {len(batch)} messages from {conversation_id} into one turn")
+                replies.append(self._handle(conversation_id, combine_messages(batch)))
+                with self._cond:
+                    # Release leadership in the same critical section as the
+                    # check, so a message arriving now starts a new leader.
+                    if not state.pending:
+                        self._release(conversation_id, state)
+                        return replies
+        except Exception:
+            with self._cond:
+                # Drop the queued messages together with the failed turn.
+                self._release(conversation_id, state)
+            raise
+
+    def _handle(self, conversation_id: str, message: str) -> str:
+        if self.leases is None:
+            return self.handler(conversation_id, message)
+        with self.leases.hold(conversation_id):
+            return self.handler(conversation_id, message)
+
+    def _release(self, conversation_id: str, state: _ConversationState) -> None:
+        state.pending = []
+        state.busy = False
+        self._states.pop(conversation_id, None)
+
+    def _collect(self, state: _ConversationState) -> List[str]:
+        with self._cond:
+            while True:
+                now = self.clock()
+                wait = min(state.last_arrival + self.debounce, state.first_arrival + self.max_wait) - now
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            batch, state.pending = state.pending, []
+            self.coalesced_messages += len(batch) - 1
+            return batch
+
+
+class AsyncMessageCoalescer:
+    """
+    asyncio version of `MessageCoalescer` for the ASGI server.
+
+    Args:
+        handler (Callable): `await handler(conversation_id, combined_message) -> str`.
+        debounce (float): Quiet period in seconds that closes a burst.
+        max_wait (float): Upper bound in seconds on how long a burst is collected.
+        leases (ConversationLeases): Serializes turns across processes; None serializes
+            them within this process only.
+    """
+
+    def __init__(self,
+                 handler: Callable[[str, str], Awaitable[str]],
+                 debounce: float = 1.5,
+                 max_wait: float = 4.0,
+                 leases: ConversationLeases = None):
+        self.handler = handler
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.leases = leases
+        self._states: Dict[str, _ConversationState] = {}
+        self._arrivals: Dict[str, asyncio.Event] = {}
+        self.coalesced_messages = 0
+
+    async def submit(self, conversation_id: str, message: str) -> List[str]:
+        """
+        Queue a message and, if this caller becomes the conversation's leader,
+        generate the replies. See `MessageCoalescer.submit`.
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.setdefault(conversation_id, _ConversationState())
+        now = loop.time()
+        if not state.pending:
+            state.first_arrival = now
+        state.pending.append(message)
+        state.last_arrival = now
+        if state.busy:
+            self._arrivals[conversation_id].set()
+            return []
+        state.busy = True
+        self._arrivals[conversation_id] = asyncio.Event()
+
+        replies = []
+        try:
+            while True:
+                batch = await self._collect(conversation_id, state)
+                if len(batch) > 1:
+                    logging.info(f"Coalesced {len(batch)} messages from {conversation_id} into one turn")
+                replies.append(await self._handle(conversation_id, combine_messages(batch)))
+                if not state.pending:
+                    return replies
+        finally:
+            # No await between the check above and this block, so no message
+            # can be queued and then dropped here on success.
+            state.pending = []
+            state.busy = False
+            self._states.pop(conversation_id, None)
+            self._arrivals.pop(conversation_id, None)
+
+    async def _handle(self, conversation_id: str, message: str) -> str:
+        if self.leases is None:
+            return await self.handler(conversation_id, message)
+        async with self.leases.hold_async(conversation_id):
+            return await self.handler(conversation_id, message)
+
+    async def _collect(self, conversation_id: str, state: _ConversationState) -> List[str]:
+        loop = asyncio.get_running_loop()
+        arrival = self._arrivals[conversation_id]
+        while True:
+            wait = min(state.last_arrival + self.debounce, state.first_arrival + self.max_wait) - loop.time()
+            if wait <= 0:
+                break
+            arrival.clear()
+            try:
+                await asyncio.wait_for(arrival.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        batch, state.pending = state.pending, []
+        self.coalesced_messages += len(batch) - 1
+        return batch
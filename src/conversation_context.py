@@ -0,0 +1,162 @@
+import logging
+import os
+from typing import Callable, Dict, List, NamedTuple
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Uses tiktoken when it is installed and falls back to the ~4 characters per
+    token rule of thumb otherwise.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated token count.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def turn_tokens(turn: Dict[str, str]) -> int:
+    """Estimated tokens for one formatted history line ("Role: content")."""
+    return estimate_tokens(turn['content']) + 4
+
+
+class PromptContext(NamedTuple):
+    """
+    The history to include in the next prompt.
+
+    Attributes:
+        summary (str): Running summary of turns older than the verbatim window ('' if none).
+        recent_turns (List[Dict[str, str]]): Turns to include word for word, oldest first.
+        tokens (int): Estimated tokens used by the summary and recent turns.
+    """
+    summary: str
+    recent_turns: List[Dict[str, str]]
+    tokens: int
+
+
+class ContextWindow:
+    """
+    Caps the conversation history put into each prompt at a token budget.
+
+    The last `keep_last_turns` turns are kept word for word. Older turns are folded
+    into a running summary that is stored alongside the conversation and only
+    recomputed once `summary_batch_turns` new turns have overflowed the window, so
+    most messages do not pay for a summarization call.
+
+    Args:
+        store: Conversation store providing `load_summary` / `save_summary`.
+        summarizer (Callable): `summarizer(previous_summary, turns) -> str` folding
+            turns into the running summary.
+        max_context_tokens (int): Budget for the summary plus the recent turns.
+        keep_last_turns (int): Number of most recent turns always kept verbatim.
+        summary_batch_turns (int): Overflowing turns to accumulate before re-summarizing.
+        skip_history_with_thread (bool): Omit history entirely when an Assistants
+            thread already holds the previous turns.
+    """
+
+    def __init__(self,
+                 store,
+                 summarizer: Callable[[str, List[Dict[str, str]]], str],
+                 max_context_tokens: int = 1500,
+                 keep_last_turns: int = 6,
+                 summary_batch_turns: int = 4,
+                 skip_history_with_thread: bool = False):
+        self.store = store
+        self.summarizer = summarizer
+        self.max_context_tokens = max_context_tokens
+        self.keep_last_turns = keep_last_turns
+        self.summary_batch_turns = summary_batch_turns
+        self.skip_history_with_thread = skip_history_with_thread
+
+    def build(self, conversation_id: str, history: List[Dict[str, str]], thread_id: str = None) -> PromptContext:
+        """
+        Select the summary and recent turns to include in the next prompt.
+
+        Args:
+            conversation_id (str): The conversation key, used to load and save the summary.
+            history (List[Dict[str, str]]): All previous turns, oldest first, excluding
+                the message being answered.
+            thread_id (str): The conversation's Assistants thread, if any.
+
+        Returns:
+            PromptContext: The bounded context.
+        """
+        if self.skip_history_with_thread and thread_id is not None:
+            return PromptContext('', [], 0)
+
+        if conversation_id is None:
+            summarized_turns, summary = 0, ''
+        else:
+            summarized_turns, summary = self.store.load_summary(conversation_id)
+        summarized_turns = min(summarized_turns, len(history))
+        overflow = len(history) - summarized_turns - self.keep_last_turns
+
+        if overflow >= self.summary_batch_turns:
+            fold_until = len(history) - self.keep_last_turns
+            try:
+                summary = self.summarizer(summary, history[summarized_turns:fold_until])
+                summarized_turns = fold_until
+                if conversation_id is not None:
+                    self.store.save_summary(conversation_id, summarized_turns, summary)
+                logging.info(f"Folded turns up to {fold_until} into the summary for {conversation_id}")
+            except Exception as e:
+                logging.error(f"Failed to update conversation summary: {e}")
+
+        return self._fit(summary, history[summarized_turns:])
+
+    def _fit(self, summary: str, candidates: List[Dict[str, str]]) -> PromptContext:
+        budget = self.max_context_tokens
+        summary_tokens = estimate_tokens(summary)
+        if summary_tokens > budget // 2:
+            # Keep at most half the budget for the summary, trimming its oldest part
+            summary = summary[-(budget // 2) * 4:]
+            summary_tokens = estimate_tokens(summary)
+
+        used = summary_tokens
+        recent: List[Dict[str, str]] = []
+        for turn in reversed(candidates):
+            cost = turn_tokens(turn)
+            if used + cost > budget:
+                break
+            recent.append(turn)
+            used += cost
+        recent.reverse()
+        return PromptContext(summary, recent, used)
+
+
+def create_context_window(store, summarizer: Callable[[str, List[Dict[str, str]]], str]) -> ContextWindow:
+    """
+    Build a ContextWindow configured from environment variables.
+
+    Args:
+        store: Conversation store providing `load_summary` / `save_summary`.
+        summarizer (Callable): Function folding turns into the running summary.
+
+    Returns:
+        ContextWindow: The configured context window.
+    """
+    return ContextWindow(
+        store,
+        summarizer,
+        max_context_tokens=int(os.getenv('CONTEXT_MAX_TOKENS', '1500')),
+        keep_last_turns=int(os.getenv('CONTEXT_KEEP_TURNS', '6')),
+        summary_batch_turns=int(os.getenv('CONTEXT_SUMMARY_BATCH', '4')),
+        skip_history_with_thread=os.getenv('CONTEXT_SKIP_HISTORY_WITH_THREAD', 'false').lower() == 'true',
+    )
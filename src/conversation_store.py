@@ -0,0 +1,433 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class Conversation(NamedTuple):
+    """
+    Stored state of one WhatsApp conversation.
+
+    Attributes:
+        history (List[Dict[str, str]]): Past turns as {'role', 'content'} dicts, oldest first.
+        thread_id (Optional[str]): The Assistants thread used by this conversation, if any.
+        version (int): Incremented on every write; used to validate cached copies.
+    """
+    history: List[Dict[str, str]]
+    thread_id: Optional[str]
+    version: int = 0
+
+
+class SQLiteConversationStore:
+    """
+    Durable conversation store backed by SQLite in WAL mode.
+
+    Turns are stored one row each, so recording an exchange appends two rows
+    instead of rewriting the whole history. WAL mode lets several gunicorn
+    workers or containers on a shared volume read while one writes.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+    """
+
+    def __init__(self, db_path: str = 'conversations.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self) -> None:
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                thread_id TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                expired_thread_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns (conversation_id, id);
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at);
+            CREATE TABLE IF NOT EXISTS summaries (
+                conversation_id TEXT PRIMARY KEY,
+                summarized_turns INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(conversations)')]
+        if 'expired_thread_id' not in columns:
+            # Databases created before idle threads were tombstoned
+            conn.execute('ALTER TABLE conversations ADD COLUMN expired_thread_id TEXT')
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        """Return the current version of a conversation, or None if it does not exist."""
+        row = self._connection().execute(
+            'SELECT version FROM conversations WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, conversation_id: str) -> Conversation:
+        """
+        Load a conversation, returning an empty one if it does not exist yet.
+
+        Args:
+            conversation_id (str): The conversation key (the sender's number).
+
+        Returns:
+            Conversation: The stored history and thread ID.
+        """
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT thread_id, version FROM conversations WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return Conversation([], None, 0)
+        turns = conn.execute(
+            'SELECT role, content FROM turns WHERE conversation_id = ? ORDER BY id', (conversation_id,)
+        ).fetchall()
+        history = [{'role': role, 'content': content} for role, content in turns]
+        return Conversation(history, row[0], row[1])
+
+    def append_turns(self, conversation_id: str, turns: List[Dict[str, str]], thread_id: str = None) -> int:
+        """
+        Append turns to a conversation and optionally record its thread ID, in one transaction.
+
+        Args:
+            conversation_id (str): The conversation key.
+            turns (List[Dict[str, str]]): New turns to append, oldest first.
+            thread_id (str): Thread ID to store; the existing one is kept if None, or if
+                it is the thread `clear_thread` last detached (a run that was in flight
+                while its thread was deleted).
+
+        Returns:
+            int: The conversation's new version.
+        """
+        conn = self._connection()
+        now = time.time()
+        with _transaction(conn):
+            conn.execute(
+                """
+                INSERT INTO conversations (conversation_id, thread_id, version, updated_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                    thread_id = CASE WHEN excluded.thread_id = conversations.expired_thread_id
+                                     THEN conversations.thread_id
+                                     ELSE COALESCE(excluded.thread_id, conversations.thread_id) END,
+                    version = conversations.version + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (conversation_id, thread_id, now),
+            )
+            conn.executemany(
+                'INSERT INTO turns (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)',
+                [(conversation_id, turn['role'], turn['content'], now) for turn in turns],
+            )
+            return conn.execute(
+                'SELECT version FROM conversations WHERE conversation_id = ?', (conversation_id,)
+            ).fetchone()[0]
+
+    def load_summary(self, conversation_id: str) -> Tuple[int, str]:
+        """
+        Load the running summary of a conversation's older turns.
+
+        Returns:
+            tuple: (number of leading turns covered by the summary, summary text)
+        """
+        row = self._connection().execute(
+            'SELECT summarized_turns, summary FROM summaries WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, '')
+
+    def save_summary(self, conversation_id: str, summarized_turns: int, summary: str) -> None:
+        """
+        Store a running summary, unless a summary covering more turns already exists.
+
+        Args:
+            conversation_id (str): The conversation key.
+            summarized_turns (int): Number of leading turns the summary covers.
+            summary (str): The summary text.
+        """
+        self._connection().execute(
+            """
+            INSERT INTO summaries (conversation_id, summarized_turns, summary, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (conversation_id) DO UPDATE SET
+                summarized_turns = excluded.summarized_turns,
+                summary = excluded.summary,
+                updated_at = excluded.updated_at
+            WHERE excluded.summarized_turns > summaries.summarized_turns
+            """,
+            (conversation_id, summarized_turns, summary, time.time()),
+        )
+
+    def iter_conversations(self, page_size: int = 200) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+        """
+        Stream every stored conversation, ordered by conversation ID.
+
+        Conversations are read a page at a time, so memory use does not grow
+        with the size of the store.
+
+        Args:
+            page_size (int): Conversations read per query.
+
+        Yields:
+            Tuple[str, List[Dict[str, str]]]: (conversation_id, history) pairs.
+        """
+        conn = self._connection()
+        after = ''
+        while True:
+            ids = [row[0] for row in conn.execute(
+                'SELECT conversation_id FROM conversations WHERE conversation_id > ? ORDER BY conversation_id LIMIT ?',
+                (after, page_size),
+            )]
+            if not ids:
+                return
+            histories: Dict[str, List[Dict[str, str]]] = {conversation_id: [] for conversation_id in ids}
+            rows = conn.execute(
+                f"SELECT conversation_id, role, content FROM turns WHERE conversation_id IN ({','.join('?' * len(ids))})"
+                ' ORDER BY conversation_id, id',
+                ids,
+            )
+            for conversation_id, role, content in rows:
+                histories[conversation_id].append({'role': role, 'content': content})
+            for conversation_id in ids:
+                yield conversation_id, histories[conversation_id]
+            after = ids[-1]
+
+    def idle_threads(self, idle_seconds: float, limit: int = 100) -> List[Tuple[str, str, int]]:
+        """
+        Find conversations whose thread has not been used for `idle_seconds`.
+
+        Returns:
+            List[Tuple[str, str, int]]: (conversation_id, thread_id, version) triples, least
+            recently used first.
+        """
+        return self._connection().execute(
+            """
+            SELECT conversation_id, thread_id, version FROM conversations
+            WHERE thread_id IS NOT NULL AND updated_at < ?
+            ORDER BY updated_at LIMIT ?
+            """,
+            (time.time() - idle_seconds, limit),
+        ).fetchall()
+
+    def clear_thread(self, conversation_id: str, thread_id: str, version: int = None) -> bool:
+        """
+        Detach a thread from a conversation, if it is still the conversation's thread
+        and, when `version` is given, nothing was written since that version. The
+        history is kept; the next message starts a new thread, and `append_turns`
+        will not attach the detached thread again.
+
+        Returns:
+            bool: Whether the thread was detached.
+        """
+        cursor = self._connection().execute(
+            """
+            UPDATE conversations SET thread_id = NULL, expired_thread_id = thread_id, version = version + 1
+            WHERE conversation_id = ? AND thread_id = ? AND (? IS NULL OR version = ?)
+            """,
+            (conversation_id, thread_id, version, version),
+        )
+        return cursor.rowcount > 0
+
+    def clear(self, conversation_id: str) -> None:
+        """Delete all state for a conversation."""
+        conn = self._connection()
+        with _transaction(conn):
+            conn.execute('DELETE FROM turns WHERE conversation_id = ?', (conversation_id,))
+            conn.execute('DELETE FROM summaries WHERE conversation_id = ?', (conversation_id,))
+            conn.execute('DELETE FROM conversations WHERE conversation_id = ?', (conversation_id,))
+
+
+class _transaction:
+    """Context manager running a block inside BEGIN IMMEDIATE / COMMIT."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class CachedConversationStore:
+    """
+    In-process LRU tier with TTL eviction in front of a durable conversation store.
+
+    Cached conversations and summaries are validated against the backend's
+    version number on every load (a single indexed row lookup), so several
+    workers sharing one database never serve a stale history or summary.
+
+    Args:
+        backend: The durable store (e.g. SQLiteConversationStore).
+        max_entries (int): Maximum number of conversations kept in memory.
+        ttl (float): Seconds a cached conversation stays valid without being used.
+    """
+
+    def __init__(self, backend, max_entries: int = 1024, ttl: float = 1800.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # conversation_id -> (conversation version, (summarized_turns, summary), cached at)
+        self._summaries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, conversation_id: str) -> Conversation:
+        """
+        Load a conversation, serving it from memory when the cached copy is current.
+
+        Returns a copy of the history, so callers may append to it freely.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(conversation_id)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._cache[conversation_id]
+                entry = None
+
+        if entry is not None and self.backend.version(conversation_id) == entry[0].version:
+            with self._lock:
+                self.hits += 1
+                if conversation_id in self._cache:
+                    self._cache.move_to_end(conversation_id)
+                    self._cache[conversation_id] = (entry[0], now)
+            cached = entry[0]
+            return Conversation(list(cached.history), cached.thread_id, cached.version)
+
+        conversation = self.backend.load(conversation_id)
+        with self._lock:
+            self.misses += 1
+            self._put(conversation_id, conversation, now)
+        return Conversation(list(conversation.history), conversation.thread_id, conversation.version)
+
+    def append_turns(self, conversation_id: str, turns: List[Dict[str, str]], thread_id: str = None) -> int:
+        """Append turns through to the backend and update the cached copy in place."""
+        version = self.backend.append_turns(conversation_id, turns, thread_id=thread_id)
+        with self._lock:
+            entry = self._cache.get(conversation_id)
+            if (entry is not None and entry[0].version == version - 1
+                    and thread_id in (None, entry[0].thread_id)):
+                cached = entry[0]
+                updated = Conversation(cached.history + list(turns), cached.thread_id, version)
+                self._put(conversation_id, updated, time.monotonic())
+            elif entry is not None:
+                # Another worker wrote in between, or the backend may have refused
+                # the new thread (see `SQLiteConversationStore.append_turns`);
+                # reload on next access.
+                del self._cache[conversation_id]
+            summary = self._summaries.get(conversation_id)
+            if summary is not None and summary[0] == version - 1:
+                # New turns do not change the summary of the older ones
+                self._summaries[conversation_id] = (version,) + summary[1:]
+        return version
+
+    def load_summary(self, conversation_id: str) -> Tuple[int, str]:
+        """
+        Load the running summary, serving it from memory while the conversation
+        has not been written to since it was cached.
+        """
+        now = time.monotonic()
+        version = self.backend.version(conversation_id)
+        with self._lock:
+            entry = self._summaries.get(conversation_id)
+            if entry is not None and entry[0] == version and now - entry[2] <= self.ttl:
+                self._summaries.move_to_end(conversation_id)
+                return entry[1]
+        summary = self.backend.load_summary(conversation_id)
+        self._put_summary(conversation_id, version, summary, now)
+        return summary
+
+    def save_summary(self, conversation_id: str, summarized_turns: int, summary: str) -> None:
+        # Read before writing, so turns appended meanwhile by another worker invalidate the entry
+        version = self.backend.version(conversation_id)
+        self.backend.save_summary(conversation_id, summarized_turns, summary)
+        self._put_summary(conversation_id, version, (summarized_turns, summary), time.monotonic())
+
+    def iter_conversations(self, page_size: int = 200) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+        # Read straight from the backend, so a bulk scan does not evict the live working set
+        return self.backend.iter_conversations(page_size)
+
+    def idle_threads(self, idle_seconds: float, limit: int = 100) -> List[Tuple[str, str, int]]:
+        return self.backend.idle_threads(idle_seconds, limit)
+
+    def clear_thread(self, conversation_id: str, thread_id: str, version: int = None) -> bool:
+        cleared = self.backend.clear_thread(conversation_id, thread_id, version)
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+        return cleared
+
+    def clear(self, conversation_id: str) -> None:
+        self.backend.clear(conversation_id)
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+            self._summaries.pop(conversation_id, None)
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        return self.backend.version(conversation_id)
+
+    def stats(self) -> dict:
+        """Size and hit/miss counters of the in-memory tier."""
+        with self._lock:
+            return {'entries': len(self._cache), 'summaries': len(self._summaries),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def _put(self, conversation_id: str, conversation: Conversation, now: float) -> None:
+        self._cache[conversation_id] = (conversation, now)
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _put_summary(self, conversation_id: str, version: Optional[int], summary: Tuple[int, str],
+                     now: float) -> None:
+        with self._lock:
+            self._summaries[conversation_id] = (version, summary, now)
+            self._summaries.move_to_end(conversation_id)
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+
+
+def create_conversation_store(db_path: str = None):
+    """
+    Build the default conversation store: an LRU/TTL cache over SQLite.
+
+    Args:
+        db_path (str): Database path; defaults to the CONVERSATION_DB_PATH env var
+            or "conversations.db".
+
+    Returns:
+        CachedConversationStore: The store.
+    """
+    db_path = db_path or os.getenv('CONVERSATION_DB_PATH', 'conversations.db')
+    backend = SQLiteConversationStore(db_path)
+    logging.info(f"Conversation store using SQLite database at {db_path}")
+    return CachedConversationStore(
+        backend,
+        max_entries=int(os.getenv('CONVERSATION_CACHE_SIZE', '1024')),
+        ttl=float(os.getenv('CONVERSATION_CACHE_TTL', '1800')),
+    )
@@ -0,0 +1,255 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from admission import TokenBucket
+
+# Twilio rejects WhatsApp bodies longer than this (error 21617). Lengths are
+# counted in UTF-16 code units, so an emoji outside the BMP counts twice and
+# a message is never over the limit however Twilio counts it.
+WHATSAPP_BODY_LIMIT = 1600
+
+# Boundary strength after a piece of text; higher is a better place to split
+_PARAGRAPH, _LINE, _SENTENCE, _WORD, _NONE = 4, 3, 2, 1, 0
+
+_CODE_FENCE = re.compile(r'```.*?(?:```|$)', re.DOTALL)
+# Paragraph break, line break, or end of a sentence (terminal punctuation,
+# optionally closed by a quote or bracket, followed by spaces)
+_BOUNDARY = re.compile(r'(\n[ \t]*\n\s*)|(\n)|([.!?…]["\'”’)\]]*[ \t]+)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def text_units(text: str) -> int:
+    """Length of `text` in UTF-16 code units, the way the body limit is counted."""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def pack_message(text: str, limit: int = WHATSAPP_BODY_LIMIT, paragraph_fill: float = 0.75) -> List[str]:
+    """
+    Split a reply into as few WhatsApp messages as possible.
+
+    Messages are filled up to `limit` and only broken at a paragraph, line or
+    sentence boundary; a sentence longer than a whole message is broken between
+    words, and a word longer than that between characters (never before a
+    combining mark, joiner or emoji modifier). Fenced code blocks are only
+    broken between lines. When a message would end mid-paragraph but a
+    paragraph ended after `paragraph_fill` of the limit, it ends there instead.
+    The text is scanned once, so this runs in linear time.
+
+    Args:
+        text (str): The reply.
+        limit (int): Maximum UTF-16 code units per message.
+        paragraph_fill (float): Fraction of the limit a message must reach before it
+            may end early on a paragraph boundary.
+
+    Returns:
+        List[str]: The messages, in order; empty if `text` is blank.
+    """
+    messages: List[str] = []
+    current: List[Tuple[str, int, int]] = []
+    used = 0
+    # Index in `current` after which the last paragraph boundary falls, and the length up to it
+    paragraph_end, paragraph_used = -1, 0
+
+    def close(end: int) -> None:
+        body = ''.join(piece for piece, _, _ in current[:end]).strip()
+        if body:
+            messages.append(body)
+
+    for piece, units, level in _pieces(text, limit):
+        # Trailing whitespace is dropped if the piece ends a message
+        trimmed = units - (len(piece) - len(piece.rstrip()))
+        if current and used + trimmed > limit and paragraph_end >= 0 and paragraph_used >= paragraph_fill * limit:
+            close(paragraph_end + 1)
+            current = current[paragraph_end + 1:]
+            used -= paragraph_used
+            paragraph_end, paragraph_used = -1, 0
+        if current and used + trimmed > limit:
+            close(len(current))
+            current, used = [], 0
+            paragraph_end, paragraph_used = -1, 0
+        current.append((piece, units, level))
+        used += units
+        if level == _PARAGRAPH:
+            paragraph_end, paragraph_used = len(current) - 1, used
+    close(len(current))
+    return messages
+
+
+def _pieces(text: str, limit: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield (piece, length, boundary strength) for consecutive pieces of `text`,
+    each ending at a boundary and none longer than `limit`.
+    """
+    position = 0
+    for fence in _CODE_FENCE.finditer(text):
+        yield from _prose_pieces(text[position:fence.start()], limit)
+        for line in fence.group(0).splitlines(keepends=True):
+            yield from _fit(line, _LINE, limit)
+        position = fence.end()
+    yield from _prose_pieces(text[position:], limit)
+
+
+def _prose_pieces(text: str, limit: int) -> Iterator[Tuple[str, int, int]]:
+    position = 0
+    for match in _BOUNDARY.finditer(text):
+        level = _PARAGRAPH if match.group(1) else _LINE if match.group(2) else _SENTENCE
+        yield from _fit(text[position:match.end()], level, limit)
+        position = match.end()
+    if position < len(text):
+        yield from _fit(text[position:], _NONE, limit)
+
+
+def _fit(piece: str, level: int, limit: int) -> Iterator[Tuple[str, int, int]]:
+    units = text_units(piece)
+    if units <= limit:
+        yield piece, units, level
+        return
+    # Longer than a message: fall back to word boundaries, then to characters
+    position = 0
+    for match in _WHITESPACE.finditer(piece):
+        word = piece[position:match.end()]
+        position = match.end()
+        yield from _hard_split(word, _WORD if position < len(piece) else level, limit)
+    if position < len(piece):
+        yield from _hard_split(piece[position:], level, limit)
+
+
+def _hard_split(word: str, level: int, limit: int) -> Iterator[Tuple[str, int, int]]:
+    units = text_units(word)
+    if units <= limit:
+        yield word, units, level
+        return
+    start = 0
+    while start < len(word):
+        end, taken = start, 0
+        while end < len(word) and taken + text_units(word[end]) <= limit:
+            taken += text_units(word[end])
+            end += 1
+        # Keep a character together with the combining marks and joiners after it
+        while start + 1 < end < len(word) and _is_continuation(word[end]):
+            end -= 1
+        chunk = word[start:end]
+        yield chunk, text_units(chunk), level if end >= len(word) else _NONE
+        start = end
+
+
+def _is_continuation(char: str) -> bool:
+    code = ord(char)
+    # Combining marks, variation selectors, zero-width joiner and skin tone modifiers
+    return (0x0300 <= code <= 0x036F or 0xFE00 <= code <= 0xFE0F or code == 0x200D
+            or 0x1F3FB <= code <= 0x1F3FF)
+
+
+class DeliveryFailedError(Exception):
+    """Raised when a message could not be delivered after all retries."""
+
+
+class PacedSender:
+    """
+    Wraps a reply sender (`send(to, from_, body)`) for out-of-band delivery.
+
+    Each reply is packed into as few messages as fit the body limit. Sends are
+    paced by an account-wide rate and a minimum interval between messages to
+    the same recipient, so a long reply does not hit Twilio's throughput limits
+    or arrive out of order. Failed sends with a transient status (429 or 5xx,
+    or a connection error) are retried with jittered exponential backoff.
+
+    Args:
+        sender: The underlying sender.
+        per_second (float): Messages per second across all recipients; 0 disables the limit.
+        min_interval (float): Seconds between two messages to the same recipient.
+        max_attempts (int): Attempts per message.
+        backoff (float): Delay before the first retry, doubled for each following one.
+        limit (int): Maximum body length.
+        sleep (Callable): Sleep function, injectable for tests.
+    """
+
+    RETRYABLE_STATUSES = (429,)
+
+    def __init__(self, sender, per_second: float = 80.0, min_interval: float = 1.0, max_attempts: int = 4,
+                 backoff: float = 1.0, limit: int = WHATSAPP_BODY_LIMIT,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.sender = sender
+        self.bucket = TokenBucket(per_second * 60.0, capacity=max(1.0, per_second))
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.limit = limit
+        self.sleep = sleep
+        self._next_send: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.sent_messages = 0
+        self.retried_sends = 0
+        self.failed_sends = 0
+
+    def send(self, to: str, from_: str, body: str) -> None:
+        """
+        Deliver `body` to `to`, as several messages if it is over the limit.
+
+        Raises:
+            DeliveryFailedError: If a message still failed after all attempts; the
+                remaining messages of the reply are not sent.
+        """
+        for message in pack_message(body, self.limit):
+            self._deliver(to, from_, message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sent': self.sent_messages, 'retried': self.retried_sends, 'failed': self.failed_sends}
+
+    def _deliver(self, to: str, from_: str, body: str) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            self._pace(to)
+            try:
+                self.sender.send(to, from_, body)
+            except Exception as e:
+                if attempt == self.max_attempts or not self._retryable(e):
+                    with self._lock:
+                        self.failed_sends += 1
+                    raise DeliveryFailedError(f"Could not deliver a message to {to}: {e}") from e
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+                logging.warning(f"Send to {to} failed ({e}), retrying in {delay:.1f}s")
+                with self._lock:
+                    self.retried_sends += 1
+                self.sleep(delay)
+                continue
+            with self._lock:
+                self.sent_messages += 1
+            return
+
+    def _pace(self, to: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            start = max(now, self._next_send.get(to, 0.0))
+            self._next_send[to] = start + self.min_interval
+            # Recipients whose interval has passed no longer constrain anything
+            if len(self._next_send) > 10000:
+                self._next_send = {key: value for key, value in self._next_send.items() if value > now}
+        wait = max(start - now, self.bucket.reserve(1))
+        if wait > 0:
+            self.sleep(wait)
+
+    def _retryable(self, error: Exception) -> bool:
+        status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+        if status is not None:
+            return status in self.RETRYABLE_STATUSES or status >= 500
+        return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in (
+            'ConnectError', 'ReadTimeout', 'ConnectionError', 'Timeout')
+
+
+def create_paced_sender(sender) -> PacedSender:
+    """
+    Wrap `sender` with pacing and retries configured from the environment:
+    TWILIO_SENDS_PER_SECOND (default 80), DELIVERY_MIN_INTERVAL_SECONDS (default 1),
+    DELIVERY_RETRY_ATTEMPTS (default 4) and DELIVERY_RETRY_BACKOFF_SECONDS (default 1).
+    """
+    return PacedSender(sender,
+                       per_second=float(os.getenv('TWILIO_SENDS_PER_SECOND', '80')),
+                       min_interval=float(os.getenv('DELIVERY_MIN_INTERVAL_SECONDS', '1')),
+                       max_attempts=int(os.getenv('DELIVERY_RETRY_ATTEMPTS', '4')),
+                       backoff=float(os.getenv('DELIVERY_RETRY_BACKOFF_SECONDS', '1')))
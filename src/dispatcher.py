@@ -0,0 +1,244 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple
+
+from clients import get_twilio_client
+from coalescer import combine_messages
+
+
+class ReplyJob(NamedTuple):
+    """
+    A single inbound WhatsApp message waiting for an out-of-band reply.
+
+    Attributes:
+        from_number (str): The sender's WhatsApp address (e.g. "whatsapp:+15551234567").
+        to_number (str): The bot's WhatsApp address the message was sent to.
+        body (str): The message text.
+    """
+    from_number: str
+    to_number: str
+    body: str
+
+
+class TwilioSender:
+    """
+    Delivers replies through the Twilio REST messages API.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or get_twilio_client()
+
+    def send(self, to: str, from_: str, body: str) -> None:
+        self.client.messages.create(to=to, from_=from_, body=body)
+
+
+class FakeSender:
+    """
+    Records replies in memory instead of calling Twilio, so the out-of-band mode
+    can be exercised offline.
+    """
+
+    def __init__(self):
+        self.sent: List[dict] = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, from_: str, body: str) -> None:
+        with self._lock:
+            self.sent.append({'to': to, 'from_': from_, 'body': body})
+        logging.info(f"[FakeSender] to={to} body={body[:80]!r}")
+
+
+def create_sender(kind: str = None):
+    """
+    Build the reply sender named by `kind` (or the TWILIO_SENDER env var).
+
+    Args:
+        kind (str): "twilio" (default) or "fake".
+
+    Returns:
+        An object exposing `send(to, from_, body)`.
+    """
+    kind = (kind or os.getenv('TWILIO_SENDER', 'twilio')).lower()
+    if kind == 'fake':
+        return FakeSender()
+    return TwilioSender()
+
+
+class _Shard:
+    """Jobs waiting for one worker, grouped by sender in order of first arrival."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        # sender -> [jobs, ready_at, first_arrival]
+        self.pending: "OrderedDict[str, list]" = OrderedDict()
+        self.stopping = False
+
+
+class ReplyDispatcher:
+    """
+    Bounded worker pool that generates replies in the background and sends them
+    through a sender, so the webhook can acknowledge Twilio immediately.
+
+    Messages from the same sender always hash to the same worker, which keeps
+    replies for one conversation in the order they were received and ensures
+    only one reply per conversation is generated at a time. Messages from one
+    sender that arrive within `coalesce_window` seconds of each other (up to
+    `max_coalesce_wait` in total) are merged into a single job, so a burst of
+    short messages costs one assistant turn. The total number of queued
+    messages across all workers is capped at `max_queue_size`.
+    """
+
+    def __init__(self,
+                 handler: Callable[[ReplyJob], Iterable[str]],
+                 sender,
+                 num_workers: int = 4,
+                 max_queue_size: int = 100,
+                 error_message: str = "Sorry, something went wrong. Please try again.",
+                 coalesce_window: float = 0.0,
+                 max_coalesce_wait: float = 4.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.handler = handler
+        self.sender = sender
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.error_message = error_message
+        self.coalesce_window = coalesce_window
+        self.max_coalesce_wait = max_coalesce_wait
+        self.clock = clock
+        self._shards = [_Shard() for _ in range(num_workers)]
+        self._workers: List[threading.Thread] = []
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self.coalesced_messages = 0
+
+    def start(self) -> None:
+        """Start the worker threads if they are not already running."""
+        with self._start_lock:
+            if self._workers:
+                return
+            for index, shard in enumerate(self._shards):
+                shard.stopping = False
+                worker = threading.Thread(target=self._worker_loop, args=(shard,),
+                                          name=f"reply-worker-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            logging.info(f"Reply dispatcher started with {self.num_workers} workers")
+
+    def submit(self, job: ReplyJob) -> bool:
+        """
+        Enqueue a job for background processing.
+
+        Args:
+            job (ReplyJob): The message to reply to.
+
+        Returns:
+            bool: False if the queue is full and the job was rejected.
+        """
+        self.start()
+        with self._pending_cond:
+            if self._pending >= self.max_queue_size:
+                logging.warning(f"Reply queue full ({self._pending} jobs), rejecting message from {job.from_number}")
+                return False
+            self._pending += 1
+
+        shard = self._shards[self._shard(job.from_number)]
+        with shard.cond:
+            now = self.clock()
+            entry = shard.pending.get(job.from_number)
+            if entry is None:
+                shard.pending[job.from_number] = [[job], now + self.coalesce_window, now]
+            else:
+                entry[0].append(job)
+                entry[1] = min(now + self.coalesce_window, entry[2] + self.max_coalesce_wait)
+            shard.cond.notify()
+        return True
+
+    def pending(self) -> int:
+        """Number of jobs queued or in progress."""
+        with self._pending_cond:
+            return self._pending
+
+    def join(self) -> None:
+        """Block until every queued job has been processed."""
+        with self._pending_cond:
+            while self._pending:
+                self._pending_cond.wait()
+
+    def stop(self) -> None:
+        """Drain the queues and stop the worker threads."""
+        for shard in self._shards:
+            with shard.cond:
+                shard.stopping = True
+                shard.cond.notify()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _shard(self, from_number: str) -> int:
+        return zlib.crc32((from_number or '').encode('utf-8')) % self.num_workers
+
+    def _next_batch(self, shard: _Shard):
+        with shard.cond:
+            while True:
+                if not shard.pending:
+                    if shard.stopping:
+                        return None
+                    shard.cond.wait()
+                    continue
+                now = self.clock()
+                next_ready = None
+                for sender, (jobs, ready_at, _) in shard.pending.items():
+                    if ready_at <= now or shard.stopping:
+                        del shard.pending[sender]
+                        return jobs
+                    next_ready = ready_at if next_ready is None else min(next_ready, ready_at)
+                shard.cond.wait(next_ready - now)
+
+    def _worker_loop(self, shard: _Shard) -> None:
+        while True:
+            jobs = self._next_batch(shard)
+            if jobs is None:
+                return
+            try:
+                if len(jobs) > 1:
+                    logging.info(f"Coalesced {len(jobs)} messages from {jobs[0].from_number} into one turn")
+                self._process(jobs[0]._replace(body=combine_messages([job.body for job in jobs])))
+            finally:
+                with self._pending_cond:
+                    self._pending -= len(jobs)
+                    self.coalesced_messages += len(jobs) - 1
+                    self._pending_cond.notify_all()
+
+    def _process(self, job: ReplyJob) -> None:
+        # The handler may return a generator (streamed replies), so generation
+        # errors can surface while iterating as well as when calling it.
+        sent = 0
+        try:
+            for reply in self.handler(job):
+                self._send(job, reply)
+                sent += 1
+        except _SendError:
+            return
+        except Exception as e:
+            logging.error(f"Failed to generate reply for {job.from_number}: {e}")
+            if sent == 0:
+                try:
+                    self._send(job, self.error_message)
+                except _SendError:
+                    pass
+
+    def _send(self, job: ReplyJob, body: str) -> None:
+        try:
+            self.sender.send(to=job.from_number, from_=job.to_number, body=body)
+        except Exception as e:
+            logging.error(f"Failed to send reply to {job.from_number}: {e}")
+            raise _SendError() from e
+
+
+class _SendError(Exception):
+    """Raised internally when the sender fails, to stop delivering a reply."""
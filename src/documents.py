@@ -0,0 +1,202 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional, Union
+
+from clients import get_storage_client
+from instrumentation import stage
+
+CONTENT_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain; charset=utf-8',
+}
+# Documents larger than this are sent with a chunked resumable upload instead of a single request
+RESUMABLE_THRESHOLD = int(os.getenv('GCS_RESUMABLE_THRESHOLD', str(8 * 1024 * 1024)))
+# Resumable chunk size; GCS requires a multiple of 256 KiB
+RESUMABLE_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class RenderedDocument(NamedTuple):
+    """
+    A business plan rendered in memory.
+
+    Attributes:
+        buffer (io.BytesIO): The file contents, positioned at the start.
+        size (int): Size in bytes.
+        file_format (str): "docx" or "txt".
+        content_type (str): MIME type to upload it with.
+    """
+    buffer: io.BytesIO
+    size: int
+    file_format: str
+    content_type: str
+
+
+def render_business_plan(business_plan: str, file_format: str = 'docx',
+                         title: str = 'Business Plan') -> RenderedDocument:
+    """
+    Render a business plan as a docx or txt file in memory.
+
+    Args:
+        business_plan (str): The business plan content.
+        file_format (str): "docx" or "txt".
+        title (str): Heading of the docx document.
+
+    Returns:
+        RenderedDocument: The rendered file.
+    """
+    buffer = io.BytesIO()
+    if file_format == 'docx':
+        # python-docx (and lxml) are only needed for exports; keep them off the startup path
+        from docx import Document
+
+        doc = Document()
+        doc.add_heading(title, 0)
+        doc.add_paragraph(business_plan)
+        doc.save(buffer)
+    elif file_format == 'txt':
+        buffer.write(business_plan.encode('utf-8'))
+    else:
+        raise ValueError(f"Unsupported document format: {file_format}")
+    size = buffer.tell()
+    buffer.seek(0)
+    return RenderedDocument(buffer, size, file_format, CONTENT_TYPES[file_format])
+
+
+def business_plan_object_name(user_id: str, file_format: str, prefix: str = 'business_plans') -> str:
+    """
+    Build a unique object name for a user's business plan.
+
+    The user's number is hashed so it does not appear in object names or URLs,
+    and every document gets its own name so concurrent exports never overwrite
+    each other.
+
+    Args:
+        user_id (str): The user's WhatsApp number.
+        file_format (str): File extension.
+        prefix (str): Folder in the bucket.
+
+    Returns:
+        str: e.g. "business_plans/3f2a.../20240101T120000-9c1e2d4b.docx".
+    """
+    user_key = hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:16]
+    timestamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+    return f"{prefix}/{user_key}/{timestamp}-{uuid.uuid4().hex[:8]}.{file_format}"
+
+
+def upload_document(document: RenderedDocument, bucket_name: str, object_name: str, client=None) -> str:
+    """
+    Upload a rendered document to GCS straight from memory.
+
+    Args:
+        document (RenderedDocument): The rendered file.
+        bucket_name (str): The GCS bucket name.
+        object_name (str): The object name in the bucket.
+        client: Storage client; defaults to the shared one.
+
+    Returns:
+        str: The public URL of the uploaded object.
+    """
+    client = client or get_storage_client()
+    blob = client.bucket(bucket_name).blob(object_name)
+    if document.size > RESUMABLE_THRESHOLD:
+        # Sent in chunks, so a dropped connection only repeats the current chunk
+        blob.chunk_size = RESUMABLE_CHUNK_SIZE
+    with stage('upload_document'):
+        blob.upload_from_file(document.buffer, size=document.size, content_type=document.content_type,
+                              rewind=True)
+    return blob.public_url
+
+
+class DocumentPipeline:
+    """
+    Renders and uploads business plan documents on a small background thread pool,
+    so the webhook never waits on document rendering or upload.
+
+    Args:
+        bucket_name (str): The GCS bucket documents are uploaded to.
+        max_workers (int): Number of documents rendered/uploaded at once.
+        client: Storage client; defaults to the shared one.
+    """
+
+    def __init__(self, bucket_name: str, max_workers: int = 2, client=None):
+        self.bucket_name = bucket_name
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='documents')
+
+    def export(self, user_id: str, business_plan: str, file_format: str = 'docx',
+               title: str = 'Business Plan') -> str:
+        """
+        Render and upload a business plan, blocking until it is done.
+
+        Returns:
+            str: The public URL of the uploaded document.
+        """
+        with stage('render_document'):
+            document = render_business_plan(business_plan, file_format, title)
+        object_name = business_plan_object_name(user_id, file_format)
+        url = upload_document(document, self.bucket_name, object_name, client=self.client)
+        logging.info(f"Uploaded business plan for {user_id} ({document.size} bytes) to {object_name}")
+        return url
+
+    def submit(self, user_id: str, business_plan: Union[str, Callable[[], str]], file_format: str = 'docx', title: str = 'Business Plan',
+               on_done: Optional[Callable[[Optional[str]], None]] = None) -> Future:
+        """
+        Queue a business plan export.
+
+        Args:
+            user_id (str): The user's WhatsApp number.
+            business_plan (Union[str, Callable]): The business plan content, or a callable
+                producing it on the worker thread (e.g. to generate the plan first).
+            file_format (str): "docx" or "txt".
+            title (str): Heading of the docx document.
+            on_done (Callable): Optional callback receiving the public URL, or None if the export failed.
+
+        Returns:
+            Future: Resolves to the public URL.
+        """
+        def job() -> str:
+            try:
+                content = business_plan() if callable(business_plan) else business_plan
+                url = self.export(user_id, content, file_format, title)
+            except Exception as e:
+                logging.error(f"Failed to export business plan for {user_id}: {e}")
+                if on_done is not None:
+                    on_done(None)
+                raise
+            if on_done is not None:
+                on_done(url)
+            return url
+
+        return self._executor.submit(job)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_pipeline: Optional[DocumentPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_document_pipeline(bucket_name: str = None) -> DocumentPipeline:
+    """
+    Return the process-wide document pipeline, created on first use.
+
+    Args:
+        bucket_name (str): Bucket to upload to; defaults to the GCS_BUCKET_NAME env var.
+            Only used when the pipeline is created.
+
+    Returns:
+        DocumentPipeline: The shared pipeline, with DOCUMENT_WORKERS threads.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = DocumentPipeline(bucket_name or os.getenv('GCS_BUCKET_NAME', 'hbs_foundry_demo2'),
+                                         max_workers=int(os.getenv('DOCUMENT_WORKERS', '2')))
+        return _pipeline
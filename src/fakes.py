@@ -0,0 +1,677 @@
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+# In-process stand-ins for the OpenAI, Twilio and Cloud Storage APIs, with configurable latency,
+# for offline load tests and benchmarks. They implement only the calls this app
+# makes and return objects with the same attribute shapes as the real SDKs.
+
+_DEFAULT_REPLY = (
+    "Start by pricing against the outcome your learners care about, not your costs. "
+    "For a B2C storytelling course in India, anchor the price to what a comparable offline workshop costs "
+    "and offer a lower-priced self-paced tier to widen the funnel.\n\n"
+    "According to common edtech benchmarks, cohort-based courses convert better when they include live mentor time, "
+    "so bundle a small number of live sessions with your premium tier. "
+    "Test two price points with your next event cohort and measure conversion and completion.\n\n"
+    "What does your current funnel look like from event attendee to paid learner? "
+    "And which mentors on your platform drive the most repeat purchases?"
+)
+
+
+class LatencyModel:
+    """
+    Random latency distribution for a fake API call.
+
+    Args:
+        median (float): Median latency in seconds.
+        sigma (float): Log-normal shape parameter; 0 gives a fixed latency.
+        minimum (float): Lower bound on any sample.
+        seed (int): Optional seed for reproducible runs.
+    """
+
+    def __init__(self, median: float = 0.05, sigma: float = 0.0, minimum: float = 0.0, seed: int = None):
+        self.median = median
+        self.sigma = sigma
+        self.minimum = minimum
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = None) -> "LatencyModel":
+        """
+        Build a model from "fixed:SECONDS" or "lognormal:MEDIAN:SIGMA".
+
+        Args:
+            spec (str): The distribution spec.
+            seed (int): Optional seed.
+
+        Returns:
+            LatencyModel: The model.
+        """
+        kind, _, params = spec.partition(':')
+        values = [float(value) for value in params.split(':') if value]
+        if kind == 'fixed':
+            return cls(values[0], 0.0, seed=seed)
+        if kind == 'lognormal':
+            return cls(values[0], values[1] if len(values) > 1 else 0.5, seed=seed)
+        raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.sigma <= 0:
+            return max(self.minimum, self.median)
+        with self._lock:
+            value = self.median * math.exp(self._random.gauss(0.0, self.sigma))
+        return max(self.minimum, value)
+
+
+def _message(role: str, text: str, run_id: str = None, message_id: str = None):
+    return SimpleNamespace(
+        id=message_id, role=role, run_id=run_id, created_at=time.time(),
+        content=[SimpleNamespace(type='text', text=SimpleNamespace(value=text, annotations=[]))],
+    )
+
+
+def _usage(prompt: str, completion: str):
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(completion) // 4 + 1
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens)
+
+
+def fake_embedding(text: str, dimensions: int = 256) -> List[float]:
+    """Deterministic bag-of-words embedding, so similar prompts get similar vectors."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip('.,!?').encode('utf-8')) % dimensions] += 1.0
+    return vector
+
+
+class FakeAPIError(Exception):
+    """Error raised by the fakes, shaped like `openai.APIStatusError` (status code and response headers)."""
+
+    def __init__(self, status_code: int, message: str, retry_after: float = None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {'retry-after-ms': str(int(retry_after * 1000))}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FaultModel:
+    """
+    Injects upstream failures into the fake OpenAI clients.
+
+    Args:
+        rpm_limit (int): Calls allowed per rolling minute before answering 429 (0 disables).
+        rate_limit_rate (float): Probability of a random 429 on any call.
+        server_error_rate (float): Probability of a 500 on any call.
+        retry_after (float): Retry-After sent with 429s, in seconds; None omits the header.
+        seed (int): Optional seed for reproducible runs.
+    """
+
+    def __init__(self, rpm_limit: int = 0, rate_limit_rate: float = 0.0, server_error_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: int = None):
+        self.rpm_limit = rpm_limit
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._recent: List[float] = []
+        self._lock = threading.Lock()
+        self.injected = 0
+
+    def check(self, name: str) -> None:
+        """Raise a FakeAPIError for this call if a fault is due."""
+        with self._lock:
+            now = time.monotonic()
+            error = None
+            if self.rpm_limit:
+                self._recent = [t for t in self._recent if now - t < 60.0]
+                if len(self._recent) >= self.rpm_limit:
+                    wait = 60.0 - (now - self._recent[0])
+                    error = FakeAPIError(429, f"Rate limit reached for requests on {name}", wait)
+                else:
+                    self._recent.append(now)
+            roll = self._random.random()
+            if error is None and roll < self.rate_limit_rate:
+                error = FakeAPIError(429, f"Rate limit reached for {name}", self.retry_after)
+            elif error is None and roll < self.rate_limit_rate + self.server_error_rate:
+                error = FakeAPIError(500, f"The server had an error while processing {name}")
+            if error is not None:
+                self.injected += 1
+        if error is not None:
+            raise error
+
+
+class _FakeBackend:
+    """Shared state of the fake Assistants API (threads, messages and runs) and Batch API (files and batches)."""
+
+    def __init__(self, run_latency: LatencyModel, api_latency: LatencyModel, reply_text: str,
+                 faults: FaultModel = None):
+        self.run_latency = run_latency
+        self.api_latency = api_latency
+        self.reply_text = reply_text
+        self.faults = faults
+        self.threads: Dict[str, List] = {}
+        self.runs: Dict[str, dict] = {}
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+        self.calls: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.faults is not None:
+            self.faults.check(name)
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):08d}"
+
+    def create_thread(self):
+        thread_id = self.new_id('thread')
+        with self._lock:
+            self.threads[thread_id] = []
+        return SimpleNamespace(id=thread_id)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self.threads.pop(thread_id, None)
+        return SimpleNamespace(id=thread_id, deleted=True)
+
+    def add_message(self, thread_id: str, role: str, content: str, run_id: str = None):
+        message = _message(role, content, run_id=run_id, message_id=self.new_id('msg'))
+        with self._lock:
+            self.threads.setdefault(thread_id, []).append(message)
+        return message
+
+    def delete_message(self, thread_id: str, message_id: str):
+        with self._lock:
+            messages = self.threads.get(thread_id, [])
+            messages[:] = [message for message in messages if message.id != message_id]
+        return SimpleNamespace(id=message_id, deleted=True)
+
+    def create_run(self, thread_id: str, duration: float = None):
+        run_id = self.new_id('run')
+        with self._lock:
+            messages = self.threads.get(thread_id, [])
+            prompt = messages[-1].content[0].text.value if messages else ''
+            self.runs[run_id] = {'thread_id': thread_id, 'started': time.monotonic(), 'prompt': prompt,
+                                 'duration': self.run_latency.sample() if duration is None else duration,
+                                 'status': 'queued'}
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status='queued', last_error=None)
+
+    def run_status(self, run_id: str):
+        with self._lock:
+            run = self.runs[run_id]
+            if run['status'] in ('queued', 'in_progress'):
+                if time.monotonic() - run['started'] >= run['duration']:
+                    run['status'] = 'completed'
+                    complete = True
+                else:
+                    run['status'] = 'in_progress'
+                    complete = False
+            else:
+                complete = False
+        if complete:
+            self.add_message(run['thread_id'], 'assistant', self.reply_text, run_id=run_id)
+        usage = _usage(run['prompt'], self.reply_text) if run['status'] == 'completed' else None
+        return SimpleNamespace(id=run_id, thread_id=run['thread_id'], status=run['status'], last_error=None,
+                               usage=usage)
+
+    def cancel_run(self, run_id: str):
+        with self._lock:
+            self.runs[run_id]['status'] = 'cancelled'
+        return SimpleNamespace(id=run_id, status='cancelled')
+
+    def list_messages(self, thread_id: str, limit: int = 20, order: str = 'desc', run_id: str = None):
+        with self._lock:
+            messages = list(self.threads.get(thread_id, []))
+        if run_id is not None:
+            messages = [message for message in messages if message.run_id == run_id]
+        if order == 'desc':
+            messages.reverse()
+        return SimpleNamespace(data=messages[:limit])
+
+    def stream_plan(self, thread_id: str, delta_size: int = 12):
+        """Events for a streaming run, paired with the delay before each one."""
+        run = self.create_run(thread_id)
+        duration = self.runs[run.id]['duration']
+        pieces = [self.reply_text[i:i + delta_size] for i in range(0, len(self.reply_text), delta_size)]
+        # Spend the first third of the run "thinking", then stream evenly.
+        first = duration / 3
+        gap = (duration - first) / max(1, len(pieces))
+        events = [(0.0, SimpleNamespace(event='thread.run.created',
+                                        data=SimpleNamespace(id=run.id, status='queued', last_error=None)))]
+        for index, piece in enumerate(pieces):
+            delta = SimpleNamespace(content=[SimpleNamespace(type='text', index=0,
+                                                             text=SimpleNamespace(value=piece))])
+            events.append((first if index == 0 else gap,
+                           SimpleNamespace(event='thread.message.delta', data=SimpleNamespace(delta=delta))))
+        usage = _usage(self.runs[run.id]['prompt'], self.reply_text)
+        events.append((0.0, SimpleNamespace(event='thread.run.completed',
+                                            data=SimpleNamespace(id=run.id, status='completed', last_error=None,
+                                                                 usage=usage))))
+        return run.id, events
+
+    def finish_stream(self, run_id: str) -> None:
+        with self._lock:
+            run = self.runs[run_id]
+            run['status'] = 'completed'
+        self.add_message(run['thread_id'], 'assistant', self.reply_text, run_id=run_id)
+
+    def create_file(self, file, purpose: str):
+        if isinstance(file, tuple):
+            file = file[1]
+        content = file if isinstance(file, bytes) else file.read()
+        file_id = self.new_id('file')
+        with self._lock:
+            self.files[file_id] = content
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(content))
+
+    def file_content(self, file_id: str):
+        with self._lock:
+            content = self.files[file_id]
+        return SimpleNamespace(content=content, text=content.decode('utf-8'))
+
+    def create_batch(self, input_file_id: str, endpoint: str):
+        """A batch takes one run latency sample to finish, however many requests it holds."""
+        with self._lock:
+            requests = [json.loads(line) for line in self.files[input_file_id].decode('utf-8').splitlines() if line]
+        batch_id = self.new_id('batch')
+        with self._lock:
+            self.batches[batch_id] = {'requests': requests, 'endpoint': endpoint, 'started': time.monotonic(),
+                                      'duration': self.run_latency.sample(), 'output_file_id': None}
+        return self.batch_status(batch_id)
+
+    def batch_status(self, batch_id: str):
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise FakeAPIError(404, f"No batch found with id '{batch_id}'")
+            done = time.monotonic() - batch['started'] >= batch['duration']
+            if done and batch['output_file_id'] is None:
+                lines = []
+                for request in batch['requests']:
+                    usage = _usage(request['body']['messages'][-1]['content'], self.reply_text)
+                    body = {'object': 'chat.completion', 'model': request['body'].get('model'),
+                            'choices': [{'index': 0, 'finish_reason': 'stop',
+                                         'message': {'role': 'assistant', 'content': self.reply_text}}],
+                            'usage': vars(usage)}
+                    lines.append(json.dumps({'id': self.new_id('batch_req'), 'custom_id': request['custom_id'],
+                                             'response': {'status_code': 200, 'body': body}, 'error': None}))
+                batch['output_file_id'] = self.new_id('file')
+                self.files[batch['output_file_id']] = '\n'.join(lines).encode('utf-8')
+            total = len(batch['requests'])
+        return SimpleNamespace(id=batch_id, status='completed' if done else 'in_progress',
+                               output_file_id=batch['output_file_id'], error_file_id=None,
+                               request_counts=SimpleNamespace(total=total, completed=total if done else 0, failed=0))
+
+
+class FakeOpenAI:
+    """
+    Synchronous stand-in for `openai.OpenAI`.
+
+    Args:
+        run_latency (LatencyModel): Duration of assistant runs, chat completions and batches.
+        api_latency (LatencyModel): Latency of every other API call.
+        reply_text (str): Text returned by every completion and assistant run.
+        faults (FaultModel): Optional throttling and error injection.
+    """
+
+    def __init__(self, run_latency: LatencyModel = None, api_latency: LatencyModel = None, reply_text: str = None,
+                 faults: FaultModel = None):
+        self.backend = _FakeBackend(run_latency or LatencyModel(2.0, 0.4), api_latency or LatencyModel(0.05),
+                                    reply_text or _DEFAULT_REPLY, faults)
+        backend = self.backend
+
+        def call(name: str, latency: LatencyModel = None):
+            backend.count(name)
+            time.sleep((latency or backend.api_latency).sample())
+
+        def completions_create(model=None, messages=None, stream=False, **kwargs):
+            prompt = messages[-1]['content'] if messages else ''
+            if stream:
+                call('chat.completions.create')
+                return self._stream_completion(backend.reply_text)
+            call('chat.completions.create', backend.run_latency)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=backend.reply_text), finish_reason='stop')],
+                usage=_usage(prompt, backend.reply_text), model=model)
+
+        def embeddings_create(model=None, input=None, **kwargs):
+            call('embeddings.create')
+            return SimpleNamespace(data=[SimpleNamespace(embedding=fake_embedding(input))])
+
+        def threads_create(**kwargs):
+            call('threads.create')
+            return backend.create_thread()
+
+        def threads_delete(thread_id, **kwargs):
+            call('threads.delete')
+            return backend.delete_thread(thread_id)
+
+        def messages_create(thread_id, role, content, **kwargs):
+            call('messages.create')
+            return backend.add_message(thread_id, role, content)
+
+        def messages_list(thread_id, limit=20, order='desc', run_id=None, **kwargs):
+            call('messages.list')
+            return backend.list_messages(thread_id, limit=limit, order=order, run_id=run_id)
+
+        def messages_delete(message_id, thread_id=None, **kwargs):
+            call('messages.delete')
+            return backend.delete_message(thread_id, message_id)
+
+        def runs_create(thread_id, assistant_id=None, **kwargs):
+            call('runs.create')
+            return backend.create_run(thread_id)
+
+        def runs_retrieve(run_id, thread_id=None, **kwargs):
+            call('runs.retrieve')
+            return backend.run_status(run_id)
+
+        def runs_cancel(run_id, thread_id=None, **kwargs):
+            call('runs.cancel')
+            return backend.cancel_run(run_id)
+
+        def files_create(file=None, purpose=None, **kwargs):
+            call('files.create')
+            return backend.create_file(file, purpose)
+
+        def files_content(file_id, **kwargs):
+            call('files.content')
+            return backend.file_content(file_id)
+
+        def batches_create(input_file_id=None, endpoint=None, completion_window=None, **kwargs):
+            call('batches.create')
+            return backend.create_batch(input_file_id, endpoint)
+
+        def batches_retrieve(batch_id, **kwargs):
+            call('batches.retrieve')
+            return backend.batch_status(batch_id)
+
+        @contextmanager
+        def runs_stream(thread_id, assistant_id=None, **kwargs):
+            call('runs.stream')
+            run_id, events = backend.stream_plan(thread_id)
+
+            def iterate():
+                for delay, event in events:
+                    if delay:
+                        time.sleep(delay)
+                    yield event
+                backend.finish_stream(run_id)
+
+            yield iterate()
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=completions_create))
+        self.embeddings = SimpleNamespace(create=embeddings_create)
+        self.files = SimpleNamespace(create=files_create, content=files_content)
+        self.batches = SimpleNamespace(create=batches_create, retrieve=batches_retrieve)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(
+            create=threads_create, delete=threads_delete,
+            messages=SimpleNamespace(create=messages_create, list=messages_list, delete=messages_delete),
+            runs=SimpleNamespace(create=runs_create, retrieve=runs_retrieve, cancel=runs_cancel, stream=runs_stream),
+        ))
+
+    def _stream_completion(self, text: str, delta_size: int = 12) -> Iterator:
+        pieces = [text[i:i + delta_size] for i in range(0, len(text), delta_size)]
+        gap = self.backend.run_latency.sample() / max(1, len(pieces))
+        for piece in pieces:
+            time.sleep(gap)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    @property
+    def calls(self) -> Dict[str, int]:
+        return dict(self.backend.calls)
+
+
+class FakeAsyncOpenAI:
+    """
+    asyncio stand-in for `openai.AsyncOpenAI`, sharing the behaviour of `FakeOpenAI`.
+    """
+
+    def __init__(self, run_latency: LatencyModel = None, api_latency: LatencyModel = None, reply_text: str = None,
+                 faults: FaultModel = None):
+        self.backend = _FakeBackend(run_latency or LatencyModel(2.0, 0.4), api_latency or LatencyModel(0.05),
+                                    reply_text or _DEFAULT_REPLY, faults)
+        backend = self.backend
+
+        async def call(name: str, latency: LatencyModel = None):
+            backend.count(name)
+            await asyncio.sleep((latency or backend.api_latency).sample())
+
+        async def completions_create(model=None, messages=None, stream=False, **kwargs):
+            prompt = messages[-1]['content'] if messages else ''
+            if stream:
+                await call('chat.completions.create')
+                return self._stream_completion(backend.reply_text)
+            await call('chat.completions.create', backend.run_latency)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=backend.reply_text), finish_reason='stop')],
+                usage=_usage(prompt, backend.reply_text), model=model)
+
+        async def embeddings_create(model=None, input=None, **kwargs):
+            await call('embeddings.create')
+            return SimpleNamespace(data=[SimpleNamespace(embedding=fake_embedding(input))])
+
+        async def threads_create(**kwargs):
+            await call('threads.create')
+            return backend.create_thread()
+
+        async def threads_delete(thread_id, **kwargs):
+            await call('threads.delete')
+            return backend.delete_thread(thread_id)
+
+        async def messages_create(thread_id, role, content, **kwargs):
+            await call('messages.create')
+            return backend.add_message(thread_id, role, content)
+
+        async def messages_list(thread_id, limit=20, order='desc', run_id=None, **kwargs):
+            await call('messages.list')
+            return backend.list_messages(thread_id, limit=limit, order=order, run_id=run_id)
+
+        async def messages_delete(message_id, thread_id=None, **kwargs):
+            await call('messages.delete')
+            return backend.delete_message(thread_id, message_id)
+
+        async def runs_create(thread_id, assistant_id=None, **kwargs):
+            await call('runs.create')
+            return backend.create_run(thread_id)
+
+        async def runs_retrieve(run_id, thread_id=None, **kwargs):
+            await call('runs.retrieve')
+            return backend.run_status(run_id)
+
+        async def runs_cancel(run_id, thread_id=None, **kwargs):
+            await call('runs.cancel')
+            return backend.cancel_run(run_id)
+
+        def runs_stream(thread_id, assistant_id=None, **kwargs):
+            return _AsyncStreamManager(backend, thread_id)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=completions_create))
+        self.embeddings = SimpleNamespace(create=embeddings_create)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(
+            create=threads_create, delete=threads_delete,
+            messages=SimpleNamespace(create=messages_create, list=messages_list, delete=messages_delete),
+            runs=SimpleNamespace(create=runs_create, retrieve=runs_retrieve, cancel=runs_cancel, stream=runs_stream),
+        ))
+
+    async def _stream_completion(self, text: str, delta_size: int = 12):
+        pieces = [text[i:i + delta_size] for i in range(0, len(text), delta_size)]
+        gap = self.backend.run_latency.sample() / max(1, len(pieces))
+        for piece in pieces:
+            await asyncio.sleep(gap)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    @property
+    def calls(self) -> Dict[str, int]:
+        return dict(self.backend.calls)
+
+
+class _AsyncStreamManager:
+    def __init__(self, backend: _FakeBackend, thread_id: str):
+        self.backend = backend
+        self.thread_id = thread_id
+
+    async def __aenter__(self):
+        self.backend.count('runs.stream')
+        run_id, events = self.backend.stream_plan(self.thread_id)
+        return self._iterate(run_id, events)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def _iterate(self, run_id: str, events):
+        for delay, event in events:
+            if delay:
+                await asyncio.sleep(delay)
+            yield event
+        self.backend.finish_stream(run_id)
+
+
+class FakeTwilioError(Exception):
+    """Stands in for `twilio.base.exceptions.TwilioRestException` (HTTP status in `status`)."""
+
+    def __init__(self, status: int, code: int, message: str):
+        super().__init__(f"HTTP {status} error {code}: {message}")
+        self.status = status
+        self.code = code
+
+
+class FakeTwilioClient:
+    """
+    Stand-in for `twilio.rest.Client` that records outbound messages.
+
+    Bodies over the WhatsApp limit are rejected like Twilio does (400, error 21617).
+
+    Args:
+        latency (LatencyModel): Latency of each `messages.create` call.
+        failure_rate (float): Fraction of sends failing with a 503.
+        seed (int): Seed for the failure draws.
+    """
+
+    BODY_LIMIT = 1600
+
+    def __init__(self, latency: LatencyModel = None, failure_rate: float = 0.0, seed: int = None):
+        self.latency = latency or LatencyModel(0.08)
+        self.failure_rate = failure_rate
+        self.sent: List[dict] = []
+        self.failed = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+        def messages_create(to: str, from_: str, body: str, **kwargs):
+            time.sleep(self.latency.sample())
+            if len(body.encode('utf-16-le')) // 2 > self.BODY_LIMIT:
+                raise FakeTwilioError(400, 21617, "The concatenated message body exceeds the 1600 character limit")
+            with self._lock:
+                failed = self._rng.random() < self.failure_rate
+                self.failed += failed
+            if failed:
+                raise FakeTwilioError(503, 20503, "Service unavailable")
+            sid = f"SM{next(self._ids):032d}"
+            with self._lock:
+                self.sent.append({'sid': sid, 'to': to, 'from_': from_, 'body': body, 'sent_at': time.monotonic()})
+            return SimpleNamespace(sid=sid, status='queued')
+
+        self.messages = SimpleNamespace(create=messages_create)
+
+    def sent_to(self, to: str) -> List[dict]:
+        with self._lock:
+            return [message for message in self.sent if message['to'] == to]
+
+
+class FakeStorageClient:
+    """
+    In-memory stand-in for `google.cloud.storage.Client`, enough for uploading documents.
+
+    Uploaded objects are kept in `objects` as {(bucket, name): {'data', 'content_type', 'chunk_size'}}.
+
+    Args:
+        latency (LatencyModel): Latency of each upload.
+    """
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel(0.0)
+        self.objects: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, bucket_name: str) -> "_FakeBucket":
+        return _FakeBucket(self, bucket_name)
+
+
+class _FakeBucket:
+    def __init__(self, client: FakeStorageClient, name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name: str) -> "_FakeBlob":
+        return _FakeBlob(self, blob_name)
+
+
+class _FakeBlob:
+    def __init__(self, bucket: _FakeBucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = None
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def upload_from_file(self, file_obj, size: int = None, content_type: str = None, rewind: bool = False, **kwargs):
+        if rewind:
+            file_obj.seek(0)
+        data = file_obj.read() if size is None else file_obj.read(size)
+        self._store(data, content_type)
+
+    def upload_from_string(self, data, content_type: str = 'text/plain', **kwargs):
+        self._store(data.encode('utf-8') if isinstance(data, str) else data, content_type)
+
+    def upload_from_filename(self, filename: str, content_type: str = None, **kwargs):
+        with open(filename, 'rb') as file:
+            self._store(file.read(), content_type)
+
+    def _store(self, data: bytes, content_type: str) -> None:
+        client = self.bucket.client
+        time.sleep(client.latency.sample())
+        with client._lock:
+            client.objects[(self.bucket.name, self.name)] = {'data': data, 'content_type': content_type,
+                                                             'chunk_size': self.chunk_size}
+
+
+def install_fakes(run_latency: LatencyModel = None, api_latency: LatencyModel = None,
+                  twilio_latency: LatencyModel = None, reply_text: str = None,
+                  storage_latency: LatencyModel = None, faults: FaultModel = None,
+                  twilio_failure_rate: float = 0.0) -> SimpleNamespace:
+    """
+    Register fake OpenAI, AsyncOpenAI, Twilio and Cloud Storage clients in the client registry.
+
+    Returns:
+        SimpleNamespace: The installed fakes as `openai`, `async_openai`, `twilio` and `storage`.
+    """
+    from clients import set_client
+
+    fakes = SimpleNamespace(
+        openai=FakeOpenAI(run_latency, api_latency, reply_text, faults),
+        async_openai=FakeAsyncOpenAI(run_latency, api_latency, reply_text, faults),
+        twilio=FakeTwilioClient(twilio_latency, failure_rate=twilio_failure_rate),
+        storage=FakeStorageClient(storage_latency),
+    )
+    set_client('openai', fakes.openai)
+    set_client('async_openai', fakes.async_openai)
+    set_client('twilio', fakes.twilio)
+    set_client('storage', fakes.storage)
+    return fakes
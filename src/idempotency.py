@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from conversation_store import _transaction
+
+# Outcomes of `IdempotencyStore.begin`
+NEW = 'new'
+PENDING = 'pending'
+DONE = 'done'
+
+
+class IdempotencyStore:
+    """
+    Records which webhook deliveries (keyed on Twilio's MessageSid) are being
+    handled or were handled, and the response that was sent for them.
+
+    Rows live in SQLite so every worker sharing the database sees the same
+    deliveries. Entries expire after `ttl` seconds and the table is capped at
+    `max_entries` rows, oldest first.
+
+    Args:
+        db_path (str): Path to the SQLite database file; may be the conversation database.
+        ttl (float): Seconds a delivery is remembered.
+        max_entries (int): Maximum number of deliveries remembered.
+        in_flight_timeout (float): Seconds after which a delivery still marked in flight is
+            assumed abandoned (e.g. its worker died) and may be handled again.
+    """
+
+    PURGE_EVERY = 500
+
+    def __init__(self, db_path: str = 'conversations.db', ttl: float = 86400.0, max_entries: int = 100000,
+                 in_flight_timeout: float = 120.0):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.in_flight_timeout = in_flight_timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self) -> None:
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS webhook_deliveries (
+                message_sid TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                response TEXT,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_updated ON webhook_deliveries (updated_at);
+        """)
+
+    def begin(self, message_sid: str, owner: str) -> Tuple[str, Optional[str]]:
+        """
+        Claim a delivery for `owner`, unless it is already in flight or done.
+
+        Returns:
+            Tuple[str, Optional[str]]: (NEW, None) if the caller should handle the message,
+            (PENDING, None) if another request is handling it, or (DONE, response).
+        """
+        now = time.time()
+        conn = self._connection()
+        with _transaction(conn):
+            row = conn.execute(
+                'SELECT status, response, started_at, updated_at FROM webhook_deliveries WHERE message_sid = ?',
+                (message_sid,),
+            ).fetchone()
+            if row is not None and row[3] >= now - self.ttl:
+                status, response, started_at, _ = row
+                if status == DONE:
+                    return DONE, response
+                if started_at >= now - self.in_flight_timeout:
+                    return PENDING, None
+            conn.execute(
+                """
+                INSERT INTO webhook_deliveries (message_sid, status, owner, response, started_at, updated_at)
+                VALUES (?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(message_sid) DO UPDATE SET
+                    status = excluded.status, owner = excluded.owner, response = NULL,
+                    started_at = excluded.started_at, updated_at = excluded.updated_at
+                """,
+                (message_sid, PENDING, owner, now, now),
+            )
+        self._maybe_purge()
+        return NEW, None
+
+    def complete(self, message_sid: str, owner: str, response: str) -> None:
+        """Store the response of a delivery claimed by `owner`."""
+        self._connection().execute(
+            """
+            UPDATE webhook_deliveries SET status = ?, response = ?, updated_at = ?
+            WHERE message_sid = ? AND owner = ?
+            """,
+            (DONE, response, time.time(), message_sid, owner),
+        )
+
+    def abandon(self, message_sid: str, owner: str) -> None:
+        """Forget a delivery claimed by `owner` that failed, so a retry handles it again."""
+        self._connection().execute(
+            'DELETE FROM webhook_deliveries WHERE message_sid = ? AND owner = ? AND status = ?',
+            (message_sid, owner, PENDING),
+        )
+
+    def lookup(self, message_sid: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (status, response); status is None if the
+            delivery is unknown.
+        """
+        row = self._connection().execute(
+            'SELECT status, response FROM webhook_deliveries WHERE message_sid = ?', (message_sid,)
+        ).fetchone()
+        return (row[0], row[1]) if row is not None else (None, None)
+
+    def purge(self) -> int:
+        """Delete expired deliveries and the oldest ones beyond `max_entries`."""
+        conn = self._connection()
+        with _transaction(conn):
+            deleted = conn.execute('DELETE FROM webhook_deliveries WHERE updated_at < ?',
+                                   (time.time() - self.ttl,)).rowcount
+            deleted += conn.execute(
+                """
+                DELETE FROM webhook_deliveries WHERE message_sid IN (
+                    SELECT message_sid FROM webhook_deliveries ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            ).rowcount
+        return deleted
+
+    def _maybe_purge(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            try:
+                self.purge()
+            except sqlite3.Error as e:
+                logging.warning(f"Could not purge webhook deliveries: {e}")
+
+
+class WebhookDeduplicator:
+    """
+    Makes the /whatsapp webhook idempotent on Twilio's MessageSid.
+
+    The first delivery of a message is handled normally and its TwiML response
+    is stored. A retry of a delivery that was already answered gets the stored
+    response back. A retry that arrives while the original is still being
+    handled waits for the original's response (up to `wait_timeout`) instead
+    of starting a second assistant run; if it is still not ready, the retry is
+    acknowledged with `ack_response` and no work is done.
+
+    Args:
+        store (IdempotencyStore): Shared record of deliveries.
+        wait_timeout (float): Seconds a retry waits for the in-flight original.
+        poll_interval (float): Seconds between checks for a result produced by another worker.
+        ack_response (str): Response sent to a retry whose original has not finished.
+    """
+
+    def __init__(self, store: IdempotencyStore, wait_timeout: float = 10.0, poll_interval: float = 0.1,
+                 ack_response: str = ''):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.ack_response = ack_response
+        # Deliveries handled by this process: message_sid -> event set when they finish
+        self._local: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.acknowledged = 0
+
+    def handle(self, message_sid: Optional[str], respond: Callable[[], str]) -> Tuple[str, bool]:
+        """
+        Produce the response for a delivery, calling `respond` only for its first delivery.
+
+        Args:
+            message_sid (str): Twilio's MessageSid; None disables deduplication.
+            respond (Callable): Handles the message and returns the response body.
+
+        Returns:
+            Tuple[str, bool]: (response body, whether the delivery was a duplicate)
+        """
+        if not message_sid:
+            return respond(), False
+        owner = uuid.uuid4().hex
+        while True:
+            status, response = self.store.begin(message_sid, owner)
+            if status == NEW:
+                return self._respond(message_sid, owner, respond), False
+            if status == PENDING:
+                status, response = self._wait(message_sid)
+            # The original failed and was forgotten: handle the retry like a first delivery
+            if status is not None:
+                return self._duplicate(message_sid, response), True
+
+    async def handle_async(self, message_sid: Optional[str],
+                           respond: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        Async variant of `handle`; `respond` is a coroutine function. Store calls
+        run in worker threads so SQLite never blocks the event loop.
+        """
+        if not message_sid:
+            return await respond(), False
+        owner = uuid.uuid4().hex
+        while True:
+            status, response = await asyncio.to_thread(self.store.begin, message_sid, owner)
+            if status == NEW:
+                try:
+                    response = await respond()
+                except BaseException:
+                    await asyncio.to_thread(self.store.abandon, message_sid, owner)
+                    raise
+                await asyncio.to_thread(self.store.complete, message_sid, owner, response)
+                return response, False
+            deadline = time.monotonic() + self.wait_timeout
+            while status == PENDING and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                status, response = await asyncio.to_thread(self.store.lookup, message_sid)
+            if status is not None:
+                return self._duplicate(message_sid, response), True
+
+    def stats(self) -> dict:
+        return {'replayed': self.replayed, 'acknowledged': self.acknowledged}
+
+    def _respond(self, message_sid: str, owner: str, respond: Callable[[], str]) -> str:
+        event = threading.Event()
+        with self._lock:
+            self._local[message_sid] = event
+        try:
+            response = respond()
+        except BaseException:
+            self.store.abandon(message_sid, owner)
+            raise
+        else:
+            self.store.complete(message_sid, owner, response)
+        finally:
+            with self._lock:
+                self._local.pop(message_sid, None)
+            event.set()
+        return response
+
+    def _wait(self, message_sid: str) -> Tuple[Optional[str], Optional[str]]:
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                event = self._local.get(message_sid)
+            remaining = deadline - time.monotonic()
+            if event is not None:
+                # Handled in this process: wake up as soon as it finishes
+                event.wait(max(0.0, remaining))
+            status, response = self.store.lookup(message_sid)
+            if status != PENDING or remaining <= 0:
+                return status, response
+            if event is None:
+                time.sleep(min(self.poll_interval, remaining))
+
+    def _duplicate(self, message_sid: str, response: Optional[str]) -> str:
+        with self._lock:
+            if response is None:
+                self.acknowledged += 1
+            else:
+                self.replayed += 1
+        logging.info(f"Duplicate delivery of {message_sid}: "
+                     f"{'acknowledged' if response is None else 'replayed the stored response'}")
+        return self.ack_response if response is None else response
+
+
+def create_webhook_deduplicator(ack_response: str = '') -> WebhookDeduplicator:
+    """
+    Build the webhook deduplicator from the environment.
+
+    Deliveries are recorded in IDEMPOTENCY_DB_PATH (default: the conversation
+    database, CONVERSATION_DB_PATH) for IDEMPOTENCY_TTL_SECONDS, at most
+    IDEMPOTENCY_MAX_ENTRIES of them; retries wait up to IDEMPOTENCY_WAIT_SECONDS
+    for the original, which is considered abandoned after IDEMPOTENCY_IN_FLIGHT_SECONDS.
+    """
+    db_path = os.getenv('IDEMPOTENCY_DB_PATH') or os.getenv('CONVERSATION_DB_PATH', 'conversations.db')
+    store = IdempotencyStore(db_path,
+                             ttl=float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400')),
+                             max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '100000')),
+                             in_flight_timeout=float(os.getenv('IDEMPOTENCY_IN_FLIGHT_SECONDS', '120')))
+    return WebhookDeduplicator(store, wait_timeout=float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10')),
+                               ack_response=ack_response)
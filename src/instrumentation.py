@@ -0,0 +1,132 @@
+import atexit
+import contextvars
+import functools
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from metrics import STAGE_SECONDS
+
+# Per-request stage timings, set by `collect_stages` around a request
+_current_stages: contextvars.ContextVar = contextvars.ContextVar('current_stages', default=None)
+
+# Emit an OpenTelemetry span per stage (needs opentelemetry-api and a configured SDK)
+TRACE_SPANS = os.getenv('TRACE_SPANS', 'false').lower() == 'true'
+_tracer = None
+if TRACE_SPANS:
+    try:
+        from opentelemetry import trace as _otel_trace
+        _tracer = _otel_trace.get_tracer('whatsapp_bot')
+    except ImportError:  # tracing is optional
+        logging.warning("TRACE_SPANS is set but opentelemetry-api is not installed")
+
+# Fraction of messages / prompts / responses logged in full; the rest only log their length
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0'))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '500'))
+
+_log_listener = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the request path (e.g. "session_load", "llm_wait").
+
+    The elapsed seconds are recorded in the `whatsapp_stage_seconds` histogram and
+    added to the stage timings of the enclosing `collect_stages` block, if any.
+    Repeated stages accumulate.
+
+    Args:
+        name (str): The stage name.
+    """
+    span = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if span is not None:
+        span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _current_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+def timed(name: str):
+    """Decorator form of `stage` for whole functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_stages() -> Iterator[Dict[str, float]]:
+    """
+    Collect the timings of every `stage` entered inside the block.
+
+    Yields:
+        Dict[str, float]: Mapping of stage name to elapsed seconds, filled in as stages finish.
+    """
+    stages: Dict[str, float] = {}
+    token = _current_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _current_stages.reset(token)
+
+
+def current_stages() -> Optional[Dict[str, float]]:
+    """Return the stage timings being collected for the current request, if any."""
+    return _current_stages.get()
+
+
+def payload(text: str) -> str:
+    """
+    Describe a message, prompt or response for a log line.
+
+    Only a sample of payloads (LOG_PAYLOAD_SAMPLE_RATE) are included, truncated to
+    LOG_PAYLOAD_MAX_CHARS; otherwise just the length is logged, which keeps user
+    content and large formatting work out of most log lines.
+    """
+    if text is None:
+        return '<none>'
+    if LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            return f"{text[:LOG_PAYLOAD_MAX_CHARS]!r}... ({len(text)} chars)"
+        return repr(text)
+    return f"<{len(text)} chars>"
+
+
+def configure_logging() -> None:
+    """
+    Move the root logger's handlers behind a queue, so request threads only
+    enqueue records and a background listener does the formatting and I/O.
+
+    Safe to call more than once; later calls are no-ops.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, logging.handlers.QueueHandler)]
+    if not handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
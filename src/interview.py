@@ -0,0 +1,204 @@
+import logging
+import math
+import os
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from utils import BUSINESS_PLAN_SECTIONS
+
+
+class SectionProfile(NamedTuple):
+    """
+    What the interview looks for in one business plan section.
+
+    Attributes:
+        question (str): Question asked the first time the section is missing.
+        follow_up (str): Question asked when an earlier answer was not enough.
+        keywords (Sequence[str]): Words or phrases that suggest an answer touches the section.
+            They match whole words, plurals included; a trailing "*" matches any ending.
+        description (str): Short description, embedded for semantic matching.
+    """
+    question: str
+    follow_up: str
+    keywords: Sequence[str]
+    description: str
+
+
+SECTION_PROFILES: Dict[str, SectionProfile] = {
+    "Business Description": SectionProfile(
+        "What does your business do: what product or service do you offer, and what problem does it solve?",
+        "Could you describe your product or service in a bit more detail, and how customers use it?",
+        ('product', 'service', 'platform', 'app', 'offer*', 'sell*', 'solv*', 'problem', 'solution', 'startup',
+         'company', 'companies', 'business model', 'subscription', 'course'),
+        "what the business does, its products and services, and the problem it solves",
+    ),
+    "Business Mission": SectionProfile(
+        "What is the mission of your business: why does it exist and what change do you want to make?",
+        "In one or two sentences, what is the purpose that drives your business?",
+        ('mission', 'purpose', 'vision', 'believe', 'change', 'impact', 'why we', 'value', 'empower*',
+         'democratiz*', 'make it possible'),
+        "the mission, purpose and vision of the business",
+    ),
+    "Business goals": SectionProfile(
+        "What are your main goals for the next 12 to 36 months, for example revenue, users or expansion?",
+        "Which specific, measurable targets are you aiming for, and by when?",
+        ('goal', 'target', 'revenue', 'grow*', 'milestone', 'next year', 'by 20*', 'month', 'expan*',
+         'raise', 'raising', 'funding', 'profit*', 'scale', 'scaling', '%', 'million', 'users'),
+        "goals, targets, milestones and growth plans of the business",
+    ),
+    "Target Market and Industry": SectionProfile(
+        "Which market and industry do you operate in, and how large is it? Who are your main competitors?",
+        "What do you know about the size, trends and competition in your market?",
+        ('market', 'industry', 'industries', 'sector', 'competitor', 'competition', 'market size', 'tam',
+         'trend', 'region*', 'country', 'countries', 'india*', 'usa', 'united states', 'america*', 'segment',
+         'billion'),
+        "the market, industry, market size, trends and competitors",
+    ),
+    "Target Customer": SectionProfile(
+        "Who is your target customer: their age, profession, needs, and how much they are willing to pay?",
+        "Can you describe your ideal customer in more detail and what makes them buy from you?",
+        ('customer', 'client', 'user', 'audience', 'persona', 'student', 'learner', 'parent', 'professional',
+         'b2b', 'b2c', 'buyer', 'willing to pay', 'age', 'demographic'),
+        "the target customers, their demographics, needs and willingness to pay",
+    ),
+}
+
+
+class InterviewTracker:
+    """
+    Credits business plan interview answers to the sections they cover, locally.
+
+    Each answer is matched against the sections (keywords, plus embeddings when
+    `embed` is given) and credited to the section that was just asked about, so
+    no model call is needed to tell which part of the interview a section
+    should be written from (see `section_turns`).
+
+    Args:
+        embed (Callable): Optional `embed(text) -> vector` for semantic matching.
+        sections (Sequence[str]): Sections to credit answers to.
+        min_answer_words (int): Answers to the asked section with at least this many
+            words fully cover it; shorter ones count half.
+        keyword_weight (float): Score added per matching keyword.
+        embed_threshold (float): Cosine similarity above which an answer counts toward a section.
+    """
+
+    COVERED = 1.0
+    AMBIGUOUS = 0.5
+
+    def __init__(self,
+                 embed: Callable[[str], Sequence[float]] = None,
+                 sections: Sequence[str] = BUSINESS_PLAN_SECTIONS,
+                 min_answer_words: int = 8,
+                 keyword_weight: float = 0.35,
+                 embed_threshold: float = 0.45):
+        self.embed = embed
+        self.sections = list(sections)
+        self.min_answer_words = min_answer_words
+        self.keyword_weight = keyword_weight
+        self.embed_threshold = embed_threshold
+        self._patterns = {section: [_keyword_pattern(keyword) for keyword in SECTION_PROFILES[section].keywords]
+                          for section in self.sections}
+        self._section_vectors: Optional[Dict[str, Sequence[float]]] = None
+
+    def section_turns(self, conversation_history: List[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Split an interview into the exchanges relevant to each section.
+
+        Each user answer is credited to sections by `credit`, with the section
+        being asked about read from the question before it; a section gets every
+        answer credited to it, each preceded by that question. No model is called.
+
+        Args:
+            conversation_history (List[Dict[str, str]]): The interview, oldest turn first.
+
+        Returns:
+            Dict[str, List[Dict[str, str]]]: Section -> its turns, in conversation order.
+        """
+        turns: Dict[str, List[Dict[str, str]]] = {section: [] for section in self.sections}
+        question, asked = None, None
+        for turn in conversation_history:
+            if turn['role'] != 'user':
+                question, asked = turn, self._asked_section(turn['content'])
+                continue
+            for section in self.credit(turn['content'].strip(), asked):
+                if question is not None:
+                    turns[section].append(question)
+                turns[section].append(turn)
+        return turns
+
+    def credit(self, answer: str, asked: Optional[str] = None) -> Dict[str, float]:
+        """
+        Score each section gains from `answer`, given the section that was asked
+        about; a score of `COVERED` or more means the answer alone covers it.
+
+        Returns:
+            Dict[str, float]: Section -> score, for the sections the answer touches.
+        """
+        if not answer:
+            return {}
+        words = len(answer.split())
+        similarities = self._similarities(answer)
+        credit = {}
+        for section in self.sections:
+            hits = sum(1 for pattern in self._patterns[section] if pattern.search(answer))
+            delta = min(hits * self.keyword_weight, 2 * self.keyword_weight)
+            if section == asked:
+                delta += self.COVERED if words >= self.min_answer_words else self.AMBIGUOUS
+            if similarities and similarities.get(section, 0.0) >= self.embed_threshold:
+                delta += self.AMBIGUOUS
+            if delta > 0:
+                credit[section] = delta
+        return credit
+
+    def _asked_section(self, question: str) -> Optional[str]:
+        """The section a bot message asks about: its template question, else the best keyword match."""
+        for section in self.sections:
+            profile = SECTION_PROFILES[section]
+            if question.strip() in (profile.question, profile.follow_up):
+                return section
+        hits = {section: sum(1 for pattern in self._patterns[section] if pattern.search(question))
+                for section in self.sections}
+        best = max(self.sections, key=lambda section: hits[section])
+        return best if hits[best] else None
+
+    def _similarities(self, answer: str) -> Dict[str, float]:
+        if self.embed is None:
+            return {}
+        try:
+            if self._section_vectors is None:
+                self._section_vectors = {section: self.embed(SECTION_PROFILES[section].description)
+                                         for section in self.sections}
+            vector = self.embed(answer)
+        except Exception as e:
+            logging.warning(f"Embedding failed, matching keywords only: {e}")
+            return {}
+        return {section: _cosine(vector, section_vector) for section, section_vector in self._section_vectors.items()}
+
+
+def _keyword_pattern(keyword: str) -> "re.Pattern":
+    """Match `keyword` as whole words (plurals included), or as a prefix if it ends with "*"."""
+    stem = keyword.rstrip('*')
+    pattern = re.escape(stem)
+    if stem[0].isalnum():
+        pattern = r'\b' + pattern
+    if keyword.endswith('*'):
+        pattern += r'\w*'
+    elif stem[-1].isalnum():
+        pattern += r'(?:s|es)?\b'
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def create_interview_tracker(embed: Callable[[str], Sequence[float]] = None) -> InterviewTracker:
+    """
+    Build the interview tracker from the environment.
+
+    INTERVIEW_SEMANTIC=true also matches answers by embedding (needs `embed`).
+    """
+    semantic = os.getenv('INTERVIEW_SEMANTIC', 'false').lower() == 'true'
+    return InterviewTracker(embed=embed if semantic else None)
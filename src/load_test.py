@@ -0,0 +1,309 @@
+"""
+Load test and latency benchmark for the /whatsapp webhook.
+
+Replays synthetic WhatsApp form posts from many simulated users at a target rate
+against the Flask or ASGI app, with the OpenAI and Twilio APIs replaced by
+in-process fakes (see fakes.py), and reports throughput plus p50/p95/p99 latency
+overall and per request stage. Results are written as JSON so runs can be
+compared; with --baseline the run fails if p95 latency regressed.
+
+Example:
+    python src/load_test.py --users 50 --rate 20 --duration 30 \
+        --run-latency lognormal:3:0.4 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+QUESTIONS = [
+    "How should I price a B2C storytelling course in India?",
+    "How do I raise an angel round for an early stage edtech startup?",
+    "What metrics should I track before claiming product market fit?",
+    "How can I expand my art education platform to the US market?",
+    "Should I hire an inside sales team or rely on events for growth?",
+    "How do I build customer personas for working professionals who want to learn storytelling?",
+    "What is a good go-to-market strategy for a career platform with mentors?",
+    "thanks!",
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of `values` (fraction between 0 and 1)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': 1000 * sum(values) / len(values),
+        'p50_ms': 1000 * percentile(values, 0.50),
+        'p95_ms': 1000 * percentile(values, 0.95),
+        'p99_ms': 1000 * percentile(values, 0.99),
+        'max_ms': 1000 * max(values),
+    }
+
+
+def build_schedule(users: int, rate: float, duration: float, seed: int, retry_rate: float = 0.0,
+                   retry_delay: float = 15.0) -> List[tuple]:
+    """
+    Poisson arrival schedule of (offset seconds, sender, body, message SID) tuples.
+
+    A `retry_rate` fraction of messages is delivered a second time with the same
+    SID, `retry_delay` seconds later, the way Twilio retries a slow webhook.
+    """
+    rng = random.Random(seed)
+    schedule = []
+    offset = 0.0
+    while True:
+        offset += rng.expovariate(rate)
+        if offset >= duration:
+            return sorted(schedule)
+        sender = f"whatsapp:+1555{rng.randrange(users):07d}"
+        message = (sender, rng.choice(QUESTIONS), f"SM{len(schedule):032x}")
+        schedule.append((offset,) + message)
+        if rng.random() < retry_rate:
+            schedule.append((offset + retry_delay,) + message)
+
+
+class Recorder:
+    """Thread-safe collection of per-request results."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.stages: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.empty_acks = 0
+        self.lag: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, stages: Dict[str, float], ok: bool, empty: bool, lag: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.lag.append(lag)
+            for name, seconds in stages.items():
+                self.stages.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors += 1
+            if empty:
+                self.empty_acks += 1
+
+
+def run_flask(schedule: List[tuple], recorder: Recorder, concurrency: int) -> float:
+    import whatsapp_bot
+    from instrumentation import collect_stages, stage
+
+    app = whatsapp_bot.app
+
+    def send(scheduled_at: float, sender: str, body: str, message_sid: str) -> None:
+        lag = time.perf_counter() - scheduled_at
+        client = app.test_client()
+        start = time.perf_counter()
+        with collect_stages() as stages:
+            with stage('request'):
+                response = client.post('/whatsapp', data={'Body': body, 'From': sender, 'MessageSid': message_sid,
+                                                          'To': 'whatsapp:+14155238886'})
+        latency = time.perf_counter() - start
+        text = response.get_data(as_text=True)
+        recorder.record(latency, stages, response.status_code == 200, '<Message>' not in text, lag)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for offset, sender, body, message_sid in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, start + offset, sender, body, message_sid)
+    if whatsapp_bot.reply_dispatcher is not None:
+        whatsapp_bot.reply_dispatcher.join()
+    return time.perf_counter() - start
+
+
+def run_asgi(schedule: List[tuple], recorder: Recorder) -> float:
+    import asgi_bot
+    from instrumentation import collect_stages, stage
+
+    async def main() -> float:
+        client = asgi_bot.app.test_client()
+
+        async def send(scheduled_at: float, sender: str, body: str, message_sid: str) -> None:
+            lag = time.perf_counter() - scheduled_at
+            start = time.perf_counter()
+            with collect_stages() as stages:
+                with stage('request'):
+                    response = await client.post('/whatsapp', form={'Body': body, 'From': sender,
+                                                                   'MessageSid': message_sid,
+                                                                   'To': 'whatsapp:+14155238886'})
+            latency = time.perf_counter() - start
+            text = await response.get_data(as_text=True)
+            recorder.record(latency, stages, response.status_code == 200, '<Message>' not in text, lag)
+
+        start = time.perf_counter()
+        tasks = []
+        for offset, sender, body, message_sid in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(start + offset, sender, body, message_sid)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare_to_baseline(results: dict, baseline_path: str, max_regression: float) -> List[str]:
+    """
+    Compare p95 latencies with a previous results file.
+
+    Returns:
+        List[str]: Descriptions of every metric that regressed by more than `max_regression`.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = []
+    pairs = [('overall', results['latency'], baseline.get('latency', {}))]
+    for name, summary in results['stages'].items():
+        pairs.append((name, summary, baseline.get('stages', {}).get(name, {})))
+    for name, current, previous in pairs:
+        if 'p95_ms' not in current or not previous.get('p95_ms'):
+            continue
+        # Ignore sub-millisecond noise
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression) and current['p95_ms'] - previous['p95_ms'] > 1:
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--users', type=int, default=50, help='number of simulated WhatsApp users')
+    parser.add_argument('--rate', type=float, default=10.0, help='target messages per second')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to send messages for')
+    parser.add_argument('--concurrency', type=int, default=64, help='request threads for the Flask server')
+    parser.add_argument('--run-latency', default='lognormal:2.0:0.4',
+                        help='assistant run / completion latency: fixed:S or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--api-latency', default='lognormal:0.05:0.3', help='latency of other OpenAI calls')
+    parser.add_argument('--twilio-latency', default='fixed:0.08', help='latency of Twilio message sends')
+    parser.add_argument('--upstream-rpm', type=int, default=0,
+                        help='fake OpenAI answers 429 above this many calls per minute (0 disables)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake OpenAI calls failing with 500')
+    parser.add_argument('--retry-rate', type=float, default=0.0,
+                        help='fraction of messages delivered twice with the same MessageSid')
+    parser.add_argument('--retry-delay', type=float, default=15.0, help='seconds before a duplicate delivery')
+    parser.add_argument('--async-replies', action='store_true',
+                        help='acknowledge webhooks at once and send replies through the (fake) Twilio API')
+    parser.add_argument('--twilio-error-rate', type=float, default=0.0,
+                        help='fraction of fake Twilio sends failing with 503')
+    parser.add_argument('--debounce', type=float, default=0.0, help='COALESCE_DEBOUNCE_SECONDS for the run')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='bench_output.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='previous results file to compare p95 latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.15,
+                        help='allowed relative p95 increase over the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.async_replies and args.server == 'asgi':
+        print("--async-replies is only supported by the Flask server")
+        return 2
+
+    # Configure the app before importing it
+    workdir = tempfile.mkdtemp(prefix='whatsapp-load-test-')
+    os.environ.setdefault('OPENAI_API_KEY', 'load-test')
+    os.environ['CONVERSATION_DB_PATH'] = os.path.join(workdir, 'conversations.db')
+    os.environ['COALESCE_DEBOUNCE_SECONDS'] = str(args.debounce)
+    if args.async_replies:
+        os.environ['ASYNC_REPLIES'] = 'true'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.disable(logging.ERROR)
+
+    from fakes import FaultModel, LatencyModel, install_fakes
+
+    fakes = install_fakes(
+        run_latency=LatencyModel.parse(args.run_latency, seed=args.seed),
+        api_latency=LatencyModel.parse(args.api_latency, seed=args.seed + 1),
+        twilio_latency=LatencyModel.parse(args.twilio_latency, seed=args.seed + 2),
+        faults=FaultModel(rpm_limit=args.upstream_rpm, server_error_rate=args.error_rate, seed=args.seed + 3),
+        twilio_failure_rate=args.twilio_error_rate,
+    )
+
+    schedule = build_schedule(args.users, args.rate, args.duration, args.seed, args.retry_rate, args.retry_delay)
+    recorder = Recorder()
+    if args.server == 'asgi':
+        elapsed = run_asgi(schedule, recorder)
+        api_calls = fakes.async_openai.calls
+    else:
+        elapsed = run_flask(schedule, recorder, args.concurrency)
+        api_calls = fakes.openai.calls
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': vars(args),
+        'requests': len(recorder.latencies),
+        'errors': recorder.errors,
+        'empty_acks': recorder.empty_acks,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(recorder.latencies) / elapsed if elapsed else 0.0,
+        'latency': summarize(recorder.latencies),
+        'scheduler_lag': summarize(recorder.lag),
+        'stages': {name: summarize(values) for name, values in sorted(recorder.stages.items())},
+        'openai_calls': api_calls,
+        'twilio_messages': len(fakes.twilio.sent),
+        'twilio_failures': fakes.twilio.failed,
+        'injected_faults': fakes.openai.backend.faults.injected,
+        'duplicate_deliveries': len(schedule) - len({message[3] for message in schedule}),
+    }
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    latency = results['latency']
+    print(f"{results['requests']} requests in {elapsed:.1f}s ({results['throughput_rps']:.1f} req/s), "
+          f"{results['errors']} errors")
+    print(f"latency p50={latency.get('p50_ms', 0):.0f}ms p95={latency.get('p95_ms', 0):.0f}ms "
+          f"p99={latency.get('p99_ms', 0):.0f}ms")
+    for name, summary in results['stages'].items():
+        print(f"  {name:<14} p50={summary['p50_ms']:8.1f}ms p95={summary['p95_ms']:8.1f}ms "
+              f"p99={summary['p99_ms']:8.1f}ms")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        if regressions:
+            print("Latency regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0 if results['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond local work up to slow assistant runs
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+POLL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                                for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram in the Prometheus exposition format.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (Sequence[str]): Label names, e.g. ("stage",).
+        buckets (Sequence[float]): Upper bounds of the buckets, ascending.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        """Return the count and sum observed for one label set."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None:
+                return {'count': 0, 'sum': 0.0}
+            return {'count': series[-2], 'sum': series[-1]}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them for the /metrics endpoint.
+
+    Besides counters and histograms updated on the request path, callers can
+    register gauge callbacks that are read at scrape time (cache sizes, queue
+    depth, ...), so nothing extra runs per request for them.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def gauge_callback(self, name: str, documentation: str,
+                       callback: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        """
+        Register (or replace) a gauge whose samples are produced at scrape time.
+
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            callback (Callable): Returns (labels dict, value) pairs.
+        """
+        with self._lock:
+            self._gauges[name] = (documentation, callback)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, (documentation, callback) in gauges:
+            try:
+                samples = list(callback())
+            except Exception:
+                # A broken collector must not take the whole endpoint down
+                continue
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                names = sorted(labels)
+                lines.append(f'{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram('whatsapp_stage_seconds', 'Time spent in each stage of the request path.',
+                                   ('stage',))
+REQUESTS = REGISTRY.counter('whatsapp_requests_total', 'Webhook requests by outcome.', ('outcome',))
+OPENAI_TOKENS = REGISTRY.counter('openai_tokens_total', 'Tokens reported by the OpenAI API.', ('model', 'kind'))
+RUN_POLLS = REGISTRY.histogram('assistant_run_polls', 'runs.retrieve calls made per assistant run.',
+                               buckets=POLL_BUCKETS)
+
+
+def record_usage(model: str, usage) -> None:
+    """
+    Add the token counts of an API response (a `usage` object or dict) to `openai_tokens_total`.
+
+    Args:
+        model (str): Model or assistant the tokens were spent on.
+        usage: The response's usage; ignored when None.
+    """
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        count = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if count:
+            OPENAI_TOKENS.inc(count, model=model, kind=kind.replace('_tokens', ''))
+
+
+def register_stats(name: str, documentation: str, stats: Callable[[], Dict[str, float]], label: str = 'stat') -> None:
+    """
+    Expose a component's `stats()`-style dict of numbers as one labelled gauge.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        stats (Callable): Returns a dict of numeric values; non-numeric entries are skipped.
+        label (str): Label that carries each dict key.
+    """
+    def collect():
+        for key, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield {label: key}, value
+
+    REGISTRY.gauge_callback(name, documentation, collect)
@@ -0,0 +1,247 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Normalize a prompt for exact-match lookups: lowercase, drop punctuation and
+    collapse whitespace.
+
+    Args:
+        text (str): The prompt.
+
+    Returns:
+        str: The normalized key text.
+    """
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def context_free(conversation_history: List[Dict[str, str]], thread_id: Optional[str]) -> bool:
+    """
+    Whether a turn's answer depends only on the message itself: the conversation
+    has no earlier turns and no assistant thread. Only such turns may be answered
+    from, or stored in, a cache shared by all users.
+    """
+    return not conversation_history and thread_id is None
+
+
+class _Entry(NamedTuple):
+    response: str
+    model: str
+    expires_at: float
+    slot: int
+
+
+class ResponseCache:
+    """
+    Two-tier cache of model responses.
+
+    The exact tier is keyed on the normalized prompt and model. The optional
+    similarity tier embeds each prompt and does a brute-force cosine search over an
+    in-process NumPy matrix, returning a cached answer when the best match for the
+    same model reaches `similarity_threshold`. Both tiers share LRU and TTL eviction.
+    The embedding computed by a missed lookup is kept until the answer is `put`,
+    so each uncached prompt is embedded once.
+
+    Args:
+        embed (Callable): `embed(text) -> Sequence[float]`; None disables the similarity tier.
+        similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+        max_entries (int): Maximum number of cached responses.
+        ttl (float): Seconds a cached response stays valid.
+        min_words (int): Prompts with fewer words are never cached, since short
+            replies ("yes", "tell me more") depend on the conversation.
+        clock (Callable): Monotonic clock, injectable for tests.
+    """
+
+    MAX_MISS_VECTORS = 256
+
+    def __init__(self,
+                 embed: Callable[[str], Sequence[float]] = None,
+                 similarity_threshold: float = 0.93,
+                 max_entries: int = 2048,
+                 ttl: float = 86400.0,
+                 min_words: int = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_words = min_words
+        self.clock = clock
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._vectors: "Optional[np.ndarray]" = None
+        self._slot_keys: List[Optional[tuple]] = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        # prompt -> embedding of recent misses, taken by `put` instead of embedding again
+        self._miss_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def cacheable(self, prompt: str) -> bool:
+        return len(prompt.split()) >= self.min_words
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        """
+        Look up a cached response for the prompt and model.
+
+        Args:
+            prompt (str): The prompt (or user question) being answered.
+            model (str): The model or assistant that would answer it.
+
+        Returns:
+            Optional[str]: The cached response, or None on a miss.
+        """
+        if not self.cacheable(prompt):
+            return None
+        key = (normalize_prompt(prompt), model)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.response
+            if entry is not None:
+                self._remove(key)
+
+        if self.embed is not None:
+            vector = self._embed(prompt)
+            if vector is not None:
+                with self._lock:
+                    match = self._nearest(vector, model, now)
+                    if match is not None:
+                        self._entries.move_to_end(match)
+                        self.semantic_hits += 1
+                        return self._entries[match].response
+                    self._miss_vectors[prompt] = vector
+                    self._miss_vectors.move_to_end(prompt)
+                    if len(self._miss_vectors) > self.MAX_MISS_VECTORS:
+                        self._miss_vectors.popitem(last=False)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, prompt: str, model: str, response: str) -> None:
+        """
+        Cache a response.
+
+        Args:
+            prompt (str): The prompt (or user question) that was answered.
+            model (str): The model or assistant that answered it.
+            response (str): The response to cache.
+        """
+        if not self.cacheable(prompt) or not response:
+            return
+        key = (normalize_prompt(prompt), model)
+        vector = None
+        if self.embed is not None:
+            with self._lock:
+                vector = self._miss_vectors.pop(prompt, None)
+            if vector is None:
+                vector = self._embed(prompt)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            if vector is not None:
+                if self._vectors is None:
+                    import numpy as np
+
+                    self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+            self._entries[key] = _Entry(response, model, self.clock() + self.ttl, slot)
+
+    def stats(self) -> dict:
+        """Hit and miss counters for the cache."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
+
+    def _embed(self, text: str) -> "Optional[np.ndarray]":
+        # numpy is only imported once the cache embeds something, keeping it out of startup
+        import numpy as np
+
+        try:
+            vector = np.asarray(self.embed(text), dtype=np.float32)
+        except Exception as e:
+            logging.error(f"Failed to embed prompt for the response cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _nearest(self, vector: "np.ndarray", model: str, now: float) -> Optional[tuple]:
+        if self._vectors is None or not self._entries:
+            return None
+        import numpy as np
+
+        scores = self._vectors @ vector
+        # Visit candidates from most to least similar, stopping below the threshold
+        for slot in np.argsort(-scores):
+            if scores[slot] < self.similarity_threshold:
+                return None
+            key = self._slot_keys[slot]
+            if key is None:
+                continue
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                self._remove(key)
+                continue
+            if entry.model == model:
+                return key
+        return None
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        self._slot_keys[entry.slot] = None
+        if self._vectors is not None:
+            self._vectors[entry.slot] = 0.0
+        self._free_slots.append(entry.slot)
+
+
+def create_response_cache(embed: Callable[[str], Sequence[float]] = None) -> Optional[ResponseCache]:
+    """
+    Build the response cache if RESPONSE_CACHE_ENABLED is set.
+
+    Args:
+        embed (Callable): Embedding function for the similarity tier; it is only
+            used when RESPONSE_CACHE_SEMANTIC is not "false".
+
+    Returns:
+        Optional[ResponseCache]: The cache, or None when caching is disabled.
+    """
+    if os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() != 'true':
+        return None
+    semantic = os.getenv('RESPONSE_CACHE_SEMANTIC', 'true').lower() == 'true'
+    return ResponseCache(
+        embed=embed if semantic else None,
+        similarity_threshold=float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.93')),
+        max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '2048')),
+        ttl=float(os.getenv('RESPONSE_CACHE_TTL', '86400')),
+    )
@@ -0,0 +1,465 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from metrics import REGISTRY
+
+ROUTES = REGISTRY.counter('router_decisions_total', 'Messages by chosen backend and message class.',
+                          ('route', 'kind'))
+HEDGES = REGISTRY.counter('router_hedges_total', 'Hedged fast-path requests (sent) and which request answered first.',
+                          ('outcome',))
+BACKEND_SECONDS = REGISTRY.histogram('router_backend_seconds', 'Latency of each answering backend.', ('backend',))
+
+# Backends
+ASSISTANT = 'assistant'
+FAST = 'fast'
+
+# Message classes
+TRIVIAL = 'trivial'
+CLARIFICATION = 'clarification'
+MENTOR = 'mentor'
+
+_TRIVIAL = re.compile(
+    r"^(hi|hii+|hello|hey|hola|namaste|good (morning|afternoon|evening|night)|thanks?( you)?( so much| a lot)?|"
+    r"thank u|thx|ty|ok(ay)?|k|cool|great|nice|awesome|perfect|got it|understood|sure|yes|no|yep|nope|"
+    r"bye|see you|cheers)[\s!.,?]*$",
+    re.IGNORECASE,
+)
+_CLARIFICATION = re.compile(
+    r"^(what do you mean|what does .{1,40} mean|can you (explain|clarify|elaborate|repeat|rephrase)|"
+    r"could you (explain|clarify|elaborate|repeat|rephrase)|meaning of|what is an? |what's an? |why\b|"
+    r"how so|for example|example\?|like what|which one|sorry\?)",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def classify_message(message: str, clarification_max_words: int = 12) -> str:
+    """
+    Classify a user message locally, without a model call.
+
+    Returns:
+        str: TRIVIAL (greetings, thanks, acknowledgements, emoji), CLARIFICATION
+        (a short follow-up about the previous answer) or MENTOR (anything else).
+    """
+    text = message.strip()
+    words = _WORD.findall(text)
+    if not words or _TRIVIAL.match(text):
+        return TRIVIAL
+    if len(words) <= clarification_max_words and (_CLARIFICATION.match(text) or
+                                                  (text.endswith('?') and len(words) <= 5)):
+        return CLARIFICATION
+    return MENTOR
+
+
+class RollingLatency:
+    """Latencies of the last `window` calls to one backend, for percentile estimates."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+
+class ModelRouter:
+    """
+    Picks the backend that answers each message.
+
+    Trivial messages and short clarifications go to the fast path, a direct
+    chat completion with a small model. Everything else goes to the primary
+    path, the Assistants run. A primary request that has not answered by its
+    rolling p95 latency (but no sooner than `hedge_min_delay`) gets a hedged
+    request on the fast path, and whichever finishes first answers. The hedge
+    delay counts from when the primary request starts running; one still
+    queued after the delay is hedged right away, and cancelled if the hedge
+    answers before it starts. Hedged requests have their own pool, so a
+    backlog of primary runs never holds up the hedges meant to cover for them.
+
+    The thread must hold the answer the user was sent. A fast-path answer is
+    written into it with `record`; a primary run that lost the hedge is left to
+    finish (a thread accepts no new message while a run is active), and then
+    its reply is replaced by the answer that was sent. The next primary request
+    on that thread waits until this is done.
+
+    Args:
+        primary (Callable): `primary(prompt, thread_id) -> (text, thread_id)`.
+        fast (Callable): `fast(prompt) -> text`.
+        primary_async (Callable): Coroutine variant of `primary`, for `answer_async`.
+        fast_async (Callable): Coroutine variant of `fast`, for `answer_async`.
+        acquire_thread (Callable): Returns a new thread ID, so a hedged new conversation
+            knows its thread even if the fast path answers first.
+        acquire_thread_async (Callable): Coroutine variant of `acquire_thread`.
+        record (Callable): `record(thread_id, answer, question, superseded)` writes an answer
+            sent from the fast path into the thread: `question`, if not None, is added
+            first as the user's message, and `superseded`, if not None, is the reply of
+            the losing primary run, which is removed. Without it threads are not updated.
+        record_async (Callable): Coroutine variant of `record`, for `answer_async`.
+        hedge (bool): Send hedged requests.
+        hedge_min_delay (float): Minimum seconds before hedging.
+        min_samples (int): Primary latencies needed before hedging starts.
+        window (int): Latencies kept per backend.
+        max_workers (int): Threads running primary requests that may be hedged in `answer`.
+        hedge_workers (int): Threads running hedged fast-path requests in `answer`.
+        clarification_max_words (int): Longest message that can count as a clarification.
+    """
+
+    HEDGE_QUANTILE = 0.95
+
+    def __init__(self,
+                 primary: Callable[[str, Optional[str]], Tuple[str, Optional[str]]],
+                 fast: Callable[[str], str],
+                 primary_async: Callable[[str, Optional[str]], Awaitable[Tuple[str, Optional[str]]]] = None,
+                 fast_async: Callable[[str], Awaitable[str]] = None,
+                 acquire_thread: Callable[[], str] = None,
+                 acquire_thread_async: Callable[[], Awaitable[str]] = None,
+                 record: Callable[[str, str, Optional[str], Optional[str]], None] = None,
+                 record_async: Callable[[str, str, Optional[str], Optional[str]], Awaitable[None]] = None,
+                 hedge: bool = True,
+                 hedge_min_delay: float = 2.0,
+                 min_samples: int = 20,
+                 window: int = 200,
+                 max_workers: int = 16,
+                 hedge_workers: int = 4,
+                 clarification_max_words: int = 12):
+        self.primary = primary
+        self.fast = fast
+        self.primary_async = primary_async
+        self.fast_async = fast_async
+        self.acquire_thread = acquire_thread
+        self.acquire_thread_async = acquire_thread_async
+        self.record = record
+        self.record_async = record_async
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.clarification_max_words = clarification_max_words
+        self.latency: Dict[str, RollingLatency] = {ASSISTANT: RollingLatency(window), FAST: RollingLatency(window)}
+        self._primary_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='router')
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='router-hedge')
+        # thread_id -> losing primary request and write of the answer sent instead, still pending
+        self._lagging: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def route(self, message: str) -> Tuple[str, str]:
+        """
+        Returns:
+            Tuple[str, str]: (backend, message class).
+        """
+        kind = classify_message(message, self.clarification_max_words)
+        return (FAST if kind in (TRIVIAL, CLARIFICATION) else ASSISTANT), kind
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for the primary before hedging, or None if hedging is off or not calibrated yet."""
+        latency = self.latency[ASSISTANT]
+        if not self.hedge or latency.count() < self.min_samples:
+            return None
+        return max(self.hedge_min_delay, latency.percentile(self.HEDGE_QUANTILE))
+
+    def answer(self, message: str, prompt: str, thread_id: Optional[str],
+               fast_prompt: Callable[[], str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Answer a message on the backend chosen for it.
+
+        Args:
+            message (str): The user's message, used to classify it.
+            prompt (str): The prompt for the primary path.
+            thread_id (str): The conversation's thread; None for a new conversation.
+            fast_prompt (Callable): Builds the prompt for the fast path, if it must differ
+                from `prompt` (it has no thread, so it needs the history in the prompt).
+                It is only called when the fast path is used.
+
+        Returns:
+            Tuple[str, Optional[str]]: (response text, thread ID to store).
+        """
+        backend, kind = self.route(message)
+        ROUTES.inc(route=backend, kind=kind)
+        fast_prompt = fast_prompt or (lambda: prompt)
+        if backend == FAST:
+            response = self._call_fast(fast_prompt)
+            self._settle(thread_id, prompt, response)
+            return response, thread_id
+
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._call_primary(prompt, thread_id)
+        if thread_id is None and self.acquire_thread is not None:
+            thread_id = self.acquire_thread()
+
+        primary, started = self._start_primary(prompt, thread_id, delay)
+        if not started or not wait([primary], timeout=delay).done:
+            return self._hedge(primary, prompt, fast_prompt, thread_id)
+        return primary.result()
+
+    async def answer_async(self, message: str, prompt: str, thread_id: Optional[str],
+                           fast_prompt: Callable[[], Awaitable[str]] = None) -> Tuple[str, Optional[str]]:
+        """
+        Coroutine variant of `answer`, using `primary_async` and `fast_async`;
+        `fast_prompt` is a coroutine function.
+        """
+        backend, kind = self.route(message)
+        ROUTES.inc(route=backend, kind=kind)
+        if fast_prompt is None:
+            async def fast_prompt() -> str:
+                return prompt
+        if backend == FAST:
+            response = await self._call_fast_async(fast_prompt)
+            self._settle_async(thread_id, prompt, response)
+            return response, thread_id
+
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._call_primary_async(prompt, thread_id)
+        if thread_id is None and self.acquire_thread_async is not None:
+            thread_id = await self.acquire_thread_async()
+
+        primary = asyncio.ensure_future(self._call_primary_async(prompt, thread_id))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        HEDGES.inc(outcome='sent')
+        fast = asyncio.ensure_future(self._call_fast_async(fast_prompt))
+        pending = {primary, fast}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is fast:
+                    self._settle_async(thread_id, prompt, task.result(), primary)
+                    HEDGES.inc(outcome=FAST)
+                    return task.result(), thread_id
+                HEDGES.inc(outcome=ASSISTANT)
+                for other in pending:
+                    other.cancel()
+                return task.result()
+        raise error
+
+    def stats(self) -> dict:
+        stats = {}
+        for backend, latency in self.latency.items():
+            stats[f'{backend}_samples'] = latency.count()
+            p95 = latency.percentile(self.HEDGE_QUANTILE)
+            if p95 is not None:
+                stats[f'{backend}_p95_seconds'] = p95
+        delay = self.hedge_delay()
+        if delay is not None:
+            stats['hedge_delay_seconds'] = delay
+        with self._lock:
+            stats['lagging_runs'] = len(self._lagging)
+        return stats
+
+    def _hedge(self, primary: Future, prompt: str, fast_prompt: Callable[[], str],
+               thread_id: Optional[str]) -> Tuple[str, Optional[str]]:
+        HEDGES.inc(outcome='sent')
+        fast = self._submit(self._hedge_executor, self._call_fast, fast_prompt)
+        pending = {primary, fast}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is fast:
+                    self._settle(thread_id, prompt, future.result(), primary)
+                    HEDGES.inc(outcome=FAST)
+                    return future.result(), thread_id
+                HEDGES.inc(outcome=ASSISTANT)
+                # A hedge still queued behind other hedges is no longer needed
+                fast.cancel()
+                return future.result()
+        raise error
+
+    def _start_primary(self, prompt: str, thread_id: Optional[str], delay: float) -> Tuple[Future, bool]:
+        """
+        Submit a primary request and wait, at most `delay` seconds, for a worker to
+        start running it.
+
+        Returns:
+            Tuple[Future, bool]: (the request, whether it has started).
+        """
+        started = threading.Event()
+
+        def run() -> Tuple[str, Optional[str]]:
+            started.set()
+            return self._call_primary(prompt, thread_id)
+
+        primary = self._submit(self._primary_executor, run)
+        return primary, started.wait(delay)
+
+    def _call_primary(self, prompt: str, thread_id: Optional[str]) -> Tuple[str, Optional[str]]:
+        with self._lock:
+            lagging = self._lagging.get(thread_id)
+        if lagging is not None:
+            # A thread accepts no new message while a run is active on it
+            wait([lagging])
+        return self._timed(ASSISTANT, self.primary, prompt, thread_id)
+
+    async def _call_primary_async(self, prompt: str, thread_id: Optional[str]) -> Tuple[str, Optional[str]]:
+        with self._lock:
+            lagging = self._lagging.get(thread_id)
+        if lagging is not None:
+            await asyncio.wait({lagging})
+        return await self._timed_async(ASSISTANT, self.primary_async(prompt, thread_id))
+
+    def _settle(self, thread_id: Optional[str], prompt: str, answer: str, primary: Future = None) -> None:
+        """
+        Write a fast-path answer into the thread in the background, after the
+        losing `primary` request, if any, has finished or been cancelled.
+        """
+        if thread_id is None or (self.record is None and primary is None):
+            return
+        with self._lock:
+            previous = self._lagging.get(thread_id)
+        # A primary request still queued is dropped before it touches the thread
+        running = primary is not None and not primary.cancel()
+
+        def write() -> None:
+            if previous is not None:
+                wait([previous])
+            question, superseded = prompt, None
+            if running:
+                wait([primary])
+                question, superseded = None, self._superseded(thread_id, primary.exception(), primary.result)
+            if self.record is None:
+                return
+            try:
+                self.record(thread_id, answer, question, superseded)
+            except Exception as e:
+                logging.warning(f"Could not record the fast-path answer on thread {thread_id}: {e}")
+
+        self._track(thread_id, self._submit(self._primary_executor, write))
+
+    def _settle_async(self, thread_id: Optional[str], prompt: str, answer: str, primary: asyncio.Task = None) -> None:
+        """Coroutine variant of `_settle`; the primary run is awaited, not cancelled."""
+        if thread_id is None or (self.record_async is None and primary is None):
+            return
+        with self._lock:
+            previous = self._lagging.get(thread_id)
+
+        async def write() -> None:
+            if previous is not None:
+                await asyncio.wait({previous})
+            question, superseded = prompt, None
+            if primary is not None:
+                await asyncio.wait({primary})
+                if primary.cancelled():
+                    return
+                question, superseded = None, self._superseded(thread_id, primary.exception(), primary.result)
+            if self.record_async is None:
+                return
+            try:
+                await self.record_async(thread_id, answer, question, superseded)
+            except Exception as e:
+                logging.warning(f"Could not record the fast-path answer on thread {thread_id}: {e}")
+
+        self._track(thread_id, asyncio.ensure_future(write()))
+
+    @staticmethod
+    def _superseded(thread_id: str, error: Optional[BaseException], result: Callable) -> Optional[str]:
+        if error is not None:
+            logging.warning(f"Run on thread {thread_id} failed after the fast path answered: {error}")
+            return None
+        return result()[0]
+
+    def _track(self, thread_id: str, write) -> None:
+        with self._lock:
+            self._lagging[thread_id] = write
+
+        def finished(done) -> None:
+            with self._lock:
+                if self._lagging.get(thread_id) is done:
+                    del self._lagging[thread_id]
+
+        write.add_done_callback(finished)
+
+    def _call_fast(self, fast_prompt: Callable[[], str]) -> str:
+        return self._timed(FAST, self.fast, fast_prompt())
+
+    async def _call_fast_async(self, fast_prompt: Callable[[], Awaitable[str]]) -> str:
+        return await self._timed_async(FAST, self.fast_async(await fast_prompt()))
+
+    def _submit(self, executor: ThreadPoolExecutor, func: Callable, *args) -> Future:
+        # Carry the request's stage collector over to the worker thread
+        return executor.submit(contextvars.copy_context().run, func, *args)
+
+    def _timed(self, backend: str, func: Callable, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._observe(backend, time.perf_counter() - started)
+
+    async def _timed_async(self, backend: str, call: Awaitable):
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            self._observe(backend, time.perf_counter() - started)
+
+    def _observe(self, backend: str, seconds: float) -> None:
+        self.latency[backend].observe(seconds)
+        BACKEND_SECONDS.observe(seconds, backend=backend)
+
+
+def create_model_router() -> Optional[ModelRouter]:
+    """
+    Build the model router if ROUTER_ENABLED is set, or return None.
+
+    ROUTER_FAST_MODEL (default gpt-4o-mini) answers on the fast path; ROUTER_HEDGE=false
+    turns off hedged requests; ROUTER_HEDGE_MIN_SECONDS and ROUTER_MIN_SAMPLES bound
+    when hedging starts; ROUTER_LATENCY_WINDOW sets how many latencies are kept per backend;
+    ROUTER_WORKERS and ROUTER_HEDGE_WORKERS size the thread pools for primary and hedged requests.
+    """
+    if os.getenv('ROUTER_ENABLED', 'false').lower() != 'true':
+        return None
+    from async_utils import query_chatgpt_assistant_async, query_chatgpt_async, record_assistant_exchange_async
+    from clients import get_async_openai_client
+    from threads import get_thread_manager
+    from utils import query_chatgpt, query_chatgpt_assistant, record_assistant_exchange
+
+    fast_model = os.getenv('ROUTER_FAST_MODEL', 'gpt-4o-mini')
+
+    async def fast_async(prompt: str) -> str:
+        return await query_chatgpt_async(prompt, model=fast_model)
+
+    return ModelRouter(
+        primary=lambda prompt, thread_id: query_chatgpt_assistant(prompt, thread_id=thread_id),
+        fast=lambda prompt: query_chatgpt(prompt, model=fast_model),
+        primary_async=lambda prompt, thread_id: query_chatgpt_assistant_async(prompt, thread_id=thread_id),
+        fast_async=fast_async,
+        acquire_thread=lambda: get_thread_manager().acquire(),
+        acquire_thread_async=lambda: get_thread_manager().acquire_async(get_async_openai_client()),
+        record=record_assistant_exchange,
+        record_async=record_assistant_exchange_async,
+        hedge=os.getenv('ROUTER_HEDGE', 'true').lower() == 'true',
+        hedge_min_delay=float(os.getenv('ROUTER_HEDGE_MIN_SECONDS', '2.0')),
+        min_samples=int(os.getenv('ROUTER_MIN_SAMPLES', '20')),
+        window=int(os.getenv('ROUTER_LATENCY_WINDOW', '200')),
+        max_workers=int(os.getenv('ROUTER_WORKERS', '16')),
+        hedge_workers=int(os.getenv('ROUTER_HEDGE_WORKERS', '4')),
+    )
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, NamedTuple, Optional
+
+from instrumentation import stage
+from metrics import RUN_POLLS
+
+# Statuses after which an Assistants run will not change again.
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'expired', 'requires_action', 'incomplete'}
+
+
+def _leaves_run_active(status: Optional[str]) -> bool:
+    """
+    Whether a run we stop waiting for in `status` still holds its thread: it has
+    not finished, or it waits for tool outputs we never submit (requires_action).
+    A thread accepts no new message until such a run is cancelled or expires.
+    """
+    return status not in TERMINAL_STATUSES or status == 'requires_action'
+
+
+def _cancel_run(client, thread_id: str, run_id: str) -> None:
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        logging.warning(f"Failed to cancel run {run_id}: {e}")
+
+
+async def _acancel_run(client, thread_id: str, run_id: str) -> None:
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        logging.warning(f"Failed to cancel run {run_id}: {e}")
+
+
+class RunFailedError(Exception):
+    """
+    Raised when an assistant run ends in any terminal status other than "completed".
+    """
+
+    def __init__(self, status: str, run_id: str, last_error=None):
+        self.status = status
+        self.run_id = run_id
+        self.last_error = last_error
+        super().__init__(f"Run {run_id} ended with status '{status}': {last_error}")
+
+
+class RunTimeoutError(RunFailedError):
+    """
+    Raised when a run has not reached a terminal status before the deadline.
+    """
+
+    def __init__(self, run_id: str, deadline: float):
+        super().__init__('timeout', run_id, f"no terminal status after {deadline:.1f}s")
+
+
+class RunOutcome(NamedTuple):
+    """
+    Result of waiting for an assistant run.
+
+    Attributes:
+        run_id (str): The run identifier.
+        status (str): Final run status (always "completed" when returned).
+        polls (int): Number of `runs.retrieve` calls made while waiting.
+        text (Optional[str]): The assistant's reply when the strategy already
+            received it (streaming); None if it still has to be fetched.
+        usage (Any): Token usage reported for the run, if any.
+    """
+    run_id: str
+    status: str
+    polls: int
+    text: Optional[str] = None
+    usage: Any = None
+
+
+class _CompletionStats:
+    """Thread-safe running totals of how many polls each reply took."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.polls = 0
+        self.max_polls = 0
+
+    def record(self, polls: int) -> None:
+        with self._lock:
+            self.runs += 1
+            self.polls += polls
+            self.max_polls = max(self.max_polls, polls)
+        RUN_POLLS.observe(polls)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            average = self.polls / self.runs if self.runs else 0.0
+            return {'runs': self.runs, 'polls': self.polls, 'max_polls': self.max_polls,
+                    'avg_polls': average}
+
+
+class BackoffPollingStrategy:
+    """
+    Waits for a run by polling `runs.retrieve` with exponential backoff and jitter,
+    giving up once an overall deadline has passed. A run that times out or stops
+    in requires_action is cancelled, so it does not hold its thread.
+
+    Args:
+        initial_delay (float): Seconds to wait before the first poll.
+        max_delay (float): Upper bound for a single wait.
+        multiplier (float): Growth factor applied to the delay after each poll.
+        jitter (float): Fraction of each delay to randomize (0.2 means +/-20%).
+        deadline (float): Seconds after run creation to give up and cancel the run.
+        sleep (Callable): Sleep function, injectable for tests.
+        clock (Callable): Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self,
+                 initial_delay: float = 0.3,
+                 max_delay: float = 2.0,
+                 multiplier: float = 1.6,
+                 jitter: float = 0.2,
+                 deadline: float = 90.0,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.sleep = sleep
+        self.clock = clock
+        self.stats = _CompletionStats()
+
+    def delays(self) -> Iterator[float]:
+        """Yield successive jittered wait times."""
+        delay = self.initial_delay
+        while True:
+            spread = delay * self.jitter
+            yield max(0.0, delay + random.uniform(-spread, spread))
+            delay = min(self.max_delay, delay * self.multiplier)
+
+    def run(self, client, thread_id: str, assistant_id: str) -> RunOutcome:
+        """
+        Start a run on the thread and block until it reaches a terminal status.
+
+        Args:
+            client: The OpenAI client.
+            thread_id (str): Thread to run the assistant on.
+            assistant_id (str): The assistant to run.
+
+        Returns:
+            RunOutcome: The completed run.
+
+        Raises:
+            RunFailedError: If the run ends in a non-completed terminal status.
+            RunTimeoutError: If the deadline passes first.
+        """
+        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        deadline_at = self.clock() + self.deadline
+        delays = self.delays()
+        polls = 0
+
+        while run.status not in TERMINAL_STATUSES:
+            remaining = deadline_at - self.clock()
+            if remaining <= 0:
+                _cancel_run(client, thread_id, run.id)
+                self.stats.record(polls)
+                raise RunTimeoutError(run.id, self.deadline)
+            self.sleep(min(next(delays), remaining))
+            with stage('assistant.poll'):
+                run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            polls += 1
+
+        self.stats.record(polls)
+        if run.status != 'completed':
+            if _leaves_run_active(run.status):
+                _cancel_run(client, thread_id, run.id)
+            raise RunFailedError(run.status, run.id, getattr(run, 'last_error', None))
+        return RunOutcome(run.id, run.status, polls, usage=getattr(run, 'usage', None))
+
+    async def run_async(self, client, thread_id: str, assistant_id: str) -> RunOutcome:
+        """
+        Async variant of `run` for an AsyncOpenAI client; waits with `asyncio.sleep`
+        so the event loop keeps serving other conversations.
+        """
+        run = await client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        deadline_at = self.clock() + self.deadline
+        delays = self.delays()
+        polls = 0
+
+        while run.status not in TERMINAL_STATUSES:
+            remaining = deadline_at - self.clock()
+            if remaining <= 0:
+                await _acancel_run(client, thread_id, run.id)
+                self.stats.record(polls)
+                raise RunTimeoutError(run.id, self.deadline)
+            await asyncio.sleep(min(next(delays), remaining))
+            with stage('assistant.poll'):
+                run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            polls += 1
+
+        self.stats.record(polls)
+        if run.status != 'completed':
+            if _leaves_run_active(run.status):
+                await _acancel_run(client, thread_id, run.id)
+            raise RunFailedError(run.status, run.id, getattr(run, 'last_error', None))
+        return RunOutcome(run.id, run.status, polls, usage=getattr(run, 'usage', None))
+
+
+def iter_run_deltas(client, thread_id: str, assistant_id: str, result: dict = None,
+                    deadline: float = None) -> Iterator[str]:
+    """
+    Start a streaming run and yield the reply's text deltas as they arrive.
+
+    A run the stream leaves active (it stopped early, failed, passed the
+    deadline or requires action) is cancelled, so it does not hold its thread.
+
+    Args:
+        client: The OpenAI client.
+        thread_id (str): Thread to run the assistant on.
+        assistant_id (str): The assistant to run.
+        result (dict): Optional dict that receives the final "run_id", "status" and "usage".
+        deadline (float): Seconds to wait for the run to finish; None waits as long as events arrive.
+
+    Yields:
+        str: Each text delta of the assistant's message.
+
+    Raises:
+        RunFailedError: If the run ends in a non-completed terminal status.
+        RunTimeoutError: If the deadline passes first.
+    """
+    run_id, status, last_error, usage = None, None, None, None
+    deadline_at = time.monotonic() + deadline if deadline is not None else None
+    # The deadline also bounds each read, so a silent stream cannot wait forever
+    options = {'timeout': deadline} if deadline is not None else {}
+
+    try:
+        with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, **options) as stream:
+            for event in stream:
+                if event.event == 'thread.message.delta':
+                    for content in event.data.delta.content or []:
+                        text = getattr(content, 'text', None)
+                        if text is not None and text.value:
+                            yield text.value
+                elif event.event.startswith('thread.run.') and not event.event.startswith('thread.run.step'):
+                    run_id = event.data.id
+                    status = event.data.status
+                    last_error = getattr(event.data, 'last_error', None)
+                    usage = getattr(event.data, 'usage', None)
+                    if status in TERMINAL_STATUSES:
+                        break
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    break
+    except Exception:
+        if run_id is not None and _leaves_run_active(status):
+            _cancel_run(client, thread_id, run_id)
+        raise
+
+    if result is not None:
+        result.update(run_id=run_id, status=status, usage=usage)
+    if status != 'completed':
+        if run_id is not None and _leaves_run_active(status):
+            _cancel_run(client, thread_id, run_id)
+        if status not in TERMINAL_STATUSES and deadline_at is not None and time.monotonic() >= deadline_at:
+            raise RunTimeoutError(run_id, deadline)
+        raise RunFailedError(status or 'unknown', run_id, last_error)
+
+
+async def aiter_run_deltas(client, thread_id: str, assistant_id: str, result: dict = None,
+                           deadline: float = None) -> AsyncIterator[str]:
+    """
+    Async variant of `iter_run_deltas` for an AsyncOpenAI client.
+    """
+    run_id, status, last_error, usage = None, None, None, None
+    deadline_at = time.monotonic() + deadline if deadline is not None else None
+    options = {'timeout': deadline} if deadline is not None else {}
+
+    try:
+        async with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id,
+                                                   **options) as stream:
+            async for event in stream:
+                if event.event == 'thread.message.delta':
+                    for content in event.data.delta.content or []:
+                        text = getattr(content, 'text', None)
+                        if text is not None and text.value:
+                            yield text.value
+                elif event.event.startswith('thread.run.') and not event.event.startswith('thread.run.step'):
+                    run_id = event.data.id
+                    status = event.data.status
+                    last_error = getattr(event.data, 'last_error', None)
+                    usage = getattr(event.data, 'usage', None)
+                    if status in TERMINAL_STATUSES:
+                        break
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    break
+    except Exception:
+        if run_id is not None and _leaves_run_active(status):
+            await _acancel_run(client, thread_id, run_id)
+        raise
+
+    if result is not None:
+        result.update(run_id=run_id, status=status, usage=usage)
+    if status != 'completed':
+        if run_id is not None and _leaves_run_active(status):
+            await _acancel_run(client, thread_id, run_id)
+        if status not in TERMINAL_STATUSES and deadline_at is not None and time.monotonic() >= deadline_at:
+            raise RunTimeoutError(run_id, deadline)
+        raise RunFailedError(status or 'unknown', run_id, last_error)
+
+
+class StreamingRunStrategy:
+    """
+    Starts the run in streaming mode and consumes server-sent events instead of
+    polling, collecting the reply text from the message deltas as they arrive.
+    Like polling, it gives up at the deadline and cancels the run.
+
+    Args:
+        deadline (float): Seconds after the run starts to give up and cancel it.
+    """
+
+    def __init__(self, deadline: float = 90.0):
+        self.deadline = deadline
+        self.stats = _CompletionStats()
+
+    def run(self, client, thread_id: str, assistant_id: str) -> RunOutcome:
+        """
+        Start a streaming run and block until its terminal event.
+
+        Args:
+            client: The OpenAI client.
+            thread_id (str): Thread to run the assistant on.
+            assistant_id (str): The assistant to run.
+
+        Returns:
+            RunOutcome: The completed run, with the reply in `text`.
+
+        Raises:
+            RunFailedError: If the run ends in a non-completed terminal status.
+            RunTimeoutError: If the deadline passes first.
+        """
+        result = {}
+        try:
+            text = ''.join(iter_run_deltas(client, thread_id, assistant_id, result, self.deadline))
+        finally:
+            self.stats.record(0)
+        return RunOutcome(result['run_id'], result['status'], 0, text, result.get('usage'))
+
+    async def run_async(self, client, thread_id: str, assistant_id: str) -> RunOutcome:
+        """Async variant of `run` for an AsyncOpenAI client."""
+        result = {}
+        parts = []
+        try:
+            async for delta in aiter_run_deltas(client, thread_id, assistant_id, result, self.deadline):
+                parts.append(delta)
+        finally:
+            self.stats.record(0)
+        return RunOutcome(result['run_id'], result['status'], 0, ''.join(parts), result.get('usage'))
+
+
+def create_completion_strategy(mode: str = None):
+    """
+    Build the completion strategy named by `mode` (or the RUN_COMPLETION_MODE env var).
+
+    Args:
+        mode (str): "poll" (default) for backoff polling or "stream" for event streaming.
+
+    Returns:
+        A strategy exposing `run(client, thread_id, assistant_id) -> RunOutcome`.
+    """
+    mode = (mode or os.getenv('RUN_COMPLETION_MODE', 'poll')).lower()
+    deadline = float(os.getenv('RUN_DEADLINE_SECONDS', '90'))
+    if mode == 'stream':
+        return StreamingRunStrategy(deadline=deadline)
+    return BackoffPollingStrategy(deadline=deadline)
@@ -0,0 +1,174 @@
+"""
+Cold start benchmark for the Flask and ASGI apps.
+
+Starts fresh Python processes and measures, for each, how long importing the app
+takes, how long the first /whatsapp request takes after that, and the total
+from process start to the first response. The OpenAI and Twilio APIs are
+replaced by instant in-process fakes (see fakes.py), so only the app's own
+startup cost is measured. The median over --runs processes is reported together
+with the packages that spend the most time importing. Results are written as
+JSON; with --baseline the run fails if a median regressed.
+
+Example:
+    python src/startup_bench.py --server asgi --runs 7 --output startup.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from load_test import git_revision
+
+METRICS = ('import_s', 'first_response_s', 'process_s')
+
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_child(server: str) -> dict:
+    """Import the app and send it one message; called in the benchmarked process."""
+    workdir = tempfile.mkdtemp(prefix='whatsapp-startup-')
+    os.environ.setdefault('OPENAI_API_KEY', 'startup-bench')
+    os.environ['CONVERSATION_DB_PATH'] = os.path.join(workdir, 'conversations.db')
+    os.environ['COALESCE_DEBOUNCE_SECONDS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.disable(logging.ERROR)
+
+    from fakes import LatencyModel, install_fakes
+
+    instant = LatencyModel.parse('fixed:0')
+    install_fakes(run_latency=instant, api_latency=instant, twilio_latency=instant, storage_latency=instant)
+    form = {'Body': 'How should I price a B2C storytelling course in India?', 'From': 'whatsapp:+15550000001',
+            'MessageSid': 'SM' + '0' * 32, 'To': 'whatsapp:+14155238886'}
+
+    start = time.perf_counter()
+    if server == 'asgi':
+        import asyncio
+
+        import asgi_bot
+        imported = time.perf_counter()
+
+        async def first_request() -> int:
+            response = await asgi_bot.app.test_client().post('/whatsapp', form=form)
+            return response.status_code
+
+        status = asyncio.run(first_request())
+    else:
+        import whatsapp_bot
+        imported = time.perf_counter()
+        status = whatsapp_bot.app.test_client().post('/whatsapp', data=form).status_code
+    finished = time.perf_counter()
+    return {'import_s': imported - start, 'first_response_s': finished - imported, 'status': status}
+
+
+def measure(server: str, warmup: bool) -> dict:
+    """Run one benchmarked process and time it from spawn to exit."""
+    env = dict(os.environ, WARMUP_ENABLED='true' if warmup else 'false')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--server', server],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return result
+
+
+def import_profile(server: str, top: int) -> List[Dict[str, float]]:
+    """
+    Import the app once under `-X importtime` and total the self time of each
+    top-level package.
+
+    Returns:
+        List[Dict[str, float]]: The `top` slowest packages, slowest first.
+    """
+    app = 'asgi_bot' if server == 'asgi' else 'whatsapp_bot'
+    env = dict(os.environ, WARMUP_ENABLED='false', OPENAI_API_KEY=os.getenv('OPENAI_API_KEY', 'startup-bench'))
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {app}'], env=env, check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+    packages: Dict[str, int] = {}
+    for match in _IMPORT_TIME.finditer(stderr):
+        package = match.group(4).split('.')[0]
+        packages[package] = packages.get(package, 0) + int(match.group(1))
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{'package': package, 'ms': micros / 1000} for package, micros in slowest]
+
+
+def compare_to_baseline(results: dict, baseline_path: str, max_regression: float) -> List[str]:
+    """
+    Compare median startup times with a previous results file.
+
+    Returns:
+        List[str]: Descriptions of every metric that regressed by more than `max_regression`.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = []
+    for name in METRICS:
+        current, previous = results['median'][name], baseline.get('median', {}).get(name)
+        if not previous:
+            continue
+        # Ignore differences below 10ms, which are mostly scheduling noise
+        if current > previous * (1 + max_regression) and current - previous > 0.01:
+            regressions.append(f"{name}: {previous * 1000:.0f}ms -> {current * 1000:.0f}ms")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh processes to time')
+    parser.add_argument('--no-warmup', action='store_true', help='run with WARMUP_ENABLED=false')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest packages to report')
+    parser.add_argument('--output', default='startup_output.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='previous results file to compare median times against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed relative increase over the baseline')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_child(args.server)))
+        return 0
+
+    runs = [measure(args.server, not args.no_warmup) for _ in range(args.runs)]
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {name: value for name, value in vars(args).items() if name != 'child'},
+        'errors': sum(1 for run in runs if run['status'] != 200),
+        'median': {name: statistics.median(run[name] for run in runs) for name in METRICS},
+        'runs': runs,
+        'slowest_imports': import_profile(args.server, args.top),
+    }
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    median = results['median']
+    print(f"{args.server}: import {median['import_s'] * 1000:.0f}ms, "
+          f"first response {median['first_response_s'] * 1000:.0f}ms, "
+          f"process {median['process_s'] * 1000:.0f}ms (median of {args.runs})")
+    for entry in results['slowest_imports']:
+        print(f"  {entry['package']:<24} {entry['ms']:8.1f}ms")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        if regressions:
+            print("Startup regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0 if results['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import re
+import time
+from typing import Iterable, Iterator, List
+
+from delivery import WHATSAPP_BODY_LIMIT, _is_continuation, text_units
+
+# End of a sentence: terminal punctuation (optionally closed by a quote or
+# bracket) followed by whitespace.
+_SENTENCE_END = re.compile(r'[.!?…]["\')\]]*\s')
+
+
+class MessageChunker:
+    """
+    Turns a stream of text deltas into WhatsApp-sized messages, emitting each one
+    as soon as it ends on a paragraph boundary.
+
+    A chunk is released once the buffer holds a paragraph break after at least
+    `min_length` characters. If the buffer grows past `max_length` without one,
+    it is cut at the last sentence boundary, then the last whitespace, and only
+    as a last resort mid-word. Lengths are counted in UTF-16 code units, like
+    Twilio's body limit (see `delivery.text_units`).
+
+    Args:
+        max_length (int): Maximum UTF-16 code units per message.
+        min_length (int): Minimum characters before a paragraph break releases a message,
+            so short headings are not sent on their own.
+    """
+
+    def __init__(self, max_length: int = WHATSAPP_BODY_LIMIT, min_length: int = 80):
+        self.max_length = max_length
+        self.min_length = min_length
+        self._buffer = ''
+        self._scan_from = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        Add a text delta and return any messages it completed.
+
+        Args:
+            delta (str): The next piece of streamed text.
+
+        Returns:
+            List[str]: Completed messages, possibly empty.
+        """
+        self._buffer += delta
+        ready = []
+        while True:
+            chunk = self._take_ready()
+            if chunk is None:
+                return ready
+            if chunk:
+                ready.append(chunk)
+
+    def flush(self) -> List[str]:
+        """Return whatever text remains once the stream has ended."""
+        remaining = self._buffer.strip()
+        self._buffer = ''
+        self._scan_from = 0
+        if not remaining:
+            return []
+        chunks = []
+        while text_units(remaining) > self.max_length:
+            cut = self._cut_point(remaining)
+            chunks.append(remaining[:cut].strip())
+            remaining = remaining[cut:].strip()
+        if remaining:
+            chunks.append(remaining)
+        return chunks
+
+    def _take_ready(self):
+        # Only look at text that arrived since the last scan (minus the
+        # separator length, in case it straddles two deltas).
+        start = max(self.min_length, self._scan_from - 1)
+        fit = self._fitting(self._buffer)
+        paragraph = self._buffer.find('\n\n', start, fit + 1)
+        if paragraph != -1:
+            return self._pop(paragraph + 2)
+        if fit < len(self._buffer):
+            return self._pop(self._cut_point(self._buffer))
+        self._scan_from = len(self._buffer)
+        return None
+
+    def _fitting(self, text: str) -> int:
+        """Number of leading characters of `text` that fit in `max_length` code units."""
+        units = 0
+        for index, char in enumerate(text):
+            units += text_units(char)
+            if units > self.max_length:
+                return index
+        return len(text)
+
+    def _cut_point(self, text: str) -> int:
+        fit = self._fitting(text)
+        window = text[:fit + 1]
+        paragraph = window.rfind('\n\n')
+        if paragraph >= self.min_length:
+            return paragraph + 2
+        last_sentence = -1
+        for match in _SENTENCE_END.finditer(window):
+            last_sentence = match.end()
+        if last_sentence >= self.min_length:
+            return last_sentence
+        space = window.rfind(' ', 0, fit)
+        if space > 0:
+            return space + 1
+        cut = max(1, fit)
+        # Never separate a character from a following combining mark, variation
+        # selector, joiner or skin tone modifier.
+        while 1 < cut < len(text) and _is_continuation(text[cut]):
+            cut -= 1
+        return cut
+
+    def _pop(self, end: int) -> str:
+        chunk = self._buffer[:end].strip()
+        self._buffer = self._buffer[end:]
+        self._scan_from = 0
+        return chunk
+
+
+def stream_chunks(deltas: Iterable[str], chunker: MessageChunker = None) -> Iterator[str]:
+    """
+    Yield WhatsApp messages from a stream of text deltas as soon as each is complete.
+
+    Args:
+        deltas (Iterable[str]): Streamed text pieces (e.g. model token deltas).
+        chunker (MessageChunker): Chunker to use; a default one is created if None.
+
+    Yields:
+        str: Each completed message.
+    """
+    chunker = chunker or MessageChunker()
+    for delta in deltas:
+        for chunk in chunker.feed(delta):
+            yield chunk
+    for chunk in chunker.flush():
+        yield chunk
+
+
+def fake_delta_stream(text: str, delta_size: int = 4, delay: float = 0.0) -> Iterator[str]:
+    """
+    Yield `text` in small pieces, optionally sleeping between them, to stand in
+    for a model stream in tests and benchmarks.
+
+    Args:
+        text (str): The full text to stream.
+        delta_size (int): Characters per delta.
+        delay (float): Seconds to sleep before each delta.
+
+    Yields:
+        str: The next delta.
+    """
+    for i in range(0, len(text), delta_size):
+        if delay:
+            time.sleep(delay)
+        yield text[i:i + delta_size]
@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from clients import get_openai_client
+from instrumentation import stage
+from metrics import REGISTRY
+
+THREADS_ACQUIRED = REGISTRY.counter('assistant_threads_acquired_total',
+                                    'Threads handed to new conversations, by source.', ('source',))
+
+
+class ThreadManager:
+    """
+    Owns the lifecycle of Assistants threads.
+
+    New conversations take a thread from a small pool of threads created ahead
+    of time, so their first message does not wait on `threads.create`. A daemon
+    worker refills the pool after each acquire and, when a conversation store
+    is attached, periodically deletes threads whose conversation has been idle
+    for `idle_ttl` seconds and detaches them from the conversation, so the next
+    message starts a fresh thread (the history stays in the store).
+
+    Args:
+        pool_size (int): Number of empty threads kept ready; 0 disables the pool.
+        idle_ttl (float): Seconds without a new turn after which a conversation's thread is deleted.
+        sweep_interval (float): Seconds between idle-thread sweeps.
+        store: Conversation store providing `idle_threads` and `clear_thread`; without it
+            nothing is swept.
+        client: OpenAI client used by the worker; defaults to the shared one.
+    """
+
+    SWEEP_BATCH = 100
+
+    def __init__(self, pool_size: int = 2, idle_ttl: float = 7 * 86400, sweep_interval: float = 3600.0,
+                 store=None, client=None):
+        self.pool_size = pool_size
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.store = store
+        self.client = client
+        # (thread_id, created_at) of empty threads ready to be handed out
+        self._pool: Deque[Tuple[str, float]] = deque()
+        # Pooled threads that outlived idle_ttl, deleted by the worker
+        self._stale: List[str] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.expired_threads = 0
+
+    def attach_store(self, store) -> None:
+        """Sweep idle threads of conversations kept in `store` once the worker runs."""
+        self.store = store
+
+    def start(self) -> None:
+        """Start the refill/sweep worker, if it is not running; acquiring a thread also starts it."""
+        if self._worker is not None or (self.pool_size <= 0 and self.store is None):
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='thread-manager', daemon=True)
+                self._worker.start()
+
+    def acquire(self) -> str:
+        """
+        Return a new, empty thread for a conversation, from the pool if one is ready.
+
+        Returns:
+            str: The thread ID.
+        """
+        thread_id = self._take()
+        if thread_id is None:
+            with stage('assistant.thread_create'):
+                thread_id = self._client().beta.threads.create().id
+            logging.info(f"New thread created with ID: {thread_id}")
+        return thread_id
+
+    async def acquire_async(self, client) -> str:
+        """Async variant of `acquire`; `client` creates the thread when the pool is empty."""
+        thread_id = self._take()
+        if thread_id is None:
+            with stage('assistant.thread_create'):
+                thread = await client.beta.threads.create()
+            thread_id = thread.id
+            logging.info(f"New thread created with ID: {thread_id}")
+        return thread_id
+
+    def expire_idle(self) -> int:
+        """
+        Delete the threads of conversations idle for longer than `idle_ttl`.
+
+        A thread is detached from its conversation before it is deleted, and only
+        if it is still the conversation's thread and the conversation has not been
+        written to since the sweep found it, so a conversation that became active
+        again in the meantime keeps it. A run still in flight on a deleted thread
+        cannot attach it again (see `append_turns`).
+
+        Returns:
+            int: Number of threads deleted.
+        """
+        if self.store is None:
+            return 0
+        expired = 0
+        for conversation_id, thread_id, version in self.store.idle_threads(self.idle_ttl, self.SWEEP_BATCH):
+            if not self.store.clear_thread(conversation_id, thread_id, version):
+                continue
+            if self._delete(thread_id):
+                expired += 1
+        if expired:
+            with self._lock:
+                self.expired_threads += expired
+            logging.info(f"Deleted {expired} idle assistant threads")
+        return expired
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'pooled': len(self._pool), 'pool_size': self.pool_size, 'expired': self.expired_threads}
+
+    def close(self) -> None:
+        """
+        Stop the worker and delete the threads still in the pool. Pooled threads
+        belong to no conversation, so the idle sweep can never find them: the
+        apps call this on shutdown.
+        """
+        self._stopped.set()
+        self._wake.set()
+        with self._lock:
+            pooled = [thread_id for thread_id, _ in self._pool] + self._stale
+            self._pool.clear()
+            self._stale = []
+        for thread_id in pooled:
+            self._delete(thread_id)
+
+    def _take(self) -> Optional[str]:
+        self.start()
+        thread_id = None
+        with self._lock:
+            while self._pool:
+                candidate, created_at = self._pool.popleft()
+                # Never hand out a pooled thread the sweeper would consider stale
+                if time.time() - created_at < self.idle_ttl:
+                    thread_id = candidate
+                    break
+                self._stale.append(candidate)
+        THREADS_ACQUIRED.inc(source='pool' if thread_id is not None else 'create')
+        self._wake.set()
+        return thread_id
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with self._lock:
+                    stale, self._stale = self._stale, []
+                for thread_id in stale:
+                    self._delete(thread_id)
+                self._refill()
+                if self.store is not None and time.monotonic() >= self._next_sweep:
+                    self._next_sweep = time.monotonic() + self.sweep_interval
+                    self.expire_idle()
+            except Exception as e:
+                logging.warning(f"Thread manager maintenance failed: {e}")
+                # Back off rather than spin against a failing API
+                self._stopped.wait(5.0)
+            timeout = max(0.0, self._next_sweep - time.monotonic()) if self.store is not None else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _refill(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                if len(self._pool) >= self.pool_size:
+                    return
+            thread_id = self._client().beta.threads.create().id
+            with self._lock:
+                if not self._stopped.is_set():
+                    self._pool.append((thread_id, time.time()))
+                    continue
+            # Closed while the thread was being created
+            self._delete(thread_id)
+            return
+
+    def _delete(self, thread_id: str) -> bool:
+        try:
+            self._client().beta.threads.delete(thread_id)
+            return True
+        except Exception as e:
+            # Already gone (404) or transiently failing; either way it is no longer referenced
+            logging.warning(f"Could not delete thread {thread_id}: {e}")
+            return False
+
+    def _client(self):
+        return self.client or get_openai_client()
+
+
+def fetch_run_reply(client, thread_id: str, run_id: str) -> str:
+    """
+    Fetch the assistant message written by one run: only the newest message of
+    that run is requested, instead of paging through the whole thread.
+
+    Returns:
+        str: The message text, or "" if the run wrote none.
+    """
+    with stage('assistant.list'):
+        messages = client.beta.threads.messages.list(thread_id=thread_id, limit=1, order='desc', run_id=run_id)
+    return _reply_text(messages)
+
+
+async def afetch_run_reply(client, thread_id: str, run_id: str) -> str:
+    """Async variant of `fetch_run_reply`."""
+    with stage('assistant.list'):
+        messages = await client.beta.threads.messages.list(thread_id=thread_id, limit=1, order='desc',
+                                                           run_id=run_id)
+    return _reply_text(messages)
+
+
+def _reply_text(messages) -> str:
+    for msg in messages.data:
+        if msg.role == "assistant" and msg.content:
+            return msg.content[0].text.value
+    return ""
+
+
+_manager: Optional[ThreadManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_thread_manager() -> ThreadManager:
+    """
+    Return the process-wide thread manager, created on first use from
+    THREAD_POOL_SIZE, THREAD_IDLE_TTL_SECONDS and THREAD_SWEEP_INTERVAL_SECONDS.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ThreadManager(pool_size=int(os.getenv('THREAD_POOL_SIZE', '2')),
+                                     idle_ttl=float(os.getenv('THREAD_IDLE_TTL_SECONDS', str(7 * 86400))),
+                                     sweep_interval=float(os.getenv('THREAD_SWEEP_INTERVAL_SECONDS', '3600')))
+        return _manager
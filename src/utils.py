@@ -1,19 +1,20 @@
 import logging
 import os
 import sys
-from typing import Dict, List
-import openai
-
-from google.cloud import storage
-from docx import Document
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from clients import get_openai_client, get_storage_client
 from constants import MENTOR_BOT_PROMPT
+from delivery import WHATSAPP_BODY_LIMIT, pack_message
+from documents import render_business_plan
+from instrumentation import stage, timed
+from metrics import record_usage
+from run_completion import create_completion_strategy, iter_run_deltas
+from threads import fetch_run_reply, get_thread_manager
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-
-# Initialize OpenAI API
-client = openai
-client.api_key = OPENAI_API_KEY
+ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID', "asst_xUtTiMSkYXGo0zidNvUpWJ38")
 
 logging.basicConfig(format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
                     datefmt="%Y-%m-%d:%H:%M:%S",
@@ -22,32 +23,92 @@ logging.basicConfig(format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:
 
 conversation_history: List[Dict[str, str]] = []  # Store all exchanges
 
+# Strategy used to wait for assistant runs (backoff polling or streaming)
+completion_strategy = create_completion_strategy()
+
 def query_chatgpt(prompt: str,
-                  model="gpt-4o-mini") -> str:
+                  model="gpt-4o-mini",
+                  system_prompt: str = MENTOR_BOT_PROMPT,
+                  cache=None) -> str:
     """
     Calls the OpenAI ChatGPT API with the given prompt and returns the response.
 
     Parameters:
     prompt (str): The prompt to send to the ChatGPT API.
+    system_prompt (str): The system message; defaults to the mentor persona.
+    cache (ResponseCache): Optional response cache consulted before calling the API.
 
     Returns:
     str: The response from the ChatGPT API.
     "gpt-4o-2024-05-13"
     """
+    if cache is not None:
+        cached = cache.get(prompt, model)
+        if cached is not None:
+            return cached
+    client = get_openai_client()
     try:
         response = client.chat.completions.create(
             model=model,
             stream=False,
             messages=[
-                {"role": "system", "content": MENTOR_BOT_PROMPT},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7
         )
         # logging.info(f"response: {response} with type {type(response)}")
     except Exception as e:
-        logging.error(f"Failed to query ChatGPT: {e}")    
-    return response.choices[0].message.content.strip()
+        logging.error(f"Failed to query ChatGPT: {e}")
+        raise
+    record_usage(model, getattr(response, 'usage', None))
+    answer = response.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(prompt, model, answer)
+    return answer
+
+
+def embed_text(text: str, model: str = "text-embedding-3-small") -> List[float]:
+    """
+    Embeds text with the OpenAI embeddings API.
+
+    Parameters:
+    text (str): The text to embed.
+    model (str): The embedding model.
+
+    Returns:
+    List[float]: The embedding vector.
+    """
+    response = get_openai_client().embeddings.create(model=model, input=text)
+    record_usage(model, getattr(response, 'usage', None))
+    return response.data[0].embedding
+
+
+def query_chatgpt_stream(prompt: str,
+                         model="gpt-4o-mini",
+                         system_prompt: str = MENTOR_BOT_PROMPT) -> Iterator[str]:
+    """
+    Calls the OpenAI ChatGPT API in streaming mode and yields the response text as it is generated.
+
+    Parameters:
+    prompt (str): The prompt to send to the ChatGPT API.
+    system_prompt (str): The system message; defaults to the mentor persona.
+
+    Yields:
+    str: Each text delta of the response.
+    """
+    stream = get_openai_client().chat.completions.create(
+        model=model,
+        stream=True,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
 
 def create_prompt_business_plan(past_responses: List[Dict[str, str]]) -> str:
@@ -86,20 +147,26 @@ def format_conversation_history(conversation_history):
     return formatted_history    
 
 
+@timed('create_prompt_mentor_bot')
 def create_prompt_mentor_bot(past_responses: List[Dict[str, str]],
-                             current_question) -> str:
+                             current_question,
+                             summary: str = "") -> str:
     """
     Creates a prompt for ChatGPT to determine the next question to ask the user
     based on their previous responses and the sections of a business plan.
 
     Parameters:
     past_responses (List[Dict[str, str]]): List containing user's previous responses.
+    current_question (str): The message being answered.
+    summary (str): Optional summary of turns older than `past_responses`.
 
     Returns:
     str: The formatted prompt for querying ChatGPT.
     """
 
     formatted_history = format_conversation_history(past_responses)
+    if summary:
+        formatted_history = f"Summary of earlier conversation: {summary}\n{formatted_history}"
 
     prompt = (
     "You are MentorGPT, an Entrepreneurship Mentor with over 20 years of experience guiding entrepreneurs.\n"
@@ -112,6 +179,27 @@ def create_prompt_mentor_bot(past_responses: List[Dict[str, str]],
 
     return prompt
 
+def summarize_conversation(previous_summary: str, turns: List[Dict[str, str]]) -> str:
+    """
+    Folds conversation turns into a running summary.
+
+    Parameters:
+    previous_summary (str): The summary so far ('' if none).
+    turns (List[Dict[str, str]]): Turns to add to the summary, oldest first.
+
+    Returns:
+    str: The updated summary.
+    """
+    prompt = (
+    "Update the running summary of a mentoring conversation with an entrepreneur.\n"
+    "Keep every fact about the founder, their business, numbers, decisions and open questions. "
+    "Use at most 150 words.\n"
+    f"Current summary:\n{previous_summary or '(none)'}\n"
+    f"New turns:\n{format_conversation_history(turns)}"
+    )
+    return query_chatgpt(prompt, system_prompt="You summarize conversations concisely and accurately.")
+
+
 def update_conversation_history(user_input: str, assistant_response: str) -> None:
     """
     Updates the conversation history with the latest user input and assistant's response.
@@ -129,6 +217,16 @@ def update_conversation_history(user_input: str, assistant_response: str) -> Non
         'content': assistant_response
     })
 
+# Sections of a generated business plan, in document order
+BUSINESS_PLAN_SECTIONS = [
+    "Business Description",
+    "Business Mission",
+    "Business goals",
+    "Target Market and Industry",
+    "Target Customer",
+]
+
+
 def create_prompt_generate_business_plan(conversation_history: List[Dict[str, str]]) -> str:
     prompt = f"""
     You are an expert at creating a business plan. Based on the below list of previous responses
@@ -147,6 +245,31 @@ def create_prompt_generate_business_plan(conversation_history: List[Dict[str, st
     return prompt
 
 
+def create_prompt_business_plan_section(section: str, conversation_history: List[Dict[str, str]]) -> str:
+    """
+    Creates a prompt for a single section of the business plan.
+
+    The conversation comes first, so when every section is given the whole
+    history (the default section context) the requests for all sections share
+    the same prompt prefix.
+
+    Parameters:
+    section (str): One of BUSINESS_PLAN_SECTIONS.
+    conversation_history (List[Dict[str, str]]): The interview so far.
+
+    Returns:
+    str: The formatted prompt for querying ChatGPT.
+    """
+    prompt = (
+    "You are an expert at creating a business plan. Below are the previous responses from the user.\n"
+    f"Previous responses from user:\n{format_conversation_history(conversation_history)}\n"
+    f"Write only the \"{section}\" section of a detailed business plan based on these responses. "
+    "Do not repeat the section title and do not write any other section."
+    )
+    return prompt
+
+
+@timed('upload_file_to_gcs')
 def upload_file_to_gcs(file_name: str, bucket_name: str, blob_name: str = None) -> str:
     """
     Uploads a file to Google Cloud Storage and returns the public URL.
@@ -160,8 +283,8 @@ def upload_file_to_gcs(file_name: str, bucket_name: str, blob_name: str = None)
     - str: The public URL of the uploaded file.
     """
     try:
-        # Initialize the Google Cloud Storage client
-        storage_client = storage.Client()
+        # Reuse the shared Google Cloud Storage client
+        storage_client = get_storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(blob_name or os.path.basename(file_name))
 
@@ -177,119 +300,160 @@ def upload_file_to_gcs(file_name: str, bucket_name: str, blob_name: str = None)
         logging.error(f"Failed to upload {file_name} to GCS: {e}")
         return None
     
-def generate_business_plan_document(business_plan: str, file_format: str = 'docx') -> str:
+def generate_business_plan_document(business_plan: str, file_format: str = 'docx', file_name: str = None) -> str:
     """
     Generate a business plan document and save it as a file.
 
+    The bot itself renders and uploads documents in memory (see documents.DocumentPipeline);
+    this is for scripts that need a local copy.
+
     Parameters:
     - business_plan (str): The business plan content.
     - file_format (str): The format to save the file in ('txt' or 'docx').
+    - file_name (str): Where to save it. Defaults to a new unique file in the temp directory,
+      so concurrent calls never overwrite each other.
 
     Returns:
     - str: The path to the saved file.
     """
-    file_name = f"business_plan_agricollect.{file_format}"
+    file_format = 'docx' if file_format == 'docx' else 'txt'
+    document = render_business_plan(business_plan, file_format, title='AgriCollect Business Plan')
 
-    if file_format == 'docx':
-        # Create a Word document
-        doc = Document()
-        doc.add_heading('AgriCollect Business Plan', 0)
-        doc.add_paragraph(business_plan)
-
-        # Save the document
-        doc.save(file_name)
-    else:
-        # Save as plain text
-        with open(file_name, 'w') as file:
-            file.write(business_plan)
+    if file_name is None:
+        fd, file_name = tempfile.mkstemp(prefix='business_plan_', suffix=f'.{file_format}')
+        os.close(fd)
+    with open(file_name, 'wb') as file:
+        file.write(document.buffer.getvalue())
 
     return file_name
 
 
-def split_message(message, max_length=1000):
+def split_message(message, max_length=WHATSAPP_BODY_LIMIT):
     """
-    Splits a message into chunks of a specified maximum length. Adds "..." to the end of each chunk 
-    (except the last) to indicate continuation.
+    Splits a message into as few WhatsApp messages as possible, breaking only at
+    paragraph or sentence boundaries. See `delivery.pack_message`.
 
     Args:
         message (str): The message to be split.
-        max_length (int): The maximum allowed length for each chunk (default is 1000 characters).
+        max_length (int): The maximum length of each message (default is the WhatsApp body limit).
 
     Returns:
-        list of str: A list of message chunks, each within the character limit.
+        list of str: The messages, each within the limit.
     """
+    return pack_message(message, max_length)
 
-    # Split message into chunks of `max_length`
-    chunks = [message[i:i + max_length] for i in range(0, len(message), max_length)]
-    
-    # Add "..." to all chunks except the last one to indicate continuation
-    for i in range(len(chunks) - 1):
-        chunks[i] += "..."
-    
-    return chunks
 
 
-
-def query_chatgpt_assistant(question: str, assistant_id: str = "asst_xUtTiMSkYXGo0zidNvUpWJ38", thread_id: str = None) -> (str, str):
+def query_chatgpt_assistant(question: str, assistant_id: str = ASSISTANT_ID, thread_id: str = None,
+                            strategy=None) -> (str, str):
     """
     Query a custom assistant using OpenAI's client by creating a message in a thread,
-    running the assistant, and retrieving the response. If no thread exists, a new one
-    is created.
+    running the assistant, and retrieving the response. If no thread exists, one is
+    taken from the thread manager's pool of pre-created threads.
 
     Args:
-        client (OpenAIClient): The OpenAI client instance.
         question (str): The question or prompt to send to the assistant.
         assistant_id (str): The unique identifier for the custom assistant created on OpenAI.
         thread_id (str): Optional existing thread ID for the conversation. If None, a new thread is created.
+        strategy: Optional completion strategy used to wait for the run. Defaults to the
+            module-wide `completion_strategy`.
 
     Returns:
         tuple: (assistant's response, thread ID used in the interaction)
 
     Raises:
+        RunFailedError: If the run ends as failed, cancelled, expired, incomplete,
+            requires_action, or does not finish before the deadline.
         Exception: If an error occurs during message creation, assistant run, or message retrieval.
     """
+    strategy = strategy or completion_strategy
+    client = get_openai_client()
     try:
-        # Create a new thread if one doesn't exist
+        # Start the conversation on a pre-created thread if it has none
         if thread_id is None:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-            logging.info(f"New thread created with ID: {thread_id}")
+            thread_id = get_thread_manager().acquire()
 
         # Add the user's message to the thread
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=question
-        )
-
-        # Run the assistant on the specified thread
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
-
-        # Poll the run status until the assistant completes processing
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
+        with stage('assistant.message_create'):
+            client.beta.threads.messages.create(
                 thread_id=thread_id,
-                run_id=run.id
+                role="user",
+                content=question
             )
-            
-            if run_status.status == 'completed':
-                # Retrieve assistant's response
-                messages = client.beta.threads.messages.list(
-                    thread_id=thread_id
-                )
-
-                assistant_response = ""
-                for msg in messages.data:
-                    if msg.role == "assistant":
-                        content = msg.content[0].text.value
-                        assistant_response = f"{content}\n"
-                        break
-
-                return assistant_response, thread_id
+
+        # Run the assistant and wait for a terminal status
+        with stage('assistant.run'):
+            outcome = strategy.run(client, thread_id, assistant_id)
+        logging.info(f"Run {outcome.run_id} completed after {outcome.polls} polls")
+        record_usage(assistant_id, outcome.usage)
+
+        if outcome.text is not None:
+            return f"{outcome.text}\n", thread_id
+
+        # Retrieve only the message this run wrote
+        content = fetch_run_reply(client, thread_id, outcome.run_id)
+        return (f"{content}\n" if content else ""), thread_id
 
     except Exception as e:
         logging.error(f"Error querying the assistant: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def query_chatgpt_assistant_stream(question: str, assistant_id: str = ASSISTANT_ID,
+                                   thread_id: str = None) -> Tuple[Iterator[str], str]:
+    """
+    Query a custom assistant like `query_chatgpt_assistant`, but stream the run and
+    return the response as an iterator of text deltas.
+
+    The thread and the user's message are created before returning, so the thread ID
+    is available immediately; the run itself starts when the iterator is consumed.
+
+    Args:
+        question (str): The question or prompt to send to the assistant.
+        assistant_id (str): The unique identifier for the custom assistant created on OpenAI.
+        thread_id (str): Optional existing thread ID for the conversation. If None, a new thread is created.
+
+    Returns:
+        tuple: (iterator of response text deltas, thread ID used in the interaction)
+    """
+    client = get_openai_client()
+    if thread_id is None:
+        thread_id = get_thread_manager().acquire()
+
+    client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="user",
+        content=question
+    )
+    return iter_run_deltas(client, thread_id, assistant_id), thread_id
+
+
+def record_assistant_exchange(thread_id: str, answer: str, question: str = None, superseded: str = None) -> None:
+    """
+    Write an answer the user was sent from outside the assistant (the router's
+    fast path) into the conversation's thread, so later runs see what was said.
+
+    Args:
+        thread_id (str): The conversation's thread.
+        answer (str): The answer that was sent.
+        question (str): Prompt added first as the user's message; None if the thread already has it.
+        superseded (str): Reply of a run the user was not sent; it is deleted if it is
+            the thread's newest message.
+    """
+    client = get_openai_client()
+    if superseded is not None:
+        messages = client.beta.threads.messages.list(thread_id=thread_id, limit=1, order='desc')
+        stale = _superseded_message(messages, superseded)
+        if stale is not None:
+            client.beta.threads.messages.delete(stale, thread_id=thread_id)
+    if question is not None:
+        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=question)
+    client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=answer)
+
+
+def _superseded_message(messages, superseded: str) -> Optional[str]:
+    """ID of the newest message if it is the assistant reply `superseded`, else None."""
+    for msg in messages.data:
+        if msg.role == "assistant" and msg.content and msg.content[0].text.value.strip() == superseded.strip():
+            return msg.id
+    return None
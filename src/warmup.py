@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from instrumentation import stage
+
+_started = False
+_lock = threading.Lock()
+# Seconds each warm-up step took, for /metrics
+timings: Dict[str, float] = {}
+
+
+def _openai() -> None:
+    from clients import get_openai_client
+
+    get_openai_client()
+
+
+def _async_openai() -> None:
+    from clients import get_async_openai_client
+
+    get_async_openai_client()
+
+
+def _twilio() -> None:
+    from clients import get_twilio_client
+
+    get_twilio_client()
+
+
+def _storage() -> None:
+    from clients import get_storage_client
+
+    get_storage_client()
+
+
+def _documents() -> None:
+    import docx  # noqa: F401
+
+
+def _assistant_threads() -> None:
+    from threads import get_thread_manager
+
+    get_thread_manager().start()
+
+
+def warmup_steps(async_server: bool = False) -> List[Tuple[str, Callable[[], None]]]:
+    """
+    The warm-up steps that apply to this deployment, most urgent first.
+
+    The OpenAI client is needed by the first message; the Twilio client only for
+    out-of-band replies; Cloud Storage and python-docx only for document exports.
+    """
+    steps = [('openai', _async_openai if async_server else _openai)]
+    if async_server:
+        # The thread pool is refilled with the synchronous client
+        steps.append(('openai_sync', _openai))
+    steps.append(('assistant_threads', _assistant_threads))
+    if os.getenv('ASYNC_REPLIES', 'false').lower() == 'true' or os.getenv('TWILIO_ACCOUNT_SID'):
+        steps.append(('twilio', _twilio))
+    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        steps.append(('storage', _storage))
+    steps.append(('documents', _documents))
+    return steps
+
+
+def warm_up(async_server: bool = False) -> Dict[str, float]:
+    """
+    Import the heavy dependencies and build the shared clients now, instead of
+    on the first request that needs them. A failing step is logged and skipped.
+
+    Returns:
+        Dict[str, float]: Seconds taken by each step that succeeded.
+    """
+    for name, step in warmup_steps(async_server):
+        started = time.perf_counter()
+        try:
+            with stage(f'warmup.{name}'):
+                step()
+        except Exception as e:
+            logging.warning(f"Warm-up step {name} failed: {e}")
+            continue
+        timings[name] = time.perf_counter() - started
+    logging.info("Warm-up finished: " + ", ".join(f"{name} {seconds * 1000:.0f}ms"
+                                                    for name, seconds in timings.items()))
+    return dict(timings)
+
+
+def start_warmup(async_server: bool = False, delay: float = None) -> Optional[threading.Thread]:
+    """
+    Run `warm_up` once per process on a daemon thread, after `delay` seconds
+    (WARMUP_DELAY_SECONDS, default 0) so the server can open its port first.
+    Disabled with WARMUP_ENABLED=false.
+
+    Returns:
+        Optional[threading.Thread]: The warm-up thread, or None if it was already started or is disabled.
+    """
+    global _started
+    if _started:
+        return None
+    with _lock:
+        if _started:
+            return None
+        _started = True
+    if os.getenv('WARMUP_ENABLED', 'true').lower() != 'true':
+        return None
+    delay = float(os.getenv('WARMUP_DELAY_SECONDS', '0')) if delay is None else delay
+
+    def run() -> None:
+        if delay > 0:
+            time.sleep(delay)
+        warm_up(async_server)
+
+    thread = threading.Thread(target=run, name='warmup', daemon=True)
+    thread.start()
+    return thread
@@ -1,34 +1,87 @@
-from flask import Flask, request, session
-from flask_session import Session
+from flask import Flask, Response, request
+import atexit
 import logging
 import os
+import threading
 from twilio.twiml.messaging_response import MessagingResponse
-from typing import Dict, List
-from utils import query_chatgpt_assistant, create_prompt_mentor_bot, split_message
+from typing import Dict, Iterator, List
+from coalescer import MessageCoalescer, create_conversation_leases
+from conversation_context import create_context_window
+from conversation_store import create_conversation_store
+from admission import UpstreamUnavailableError
+from dispatcher import ReplyDispatcher, ReplyJob, create_sender
+from business_plan import get_business_plan_generator
+from delivery import PacedSender, create_paced_sender, pack_message
+from documents import get_document_pipeline
+from idempotency import create_webhook_deduplicator
+from instrumentation import configure_logging, payload, stage
+from metrics import CONTENT_TYPE, REGISTRY, REQUESTS, register_stats
+from response_cache import context_free, create_response_cache
+from router import create_model_router
+from run_completion import RunFailedError
+from threads import get_thread_manager
+import warmup
+from streaming import MessageChunker, stream_chunks
+from utils import (query_chatgpt_assistant, query_chatgpt_assistant_stream, create_prompt_mentor_bot,
+                   summarize_conversation, embed_text, completion_strategy)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
+# Hand log records to a background thread so request threads never block on log I/O
+configure_logging()
 
 # Flask app configuration
 app = Flask(__name__)
-app.config['SESSION_TYPE'] = 'filesystem'
-app.secret_key = 'secret_key1'  # Replace with a strong secret key
-Session(app)
-GCS_BUCKET_NAME = "hbs_foundry_demo2"
+GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', "hbs_foundry_demo2")
 
+# Out-of-band reply mode: acknowledge Twilio immediately and send the answer
+# through the REST messages API from a background worker pool.
+ASYNC_REPLIES = os.getenv('ASYNC_REPLIES', 'false').lower() == 'true'
+REPLY_WORKERS = int(os.getenv('REPLY_WORKERS', '4'))
+REPLY_QUEUE_SIZE = int(os.getenv('REPLY_QUEUE_SIZE', '100'))
+QUEUE_FULL_MESSAGE = "We're receiving a lot of messages right now. Please try again in a minute."
+# Sent without storing the turn when OpenAI is throttled or failing
+DEGRADED_MESSAGE = ("Sorry, I'm having trouble answering right now because of high demand. "
+                    "Please send your message again in a few minutes.")
+# In out-of-band mode, stream the assistant run and send each paragraph as soon as it is complete
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', 'false').lower() == 'true'
+# Messages from one sender arriving within this many seconds of each other are
+# answered as a single turn (0 only serializes them). Off by default when the reply
+# goes back in the webhook response, where any wait eats into Twilio's 15s budget.
+COALESCE_DEBOUNCE_SECONDS = float(os.getenv('COALESCE_DEBOUNCE_SECONDS', '1.0' if ASYNC_REPLIES else '0'))
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv('COALESCE_MAX_WAIT_SECONDS', '4.0'))
 
-# Flag to track if the function has already run
-setup_done = False
+# Conversation history and thread IDs, keyed on the sender's number
+conversation_store = create_conversation_store()
+# Pre-created threads for new conversations; idle threads are swept against the store
+thread_manager = get_thread_manager()
+thread_manager.attach_store(conversation_store)
+# Pooled threads are in no conversation, so only this deletes them when the worker exits
+atexit.register(thread_manager.close)
+# Token-budgeted history (recent turns + running summary) for each prompt
+context_window = create_context_window(conversation_store, summarize_conversation)
+# Opt-in exact + semantic cache of mentor answers (RESPONSE_CACHE_ENABLED)
+response_cache = create_response_cache(embed_text)
+ASSISTANT_CACHE_KEY = "mentor-assistant"
+# Sends trivial messages to the fast model and hedges slow assistant runs (ROUTER_ENABLED)
+model_router = create_model_router()
+
+# Twilio retries slow webhooks; deliveries are deduplicated on MessageSid
+webhook_deduplicator = create_webhook_deduplicator(ack_response=str(MessagingResponse()))
+
+reply_dispatcher = None
+_dispatcher_lock = threading.Lock()
+# Paced sender shared by async replies and document links, so one recipient's
+# messages are spaced and rate limited together
+paced_sender = None
+_sender_lock = threading.Lock()
 
 @app.before_request
-def setup_once():
-    global setup_done
-    if not setup_done:
-        # Run your one-time setup code here
-        session.clear()  # Clear session when the server starts
-        setup_done = True  # Ensure this block runs only once
-        logging.info("Initial setup done, session cleared.")
+def start_background_warmup() -> None:
+    # Under a WSGI server the first request is the earliest sign the port is open
+    warmup.start_warmup()
+
 
 @app.route('/whatsapp', methods=['POST'])
 def whatsapp_bot() -> str:
@@ -42,64 +95,112 @@ def whatsapp_bot() -> str:
     Returns:
         str: The TwiML XML response to be sent to the Twilio API.
     """
+    with stage('webhook'):
+        response, duplicate = webhook_deduplicator.handle(request.form.get('MessageSid'), _whatsapp_bot)
+        if duplicate:
+            REQUESTS.inc(outcome='duplicate')
+        return response
+
+
+def _whatsapp_bot() -> str:
     incoming_msg = request.form.get('Body')
     from_number = request.form.get('From')
 
-    logging.info(f"Received message from {from_number}: {incoming_msg}")
-
-    # Retrieve or initialize conversation history and thread ID
-    conversation_history = session.get('conversation_history', [])
-    thread_id = session.get('thread_id')  # Check if a thread ID exists
+    logging.info(f"Received message from {from_number}: {payload(incoming_msg)}")
 
     resp = MessagingResponse()
-    
+
+    if incoming_msg and ASYNC_REPLIES:
+        job = ReplyJob(from_number=from_number, to_number=request.form.get('To'), body=incoming_msg)
+        if get_reply_dispatcher().submit(job):
+            REQUESTS.inc(outcome='queued')
+        else:
+            REQUESTS.inc(outcome='queue_full')
+            resp.message(QUEUE_FULL_MESSAGE)
+        return str(resp)
+
     if incoming_msg:
         logging.info("Attempting to create a response to the received message...")
         
-        # Generate a response, create a new thread if none exists
-        response_text, updated_conversation_history, thread_id = handle_message(
-            incoming_msg, conversation_history, thread_id
-        )
-        logging.info(f"Response created: {response_text} of length {len(response_text)}")
-
-        split_responses = split_message(response_text)
-        for split_response in split_responses:
-            msg = resp.message()
-            msg.body(split_response)
+        # Followers of an in-progress turn for this sender get an empty response;
+        # their message is answered together with the leader's.
+        replies = message_coalescer.submit(from_number, incoming_msg)
+        REQUESTS.inc(outcome='replied' if replies else 'coalesced')
+        for response_text in replies:
+            logging.info(f"Response created: {payload(response_text)}")
 
-        # Update session with conversation history and thread ID
-        session['conversation_history'] = updated_conversation_history
-        session['thread_id'] = thread_id
+            with stage('pack_message'):
+                split_responses = pack_message(response_text)
+            for split_response in split_responses:
+                msg = resp.message()
+                msg.body(split_response)
     else:
         logging.info("No valid message received. Sending default error response.")
+        REQUESTS.inc(outcome='invalid')
         msg = resp.message("I couldn't understand that. Please try again.")
-    
-    return str(resp)
 
+    with stage('twiml'):
+        return str(resp)
 
-def handle_message(message: str, conversation_history: List[Dict[str, str]], thread_id: str):
+
+@app.route('/metrics', methods=['GET'])
+def metrics() -> Response:
+    """Prometheus scrape endpoint: stage latencies, token usage, poll counts, cache and queue stats."""
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+
+def handle_message(message: str, conversation_history: List[Dict[str, str]], thread_id: str,
+                   conversation_id: str = None):
     """
     Process the incoming message, query ChatGPT, and return a response along with updated conversation history.
 
     Args:
-        client (OpenAIClient): The OpenAI client instance.
         message (str): The user's message text.
         conversation_history (List[Dict[str, str]]): List of previous exchanges.
         thread_id (str): Existing thread ID; None if it's a new conversation.
+        conversation_id (str): Key of the conversation, used to cache its running summary.
 
     Returns:
         tuple: (response text, updated conversation history, thread ID)
     """
+    with stage('handle_message'):
+        return _handle_message(message, conversation_history, thread_id, conversation_id)
+
+
+def _handle_message(message: str, conversation_history: List[Dict[str, str]], thread_id: str,
+                    conversation_id: str = None):
+    # Serve repeated opening questions from the response cache when it is enabled; later
+    # answers depend on the user's history, so they are neither served from it nor stored
+    cacheable = response_cache is not None and context_free(conversation_history, thread_id)
+    cached = response_cache.get(message, ASSISTANT_CACHE_KEY) if cacheable else None
+    if cached is not None:
+        logging.info("Answered from the response cache")
+        conversation_history.append({'role': 'user', 'content': message})
+        conversation_history.append({'role': 'assistant', 'content': cached})
+        return cached, conversation_history, thread_id
+
+    prompt = build_mentor_prompt(message, conversation_history, thread_id, conversation_id)
+
     # Add user message to conversation history
     conversation_history.append({'role': 'user', 'content': message})
 
-    # Create prompt for the assistant
-    prompt = create_prompt_mentor_bot(conversation_history, message)
-    logging.info(f"Generated prompt for ChatGPT")
+    # Query the assistant, or the fast model when the router picks it
+    with stage('llm_wait'):
+        if model_router is not None:
+            # Without the thread, the fast model needs the history in its prompt; it is
+            # only built (possibly summarizing the history) if the fast path is used
+            fast_prompt = None
+            if context_window.skip_history_with_thread and thread_id is not None:
+                previous_turns = conversation_history[:-1]
 
-    # Query the assistant
-    response, thread_id = query_chatgpt_assistant(prompt, thread_id=thread_id)
-    logging.info(f"ChatGPT response: {response}")
+                def fast_prompt():
+                    return build_mentor_prompt(message, previous_turns, None, conversation_id)
+            response, thread_id = model_router.answer(message, prompt, thread_id, fast_prompt=fast_prompt)
+        else:
+            response, thread_id = query_chatgpt_assistant(prompt, thread_id=thread_id)
+    logging.info(f"ChatGPT response: {payload(response)}")
+    if cacheable:
+        response_cache.put(message, ASSISTANT_CACHE_KEY, response)
 
     # Add assistant response to history
     conversation_history.append({'role': 'assistant', 'content': response})
@@ -107,7 +208,252 @@ def handle_message(message: str, conversation_history: List[Dict[str, str]], thr
     return response, conversation_history, thread_id
 
 
+def build_mentor_prompt(message: str, conversation_history: List[Dict[str, str]], thread_id: str,
+                        conversation_id: str = None) -> str:
+    """
+    Build the mentor prompt for a message, bounding the included history to the token budget.
+
+    Args:
+        message (str): The user's message text.
+        conversation_history (List[Dict[str, str]]): Previous exchanges, excluding `message`.
+        thread_id (str): Existing thread ID; None if it's a new conversation.
+        conversation_id (str): Key of the conversation, used to cache its running summary.
+
+    Returns:
+        str: The prompt to send to the assistant.
+    """
+    with stage('prompt_build'):
+        context = context_window.build(conversation_id, conversation_history, thread_id)
+        prompt = create_prompt_mentor_bot(context.recent_turns, message, summary=context.summary)
+    logging.info(f"Generated prompt for ChatGPT")
+    return prompt
+
+
+def respond_to_message(from_number: str, message: str) -> str:
+    """
+    Load the sender's conversation, generate a reply, and append the new exchange to the store.
+
+    Args:
+        from_number (str): The sender's WhatsApp number, used as the conversation key.
+        message (str): The user's message text.
+
+    Returns:
+        str: The assistant's reply.
+    """
+    with stage('session_load'):
+        conversation = conversation_store.load(from_number)
+    previous_length = len(conversation.history)
+
+    # Generate a response, create a new thread if none exists
+    try:
+        response_text, updated_conversation_history, thread_id = handle_message(
+            message, conversation.history, conversation.thread_id, conversation_id=from_number
+        )
+    except (UpstreamUnavailableError, RunFailedError) as e:
+        logging.warning(f"Sending the degraded reply to {from_number}: {e}")
+        REQUESTS.inc(outcome='degraded')
+        return DEGRADED_MESSAGE
+
+    # Persist only the new user/assistant turns
+    with stage('session_save'):
+        conversation_store.append_turns(from_number, updated_conversation_history[previous_length:],
+                                        thread_id=thread_id)
+    return response_text
+
+
+def respond_to_message_stream(from_number: str, message: str) -> Iterator[str]:
+    """
+    Streaming variant of `respond_to_message`: yields each WhatsApp-sized chunk of
+    the reply as soon as it is complete, and stores the exchange once the run ends.
+
+    Args:
+        from_number (str): The sender's WhatsApp number, used as the conversation key.
+        message (str): The user's message text.
+
+    Yields:
+        str: Each completed message chunk.
+    """
+    conversation = conversation_store.load(from_number)
+    cacheable = response_cache is not None and context_free(conversation.history, conversation.thread_id)
+    cached = response_cache.get(message, ASSISTANT_CACHE_KEY) if cacheable else None
+    if cached is not None:
+        logging.info("Answered from the response cache")
+        for chunk in stream_chunks([cached]):
+            yield chunk
+        conversation_store.append_turns(
+            from_number, [{'role': 'user', 'content': message}, {'role': 'assistant', 'content': cached}]
+        )
+        return
+
+    try:
+        prompt = build_mentor_prompt(message, conversation.history, conversation.thread_id,
+                                     conversation_id=from_number)
+        deltas, thread_id = query_chatgpt_assistant_stream(prompt, thread_id=conversation.thread_id)
+    except UpstreamUnavailableError as e:
+        logging.warning(f"Sending the degraded reply to {from_number}: {e}")
+        REQUESTS.inc(outcome='degraded')
+        yield DEGRADED_MESSAGE
+        return
+
+    parts: List[str] = []
+
+    def record(stream):
+        for delta in stream:
+            parts.append(delta)
+            yield delta
+
+    for chunk in stream_chunks(record(deltas), MessageChunker()):
+        yield chunk
+
+    response_text = ''.join(parts)
+    logging.info(f"Streamed response of length {len(response_text)}")
+    if cacheable:
+        response_cache.put(message, ASSISTANT_CACHE_KEY, response_text)
+    conversation_store.append_turns(
+        from_number,
+        [{'role': 'user', 'content': message}, {'role': 'assistant', 'content': response_text}],
+        thread_id=thread_id,
+    )
+
+
+def process_reply_job(job: ReplyJob) -> Iterator[str]:
+    """
+    Generate the reply for a queued message in out-of-band mode.
+
+    Jobs from the same sender are processed in order by a single worker, so
+    their exchanges are appended to the store in order.
+
+    Args:
+        job (ReplyJob): The queued inbound message.
+
+    Returns:
+        Iterator[str]: The reply in WhatsApp-sized chunks; streamed as they are
+            generated when STREAM_REPLIES is set.
+    """
+    if STREAM_REPLIES:
+        return respond_to_message_stream(job.from_number, job.body)
+    response_text = respond_to_message(job.from_number, job.body)
+    return pack_message(response_text)
+
+
+def get_reply_dispatcher(sender=None) -> ReplyDispatcher:
+    """
+    Return the process-wide reply dispatcher, creating it on first use so that
+    worker threads are started after any gunicorn fork.
+
+    Args:
+        sender: Optional sender to use instead of the one named by TWILIO_SENDER
+            (e.g. a FakeSender for offline testing).
+
+    Returns:
+        ReplyDispatcher: The shared dispatcher.
+    """
+    global reply_dispatcher
+    with _dispatcher_lock:
+        if reply_dispatcher is None:
+            reply_dispatcher = ReplyDispatcher(
+                handler=process_reply_job,
+                sender=get_paced_sender(sender),
+                num_workers=REPLY_WORKERS,
+                max_queue_size=REPLY_QUEUE_SIZE,
+                coalesce_window=COALESCE_DEBOUNCE_SECONDS,
+                max_coalesce_wait=COALESCE_MAX_WAIT_SECONDS,
+            )
+        elif sender is not None:
+            get_paced_sender(sender)
+    return reply_dispatcher
+
+
+def get_paced_sender(sender=None) -> PacedSender:
+    """
+    Return the process-wide paced sender, creating it on first use.
+
+    Args:
+        sender: Optional sender to use from now on instead of the one named by
+            TWILIO_SENDER; the reply dispatcher switches to it too.
+
+    Returns:
+        PacedSender: The shared sender.
+    """
+    global paced_sender
+    with _sender_lock:
+        if paced_sender is None or sender is not None:
+            paced_sender = create_paced_sender(sender or create_sender())
+            if reply_dispatcher is not None:
+                reply_dispatcher.sender = paced_sender
+        return paced_sender
+
+
+def export_business_plan(from_number: str, to_number: str, business_plan: str = None, file_format: str = 'docx',
+                         sender=None):
+    """
+    Render and upload a business plan in the background, then message the user the link.
+
+    Returns immediately; the document is built in memory and uploaded under a
+    unique per-user object name by the shared document pipeline.
+
+    Args:
+        from_number (str): The user's WhatsApp address (the link is sent there).
+        to_number (str): The bot's WhatsApp address to send from.
+        business_plan (str): The business plan content. If None, the plan is generated
+            section by section from the stored conversation on the background worker.
+        file_format (str): "docx" or "txt".
+        sender: Optional reply sender; see `get_paced_sender`.
+
+    Returns:
+        Future: Resolves to the document's public URL.
+    """
+    sender = get_paced_sender(sender)
+
+    def deliver(url):
+        if url is None:
+            sender.send(from_number, to_number, "Sorry, we couldn't prepare your business plan document. "
+                                                "Please try again later.")
+        else:
+            sender.send(from_number, to_number, f"Your business plan is ready: {url}")
+
+    if business_plan is None:
+        def business_plan():
+            history = conversation_store.load(from_number).history
+            return get_business_plan_generator().generate(from_number, history)
+
+    return get_document_pipeline(GCS_BUCKET_NAME).submit(from_number, business_plan, file_format, on_done=deliver)
+
+
+# One turn at a time per sender, across all workers sharing the conversation database,
+# with bursts of messages merged into one turn
+message_coalescer = MessageCoalescer(respond_to_message, debounce=COALESCE_DEBOUNCE_SECONDS,
+                                     max_wait=COALESCE_MAX_WAIT_SECONDS, leases=create_conversation_leases())
+
+
+def _dispatcher_stats() -> dict:
+    if reply_dispatcher is None:
+        return {}
+    stats = {'pending': reply_dispatcher.pending(), 'coalesced_messages': reply_dispatcher.coalesced_messages}
+    for name, value in reply_dispatcher.sender.stats().items():
+        stats[f'messages_{name}'] = value
+    return stats
+
+
+# Gauges read at scrape time
+register_stats('assistant_runs', 'Assistant run and poll totals.', completion_strategy.stats.snapshot)
+register_stats('coalescer', 'Messages merged into an earlier turn, and turns that waited for another worker.',
+               lambda: {'coalesced_messages': message_coalescer.coalesced_messages,
+                        'lease_waits': message_coalescer.leases.waits})
+if model_router is not None:
+    register_stats('router', 'Rolling backend latency and hedging delay.', model_router.stats)
+register_stats('reply_queue', 'Out-of-band reply queue.', _dispatcher_stats)
+register_stats('webhook_duplicates', 'Twilio retries answered without handling the message again.',
+               webhook_deduplicator.stats)
+register_stats('warmup', 'Seconds each background warm-up step took.', lambda: dict(warmup.timings))
+register_stats('assistant_threads', 'Pre-created thread pool and expired threads.', thread_manager.stats)
+if hasattr(conversation_store, 'stats'):
+    register_stats('conversation_cache', 'In-memory conversation cache.', conversation_store.stats)
+if response_cache is not None:
+    register_stats('response_cache', 'Response cache entries and hit rate.', response_cache.stats)
+
 
 if __name__ == '__main__':
+    warmup.start_warmup()
     # Run the Flask app in debug mode for development
     app.run(debug=True, host="0.0.0.0", port=5006)
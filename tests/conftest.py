@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app's modules live in src/ and import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+# Configure the bot modules before any test imports them
+os.environ.setdefault('CONVERSATION_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='whatsapp-tests-'), 'conversations.db'))
+os.environ.setdefault('WARMUP_ENABLED', 'false')
+# No pre-created threads, which the apps would delete through the real client at exit
+os.environ.setdefault('THREAD_POOL_SIZE', '0')
+
+
+@pytest.fixture
+def fakes():
+    """Fake OpenAI, Twilio and Storage clients with near-instant latency."""
+    from clients import reset_clients
+    from fakes import LatencyModel, install_fakes
+
+    fast = LatencyModel.parse('fixed:0.001')
+    installed = install_fakes(run_latency=fast, api_latency=fast, twilio_latency=fast, storage_latency=fast)
+    yield installed
+    reset_clients()
@@ -0,0 +1,151 @@
+import contextlib
+
+import pytest
+
+from admission import AdmissionController, AdmittedClient, CircuitBreaker, UpstreamUnavailableError
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class FakeRuns:
+    def __init__(self):
+        self.error = None
+
+    def create(self, **kwargs):
+        if self.error:
+            raise self.error
+        return 'run'
+
+    @contextlib.contextmanager
+    def _open(self):
+        if self.error:
+            raise self.error
+        yield iter(['delta'])
+
+    def stream(self, **kwargs):
+        return self._open()
+
+
+@pytest.fixture
+def clock():
+    return [0.0]
+
+
+@pytest.fixture
+def controller(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0, clock=lambda: clock[0])
+    return AdmissionController(max_attempts=1, breaker=breaker, sleep=lambda seconds: None, clock=lambda: clock[0])
+
+
+def open_breaker(client, runs):
+    runs.error = ServerError('upstream down')
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailableError):
+            client.create(thread_id='t')
+    runs.error = None
+
+
+def test_breaker_rejects_calls_while_open(controller):
+    runs = FakeRuns()
+    client = AdmittedClient(runs, controller)
+    open_breaker(client, runs)
+    assert controller.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(UpstreamUnavailableError):
+        client.stream(thread_id='t')
+
+
+def test_half_open_stream_that_opens_closes_the_breaker(controller, clock):
+    runs = FakeRuns()
+    client = AdmittedClient(runs, controller)
+    open_breaker(client, runs)
+    clock[0] += 31
+
+    with client.stream(thread_id='t') as stream:
+        assert list(stream) == ['delta']
+    assert controller.breaker.state == CircuitBreaker.CLOSED
+    assert client.create(thread_id='t') == 'run'
+
+
+def test_half_open_stream_that_fails_reopens_the_breaker(controller, clock):
+    runs = FakeRuns()
+    client = AdmittedClient(runs, controller)
+    open_breaker(client, runs)
+    clock[0] += 31
+
+    runs.error = ServerError('still down')
+    with pytest.raises(ServerError):
+        with client.stream(thread_id='t'):
+            pass
+    assert controller.breaker.state == CircuitBreaker.OPEN
+
+    # The next trial after the reset timeout is admitted rather than stuck behind the failed one
+    runs.error = None
+    clock[0] += 31
+    with client.stream(thread_id='t'):
+        pass
+    assert controller.breaker.state == CircuitBreaker.CLOSED
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class Conflict(Exception):
+    status_code = 409
+
+
+class FlakyResource:
+    """Fails with `errors` in turn, then succeeds; counts the calls it received."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'created'
+
+    retrieve = create
+
+
+class FakeClient:
+    def __init__(self, resource):
+        self.beta = type('Beta', (), {'threads': resource})()
+        self.chat = type('Chat', (), {'completions': resource})()
+
+
+@pytest.fixture
+def retrying(clock):
+    return AdmissionController(max_attempts=3, sleep=lambda seconds: None, clock=lambda: clock[0])
+
+
+def test_writes_are_not_retried_after_server_errors(retrying):
+    threads = FlakyResource(ServerError('bad gateway'))
+    with pytest.raises(UpstreamUnavailableError):
+        AdmittedClient(FakeClient(threads), retrying).beta.threads.create()
+    assert threads.calls == 1
+
+
+def test_writes_are_retried_when_the_request_never_landed(retrying):
+    threads = FlakyResource(RateLimited('slow down'))
+    assert AdmittedClient(FakeClient(threads), retrying).beta.threads.create() == 'created'
+    assert threads.calls == 2
+
+
+def test_reads_and_completions_are_retried_after_server_errors(retrying):
+    threads = FlakyResource(ServerError('bad gateway'))
+    assert AdmittedClient(FakeClient(threads), retrying).beta.threads.retrieve() == 'created'
+    completions = FlakyResource(ServerError('bad gateway'))
+    assert AdmittedClient(FakeClient(completions), retrying).chat.completions.create() == 'created'
+    assert threads.calls == completions.calls == 2
+
+
+def test_conflicts_are_not_retried(retrying):
+    threads = FlakyResource(Conflict('run is active'))
+    with pytest.raises(Conflict):
+        AdmittedClient(FakeClient(threads), retrying).beta.threads.retrieve()
+    assert threads.calls == 1
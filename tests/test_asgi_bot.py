@@ -0,0 +1,12 @@
+import pytest
+
+
+def test_refuses_flask_only_settings():
+    import asgi_bot
+
+    asgi_bot.check_settings({})
+    asgi_bot.check_settings({'ASYNC_REPLIES': 'false'})
+    with pytest.raises(RuntimeError, match='ASYNC_REPLIES'):
+        asgi_bot.check_settings({'ASYNC_REPLIES': 'true'})
+    with pytest.raises(RuntimeError, match='STREAM_REPLIES'):
+        asgi_bot.check_settings({'STREAM_REPLIES': 'TRUE'})
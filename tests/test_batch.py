@@ -0,0 +1,116 @@
+from concurrent.futures import Future
+
+from batch import BatchAPIBackend, BatchRequest, BusinessPlanBatch, Checkpoint, ConcurrentBackend
+from business_plan import BusinessPlanGenerator, InterviewSectionContext
+from interview import InterviewTracker
+from utils import BUSINESS_PLAN_SECTIONS
+
+CONVERSATIONS = [
+    ('alice', [{'role': 'user', 'content': 'I run a storytelling course.'}]),
+    ('bob', [{'role': 'user', 'content': 'I sell art classes.'}]),
+    ('carol', []),
+]
+
+
+class StubPipeline:
+    def __init__(self):
+        self.plans = {}
+
+    def submit(self, user_id, business_plan, file_format='docx'):
+        self.plans[user_id] = business_plan
+        future = Future()
+        future.set_result(f'https://storage.example/{user_id}.{file_format}')
+        return future
+
+
+class Model:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError('upstream error')
+        return 'text'
+
+
+def run(tmp_path, model, conversations=CONVERSATIONS, context=None):
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'))
+    pipeline = StubPipeline()
+    try:
+        counts = BusinessPlanBatch(iter(conversations), ConcurrentBackend(model, max_in_flight=3), checkpoint,
+                                   pipeline, file_format='txt', context=context).run()
+    finally:
+        checkpoint.close()
+    return counts, pipeline
+
+
+def test_every_conversation_gets_a_document(tmp_path):
+    model = Model()
+    counts, pipeline = run(tmp_path, model)
+    assert counts['documents'] == 2 and counts['empty'] == 1
+    assert counts['requests'] == len(model.prompts) == 2 * len(BUSINESS_PLAN_SECTIONS)
+    assert all(section in pipeline.plans['alice'] for section in BUSINESS_PLAN_SECTIONS)
+
+
+def test_resumed_run_skips_unchanged_conversations(tmp_path):
+    run(tmp_path, Model())
+    model = Model()
+    counts, pipeline = run(tmp_path, model)
+    assert counts['unchanged'] == 2 and counts['documents'] == 0
+    assert model.prompts == [] and pipeline.plans == {}
+
+
+def test_failed_sections_are_the_only_ones_requested_again(tmp_path):
+    failing = Model(fail_on=f'"{BUSINESS_PLAN_SECTIONS[1]}"')
+    counts, _ = run(tmp_path, failing)
+    assert counts['failed_documents'] == 2 and counts['failed_sections'] == 2
+
+    model = Model()
+    counts, pipeline = run(tmp_path, model)
+    assert counts['requests'] == 2 and counts['reused_sections'] == 2 * (len(BUSINESS_PLAN_SECTIONS) - 1)
+    assert set(pipeline.plans) == {'alice', 'bob'}
+
+
+def test_prompts_match_the_interactive_path(tmp_path):
+    history = [{'role': 'assistant', 'content': 'What is your mission?'},
+               {'role': 'user', 'content': 'Our mission is to empower every founder to tell their story.'}]
+
+    def interview_context():
+        return InterviewSectionContext(InterviewTracker())
+
+    for index, make_context in enumerate((lambda: None, interview_context)):
+        batch_model, interactive_model = Model(), Model()
+        (tmp_path / str(index)).mkdir()
+        run(tmp_path / str(index), batch_model, [('alice', history)], make_context())
+        BusinessPlanGenerator(complete=interactive_model, context=make_context()).generate_sections('alice', history)
+        assert sorted(batch_model.prompts) == sorted(interactive_model.prompts)
+
+
+def test_checkpoint_ignores_a_truncated_last_line(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.record_section('alice#0', 'abc', 'text')
+    checkpoint.record_batch('batch_1', {'alice#1': 'abc'})
+    checkpoint.close()
+    with open(path, 'a') as file:
+        file.write('{"type": "section", "custom_id": "alice#2", "finger')
+
+    restored = Checkpoint(path)
+    assert restored.section('alice#0') == ('abc', 'text')
+    assert restored.section('alice#2') is None
+    assert restored.open_batches == {'batch_1': {'alice#1': 'abc'}}
+    restored.close()
+
+
+def test_batch_api_backend_returns_every_result(fakes):
+    backend = BatchAPIBackend(client=fakes.openai, batch_size=2, max_batches=1, poll_interval=0.01)
+    submitted, collected = [], []
+    requests = [BatchRequest(f'alice#{n}', f'prompt {n}') for n in range(5)]
+    results = list(backend.run(requests, on_submitted=lambda batch_id, ids: submitted.append(ids),
+                               on_collected=collected.append))
+    assert sorted(result.custom_id for result in results) == [request.custom_id for request in requests]
+    assert all(result.text for result in results)
+    assert [len(ids) for ids in submitted] == [2, 2, 1]
+    assert len(collected) == 3
@@ -0,0 +1,77 @@
+from business_plan import BusinessPlanGenerator, InterviewSectionContext, create_section_context
+from interview import SECTION_PROFILES, InterviewTracker
+from utils import BUSINESS_PLAN_SECTIONS
+
+
+def exchange(section, answer):
+    return [{'role': 'assistant', 'content': SECTION_PROFILES[section].question},
+            {'role': 'user', 'content': answer}]
+
+
+HISTORY = (
+    exchange('Business Description', 'We sell an online storytelling course that solves the problem of dull pitches.')
+    + exchange('Business Mission', 'Our mission is to empower every founder to tell their story with confidence.')
+    + exchange('Business goals', 'We want 2 million in revenue and 50000 subscribers within 24 months.')
+)
+
+
+class CountingModel:
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return f'section {len(self.prompts)}'
+
+
+def make_generator(context=None):
+    model = CountingModel()
+    return BusinessPlanGenerator(complete=model, max_workers=2, context=context), model
+
+
+def test_sections_are_cached_until_the_conversation_changes():
+    generator, model = make_generator()
+    first = generator.generate_sections('alice', HISTORY)
+    assert list(first) == list(BUSINESS_PLAN_SECTIONS)
+    assert generator.generate_sections('alice', HISTORY) == first
+    assert len(model.prompts) == 5
+
+    # Without a section context every section depends on the whole conversation
+    generator.generate_sections('alice', HISTORY + exchange('Target Customer', 'Students and young professionals.'))
+    assert len(model.prompts) == 10
+
+
+def test_regenerate_and_invalidate_drop_single_sections():
+    generator, model = make_generator()
+    generator.generate_sections('alice', HISTORY)
+    generator.generate_sections('alice', HISTORY, regenerate=['Business Mission'])
+    generator.invalidate('alice', 'Business goals')
+    generator.generate_sections('alice', HISTORY)
+    assert len(model.prompts) == 7
+    assert generator.reused_sections == 8
+
+
+def test_new_turn_only_regenerates_the_sections_it_is_about():
+    generator, model = make_generator(InterviewSectionContext(InterviewTracker()))
+    generator.generate_sections('alice', HISTORY)
+    assert len(model.prompts) == 5
+
+    answer = 'Our customers are college students and young professionals who are willing to pay 40 dollars.'
+    generator.generate_sections('alice', HISTORY + exchange('Target Customer', answer))
+    assert len(model.prompts) == 6
+    assert answer in model.prompts[-1]
+    assert 'Target Customer' in model.prompts[-1]
+
+
+def test_section_turns_credit_answers_to_the_question_asked():
+    turns = InterviewTracker().section_turns(HISTORY)
+    assert turns['Business Mission'] == HISTORY[2:4]
+    assert HISTORY[5] in turns['Business goals']
+    assert turns['Target Customer'] == []
+
+
+def test_section_context_defaults_to_the_whole_history(monkeypatch):
+    monkeypatch.delenv('BUSINESS_PLAN_SECTION_CONTEXT', raising=False)
+    assert create_section_context() is None
+    monkeypatch.setenv('BUSINESS_PLAN_SECTION_CONTEXT', 'interview')
+    assert isinstance(create_section_context(), InterviewSectionContext)
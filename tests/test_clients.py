@@ -0,0 +1,42 @@
+import threading
+
+import clients
+
+
+def test_openai_client_is_built_once_and_shared():
+    clients.reset_clients()
+    try:
+        first = clients.get_openai_client()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(clients.get_openai_client())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(client is first for client in results)
+        assert first.client.max_retries == clients.OPENAI_MAX_RETRIES
+    finally:
+        clients.reset_clients()
+
+
+def test_set_client_substitutes_a_client_until_reset():
+    fake = object()
+    clients.set_client('twilio', fake)
+    try:
+        assert clients.get_twilio_client() is fake
+    finally:
+        clients.reset_clients()
+
+
+def test_admission_wrapper_follows_the_registered_client():
+    first, second = object(), object()
+    try:
+        clients.set_client('openai', first)
+        wrapped = clients.get_openai_client()
+        assert wrapped.client is first
+        assert clients.get_openai_client() is wrapped
+
+        clients.set_client('openai', second)
+        assert clients.get_openai_client().client is second
+    finally:
+        clients.reset_clients()
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+from coalescer import AsyncMessageCoalescer, ConversationLeases, MessageCoalescer
+
+
+def test_zero_debounce_answers_without_waiting():
+    coalescer = MessageCoalescer(lambda conversation_id, message: message.upper(), debounce=0, max_wait=4.0)
+    started = time.monotonic()
+    assert coalescer.submit('alice', 'hi') == ['HI']
+    assert time.monotonic() - started < 0.5
+
+
+def test_burst_within_debounce_is_answered_as_one_turn():
+    handled = []
+
+    def handler(conversation_id, message):
+        handled.append(message)
+        return f'reply {len(handled)}'
+
+    coalescer = MessageCoalescer(handler, debounce=0.3, max_wait=4.0)
+    results = {}
+    leader = threading.Thread(target=lambda: results.setdefault('leader', coalescer.submit('alice', 'first')))
+    leader.start()
+    time.sleep(0.05)
+    results['follower'] = coalescer.submit('alice', 'second')
+    leader.join()
+
+    assert results == {'leader': ['reply 1'], 'follower': []}
+    assert len(handled) == 1
+    assert 'first' in handled[0] and 'second' in handled[0]
+    assert coalescer.coalesced_messages == 1
+
+
+def test_workers_sharing_the_database_take_turns(tmp_path):
+    path = str(tmp_path / 'leases.db')
+    events = []
+    running = threading.Event()
+
+    def slow_handler(conversation_id, message):
+        events.append(('start', message))
+        running.set()
+        time.sleep(0.3)
+        events.append(('end', message))
+        return message
+
+    def fast_handler(conversation_id, message):
+        events.append(('start', message))
+        events.append(('end', message))
+        return message
+
+    # Two coalescers with their own connections stand in for two worker processes
+    first = MessageCoalescer(slow_handler, debounce=0, leases=ConversationLeases(path, poll_interval=0.01))
+    second = MessageCoalescer(fast_handler, debounce=0, leases=ConversationLeases(path, poll_interval=0.01))
+    worker = threading.Thread(target=first.submit, args=('alice', 'first'))
+    worker.start()
+    assert running.wait(2)
+    assert second.submit('alice', 'second') == ['second']
+    worker.join()
+
+    assert events == [('start', 'first'), ('end', 'first'), ('start', 'second'), ('end', 'second')]
+    assert second.leases.waits == 1
+    # Other conversations are not held up
+    assert second.submit('bob', 'hi') == ['hi'] and second.leases.waits == 1
+
+
+def test_abandoned_lease_expires(tmp_path):
+    leases = ConversationLeases(str(tmp_path / 'leases.db'), ttl=0.2)
+    assert leases.try_acquire('alice', 'dead-worker')
+    assert not leases.try_acquire('alice', 'other')
+    time.sleep(0.25)
+    assert leases.try_acquire('alice', 'other')
+
+
+def test_async_coalescer_holds_the_lease_during_a_turn(tmp_path):
+    leases = ConversationLeases(str(tmp_path / 'leases.db'))
+
+    async def handler(conversation_id, message):
+        assert not leases.try_acquire(conversation_id, 'other-worker')
+        return message.upper()
+
+    coalescer = AsyncMessageCoalescer(handler, debounce=0, leases=leases)
+    assert asyncio.run(coalescer.submit('alice', 'hi')) == ['HI']
+    assert leases.try_acquire('alice', 'other-worker')
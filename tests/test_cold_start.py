@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+HEAVY = ('openai', 'httpx', 'numpy', 'tiktoken', 'twilio.rest', 'google.cloud.storage', 'docx')
+
+
+@pytest.mark.parametrize('module', ['whatsapp_bot', 'asgi_bot'])
+def test_importing_the_app_does_not_import_heavy_sdks(module, tmp_path):
+    code = (f"import sys; sys.path.insert(0, {SRC!r}); import {module}; "
+            f"print('loaded:' + ','.join(name for name in {HEAVY!r} if name in sys.modules))")
+    env = dict(os.environ, OPENAI_API_KEY='test', WARMUP_ENABLED='false',
+               CONVERSATION_DB_PATH=str(tmp_path / 'conversations.db'))
+    env.pop('ASYNC_REPLIES', None)
+    env.pop('STREAM_REPLIES', None)
+    completed = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    # The app logs to stdout too; the report is the last line
+    assert completed.stdout.strip().splitlines()[-1] == 'loaded:'
+
+
+def test_warm_up_builds_the_clients_and_skips_failing_steps(fakes, monkeypatch):
+    import warmup
+
+    monkeypatch.setattr(warmup, 'timings', {})
+    monkeypatch.setattr(warmup, 'warmup_steps',
+                        lambda async_server=False: [('openai', warmup._openai), ('broken', lambda: 1 / 0)])
+    timings = warmup.warm_up()
+    assert set(timings) == {'openai'}
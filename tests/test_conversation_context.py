@@ -0,0 +1,54 @@
+from conversation_context import ContextWindow, turn_tokens
+from conversation_store import SQLiteConversationStore
+
+
+def history(count):
+    return [{'role': 'user' if n % 2 == 0 else 'assistant', 'content': f'turn {n}'} for n in range(count)]
+
+
+def make_window(tmp_path, **kwargs):
+    calls = []
+
+    def summarizer(previous, turns):
+        calls.append(len(turns))
+        return (previous + ' ' + ' '.join(turn['content'] for turn in turns)).strip()
+
+    store = SQLiteConversationStore(str(tmp_path / 'conversations.db'))
+    return ContextWindow(store, summarizer, **kwargs), calls
+
+
+def test_short_history_is_kept_verbatim(tmp_path):
+    window, calls = make_window(tmp_path, keep_last_turns=6, summary_batch_turns=4)
+    context = window.build('alice', history(5))
+    assert context.summary == '' and context.recent_turns == history(5)
+    assert calls == []
+
+
+def test_overflow_is_summarized_in_batches(tmp_path):
+    window, calls = make_window(tmp_path, keep_last_turns=6, summary_batch_turns=4)
+    # Three turns over the window: not enough to pay for a summary yet
+    assert window.build('alice', history(9)).summary == ''
+    context = window.build('alice', history(10))
+    assert calls == [4]
+    assert context.summary == 'turn 0 turn 1 turn 2 turn 3'
+    assert context.recent_turns == history(10)[4:]
+
+    # The stored summary is reused until another batch overflows
+    window.build('alice', history(12))
+    assert calls == [4]
+    assert window.store.load_summary('alice') == (4, 'turn 0 turn 1 turn 2 turn 3')
+
+
+def test_recent_turns_are_trimmed_to_the_token_budget(tmp_path):
+    turns = history(6)
+    budget = sum(turn_tokens(turn) for turn in turns[-3:])
+    window, _ = make_window(tmp_path, max_context_tokens=budget, keep_last_turns=6)
+    context = window.build('alice', turns)
+    assert context.recent_turns == turns[-3:]
+    assert context.tokens <= budget
+
+
+def test_history_is_skipped_when_the_thread_holds_it(tmp_path):
+    window, calls = make_window(tmp_path, skip_history_with_thread=True)
+    assert window.build('alice', history(20), thread_id='thread_1').recent_turns == []
+    assert window.build('alice', history(2)).recent_turns == history(2)
@@ -0,0 +1,132 @@
+import pytest
+
+from conversation_store import CachedConversationStore, SQLiteConversationStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'conversations.db')
+
+
+def turn(role, content):
+    return {'role': role, 'content': content}
+
+
+def test_append_and_load_round_trip(db_path):
+    store = SQLiteConversationStore(db_path)
+    assert store.load('alice').history == []
+    store.append_turns('alice', [turn('user', 'hi'), turn('assistant', 'hello')], thread_id='thread_1')
+    conversation = store.load('alice')
+    assert conversation.history == [turn('user', 'hi'), turn('assistant', 'hello')]
+    assert conversation.thread_id == 'thread_1'
+    assert conversation.version == 1
+
+
+def test_cached_history_is_invalidated_by_another_worker(db_path):
+    first = CachedConversationStore(SQLiteConversationStore(db_path))
+    second = CachedConversationStore(SQLiteConversationStore(db_path))
+    first.append_turns('alice', [turn('user', 'one')])
+    assert len(first.load('alice').history) == 1
+
+    second.append_turns('alice', [turn('user', 'two')])
+    assert [t['content'] for t in first.load('alice').history] == ['one', 'two']
+
+
+def test_cached_summary_is_invalidated_by_another_worker(db_path):
+    first = CachedConversationStore(SQLiteConversationStore(db_path))
+    second = CachedConversationStore(SQLiteConversationStore(db_path))
+    first.append_turns('alice', [turn('user', 'one')])
+    first.save_summary('alice', 1, 'old summary')
+    assert second.load_summary('alice') == (1, 'old summary')
+
+    # The first worker records another exchange and folds it into the summary
+    first.append_turns('alice', [turn('user', 'two')])
+    first.save_summary('alice', 2, 'new summary')
+    assert second.load_summary('alice') == (2, 'new summary')
+
+
+def test_cached_summary_survives_own_appends(db_path):
+    backend = SQLiteConversationStore(db_path)
+    store = CachedConversationStore(backend)
+    store.append_turns('alice', [turn('user', 'one')])
+    store.save_summary('alice', 1, 'summary')
+    store.append_turns('alice', [turn('user', 'two')])
+
+    calls = []
+    original = backend.load_summary
+    backend.load_summary = lambda conversation_id: calls.append(conversation_id) or original(conversation_id)
+    assert store.load_summary('alice') == (1, 'summary')
+    assert calls == []
+
+
+def test_cached_summary_expires_after_ttl(db_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('conversation_store.time.monotonic', lambda: now[0])
+    store = CachedConversationStore(SQLiteConversationStore(db_path), ttl=60.0)
+    store.append_turns('alice', [turn('user', 'one')])
+    store.save_summary('alice', 1, 'summary')
+    now[0] += 61
+    store.backend.save_summary('alice', 5, 'written elsewhere')
+    assert store.load_summary('alice') == (5, 'written elsewhere')
+
+
+def test_iter_conversations_streams_every_conversation_in_pages(db_path):
+    store = SQLiteConversationStore(db_path)
+    for number in range(7):
+        store.append_turns(f'user{number}', [turn('user', f'question {number}')])
+    conversations = list(store.iter_conversations(page_size=3))
+    assert [conversation_id for conversation_id, _ in conversations] == [f'user{n}' for n in range(7)]
+    assert conversations[4][1] == [turn('user', 'question 4')]
+
+
+def test_clear_thread_skips_conversations_written_since_the_sweep(db_path):
+    store = SQLiteConversationStore(db_path)
+    store.append_turns('alice', [turn('user', 'one')], thread_id='thread_1')
+    [(_, thread_id, version)] = store.idle_threads(-1)
+    store.append_turns('alice', [turn('user', 'two')])
+    assert not store.clear_thread('alice', thread_id, version)
+    assert store.load('alice').thread_id == 'thread_1'
+
+
+def test_cleared_thread_is_not_attached_again(db_path):
+    store = SQLiteConversationStore(db_path)
+    store.append_turns('alice', [turn('user', 'one')], thread_id='thread_1')
+    assert store.clear_thread('alice', 'thread_1', 1)
+
+    # A run that was in flight on the deleted thread finishes afterwards
+    store.append_turns('alice', [turn('assistant', 'late')], thread_id='thread_1')
+    assert store.load('alice').thread_id is None
+    store.append_turns('alice', [turn('user', 'two')], thread_id='thread_2')
+    assert store.load('alice').thread_id == 'thread_2'
+
+
+def test_existing_database_gains_the_expired_thread_column(db_path):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE conversations (conversation_id TEXT PRIMARY KEY, thread_id TEXT, '
+                 'version INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)')
+    conn.execute("INSERT INTO conversations VALUES ('alice', 'thread_1', 3, 0)")
+    conn.commit()
+    conn.close()
+
+    store = SQLiteConversationStore(db_path)
+    assert store.clear_thread('alice', 'thread_1', 3)
+    store.append_turns('alice', [turn('user', 'late')], thread_id='thread_1')
+    assert store.load('alice').thread_id is None
+
+
+def test_cache_does_not_revive_a_cleared_thread(db_path):
+    store = CachedConversationStore(SQLiteConversationStore(db_path))
+    store.append_turns('alice', [turn('user', 'one')], thread_id='thread_1')
+    assert store.clear_thread('alice', 'thread_1', 1)
+    assert store.load('alice').thread_id is None
+
+    # A run that was in flight on the deleted thread finishes afterwards
+    store.append_turns('alice', [turn('assistant', 'late')], thread_id='thread_1')
+    conversation = store.load('alice')
+    assert conversation.thread_id is None
+    assert [t['content'] for t in conversation.history] == ['one', 'late']
+
+    store.append_turns('alice', [turn('user', 'two')], thread_id='thread_2')
+    assert store.load('alice').thread_id == 'thread_2'
@@ -0,0 +1,95 @@
+import pytest
+
+from delivery import DeliveryFailedError, PacedSender, pack_message, text_units
+
+EMOJI = '\U0001F600'  # outside the BMP: two UTF-16 code units
+
+
+def test_text_units_counts_astral_characters_twice():
+    assert text_units('abc') == 3
+    assert text_units(EMOJI) == 2
+    assert text_units('a' + EMOJI + 'é') == 4
+
+
+def test_short_reply_is_one_message():
+    assert pack_message('  Hello there.  ') == ['Hello there.']
+    assert pack_message('   ') == []
+
+
+def test_messages_fill_up_to_the_limit_in_utf16_units():
+    text = ' '.join([EMOJI * 4] * 40)  # 40 words of 8 units, 359 units in all
+    messages = pack_message(text, limit=100)
+    assert all(text_units(message) <= 100 for message in messages)
+    assert len(messages) == 4
+    assert ' '.join(messages) == text
+
+
+def test_word_of_emoji_exactly_at_the_limit_is_not_split():
+    word = EMOJI * 50
+    assert pack_message(word, limit=100) == [word]
+    assert pack_message(word + EMOJI, limit=100) == [word, EMOJI]
+
+
+def test_hard_split_never_separates_a_character_from_its_modifier():
+    thumbs = '\U0001F44D\U0001F3FD'  # thumbs up + skin tone, 4 units
+    messages = pack_message('a' + thumbs * 3, limit=7)
+    assert ''.join(messages) == 'a' + thumbs * 3
+    assert all(not message.startswith('\U0001F3FD') for message in messages)
+    assert all(text_units(message) <= 7 for message in messages)
+
+
+def test_split_prefers_sentence_then_paragraph_boundaries():
+    first = 'First sentence here.'
+    second = 'Second one follows.'
+    assert pack_message(f'{first} {second}', limit=30) == [first, second]
+    paragraph = 'x' * 80
+    text = f'{paragraph}\n\n{"y " * 20}'
+    assert pack_message(text, limit=100)[0] == paragraph
+
+
+class FlakySender:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, to, from_, body):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((to, body))
+
+
+class TwilioError(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+
+
+def paced(sender, **kwargs):
+    sleeps = []
+    return PacedSender(sender, per_second=0, min_interval=0, sleep=sleeps.append, **kwargs), sleeps
+
+
+def test_paced_sender_retries_transient_failures():
+    sender = FlakySender([TwilioError(429), TwilioError(503)])
+    paced_sender, sleeps = paced(sender, backoff=1.0)
+    paced_sender.send('alice', 'bot', 'hello')
+    assert sender.sent == [('alice', 'hello')]
+    assert paced_sender.stats() == {'sent': 1, 'retried': 2, 'failed': 0}
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0
+
+
+def test_paced_sender_does_not_retry_permanent_failures():
+    sender = FlakySender([TwilioError(400)])
+    paced_sender, _ = paced(sender)
+    with pytest.raises(DeliveryFailedError):
+        paced_sender.send('alice', 'bot', 'hello')
+    assert paced_sender.stats()['failed'] == 1
+
+
+def test_paced_sender_spaces_messages_to_one_recipient():
+    sender = FlakySender([])
+    sleeps = []
+    paced_sender = PacedSender(sender, per_second=0, min_interval=1.0, limit=10, sleep=sleeps.append)
+    paced_sender.send('alice', 'bot', 'one two three four')
+    assert len(sender.sent) == 2
+    assert len(sleeps) == 1 and 0.9 < sleeps[0] <= 1.0
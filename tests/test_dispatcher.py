@@ -0,0 +1,73 @@
+import threading
+
+from dispatcher import FakeSender, ReplyDispatcher, ReplyJob
+
+
+def job(body, sender='whatsapp:+1555'):
+    return ReplyJob(sender, 'whatsapp:+1000', body)
+
+
+def test_messages_queued_behind_a_running_turn_are_answered_after_it():
+    sender = FakeSender()
+    started, release = threading.Event(), threading.Event()
+
+    def handler(j):
+        started.set()
+        release.wait(5)
+        return [f're: {j.body}']
+
+    dispatcher = ReplyDispatcher(handler, sender, num_workers=3)
+    dispatcher.submit(job('one'))
+    started.wait(5)
+    dispatcher.submit(job('two'))
+    dispatcher.submit(job('three'))
+    dispatcher.submit(job('hello', sender='whatsapp:+1666'))
+    release.set()
+    dispatcher.join()
+    dispatcher.stop()
+    alice = [message['body'] for message in sender.sent if message['to'] == 'whatsapp:+1555']
+    assert alice[0] == 're: one'
+    assert len(alice) == 2 and alice[1].index('two') < alice[1].index('three')
+    assert {'to': 'whatsapp:+1666', 'from_': 'whatsapp:+1000', 'body': 're: hello'} in sender.sent
+
+
+def test_queue_is_bounded():
+    release = threading.Event()
+
+    def handler(j):
+        release.wait(5)
+        return ['ok']
+
+    dispatcher = ReplyDispatcher(handler, FakeSender(), num_workers=1, max_queue_size=2)
+    assert dispatcher.submit(job('one'))
+    assert dispatcher.submit(job('two'))
+    assert not dispatcher.submit(job('three'))
+    release.set()
+    dispatcher.join()
+    dispatcher.stop()
+
+
+def test_burst_is_coalesced_into_one_job():
+    sender = FakeSender()
+    bodies = []
+    dispatcher = ReplyDispatcher(lambda j: bodies.append(j.body) or ['ok'], sender, num_workers=1,
+                                 coalesce_window=0.2)
+    dispatcher.submit(job('first'))
+    dispatcher.submit(job('second'))
+    dispatcher.join()
+    dispatcher.stop()
+    assert len(bodies) == 1 and 'first' in bodies[0] and 'second' in bodies[0]
+    assert dispatcher.coalesced_messages == 1
+
+
+def test_generation_error_sends_the_error_message():
+    sender = FakeSender()
+
+    def handler(j):
+        raise RuntimeError('model down')
+
+    dispatcher = ReplyDispatcher(handler, sender, num_workers=1, error_message='sorry')
+    dispatcher.submit(job('hi'))
+    dispatcher.join()
+    dispatcher.stop()
+    assert [message['body'] for message in sender.sent] == ['sorry']
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+
+from idempotency import IdempotencyStore, WebhookDeduplicator
+
+
+@pytest.fixture
+def deduplicator(tmp_path):
+    store = IdempotencyStore(str(tmp_path / 'deliveries.db'))
+    return WebhookDeduplicator(store, wait_timeout=5.0, poll_interval=0.01, ack_response='<ack/>')
+
+
+def test_duplicate_message_sid_replays_the_stored_response(deduplicator):
+    calls = []
+    respond = lambda: calls.append(1) or f'<reply {len(calls)}/>'
+    assert deduplicator.handle('SM1', respond) == ('<reply 1/>', False)
+    assert deduplicator.handle('SM1', respond) == ('<reply 1/>', True)
+    assert deduplicator.handle('SM2', respond) == ('<reply 2/>', False)
+    assert len(calls) == 2
+    assert deduplicator.stats()['replayed'] == 1
+
+
+def test_retry_during_the_original_waits_for_its_response(deduplicator):
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return '<reply/>'
+
+    results = {}
+    original = threading.Thread(target=lambda: results.setdefault('original', deduplicator.handle('SM1', slow)))
+    original.start()
+    started.wait(5)
+    retry = threading.Thread(target=lambda: results.setdefault('retry', deduplicator.handle('SM1', lambda: 'again')))
+    retry.start()
+    release.set()
+    original.join()
+    retry.join()
+    assert results == {'original': ('<reply/>', False), 'retry': ('<reply/>', True)}
+
+
+def test_failed_delivery_is_handled_again_on_retry(deduplicator):
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        deduplicator.handle('SM1', fail)
+    assert deduplicator.handle('SM1', lambda: '<reply/>') == ('<reply/>', False)
+
+
+def test_async_duplicate_replays_without_touching_sqlite_on_the_loop(deduplicator):
+    store_threads = set()
+    for name in ('begin', 'complete', 'lookup'):
+        method = getattr(deduplicator.store, name)
+        setattr(deduplicator.store, name,
+                lambda *args, _method=method: store_threads.add(threading.get_ident()) or _method(*args))
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return '<reply/>'
+
+        async def again():
+            return 'again'
+
+        original = asyncio.create_task(deduplicator.handle_async('SM1', slow))
+        await asyncio.sleep(0.05)
+        retry = asyncio.create_task(deduplicator.handle_async('SM1', again))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await original, await retry, threading.get_ident()
+
+    original, retry, loop_thread = asyncio.run(scenario())
+    assert original == ('<reply/>', False)
+    assert retry == ('<reply/>', True)
+    assert store_threads and loop_thread not in store_threads
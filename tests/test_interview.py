@@ -0,0 +1,40 @@
+from interview import SECTION_PROFILES, InterviewTracker
+from utils import BUSINESS_PLAN_SECTIONS
+
+
+def test_full_answers_cover_the_section_asked_about():
+    tracker = InterviewTracker()
+    answers = [
+        'We sell an online storytelling course that solves the problem of dull sales pitches.',
+        'Our mission is to empower every founder to tell their story with real confidence.',
+        'We want 2 million in revenue and 50000 subscribers within the next 24 months.',
+        'The Indian edtech market is large and growing, with a few competitors in the sector.',
+        'Our customers are college students and young professionals willing to pay 40 dollars.',
+    ]
+    for section, answer in zip(BUSINESS_PLAN_SECTIONS, answers):
+        assert tracker.credit(answer, section)[section] >= tracker.COVERED
+
+
+def test_short_answer_only_half_covers_the_section():
+    section = BUSINESS_PLAN_SECTIONS[0]
+    assert InterviewTracker().credit('Storytelling classes.', section) == {section: InterviewTracker.AMBIGUOUS}
+
+
+def test_keywords_match_whole_words():
+    tracker = InterviewTracker()
+    # "app" in "apply", "age" in "agency" and "us" in "help us grow" are not keywords
+    assert 'Business Description' not in tracker.credit('Please apply the discount')
+    assert 'Target Customer' not in tracker.credit('We are a design agency')
+    assert 'Target Market and Industry' not in tracker.credit('Can you help us grow?')
+
+    assert 'Business Description' in tracker.credit('Our apps teach drawing')
+    assert 'Target Customer' in tracker.credit('Buyers of any age')
+    assert 'Target Market and Industry' in tracker.credit('We launched in the United States')
+    assert 'Business Mission' in tracker.credit('We are democratizing art education')
+
+
+def test_asked_section_is_read_from_the_template_question():
+    tracker = InterviewTracker()
+    history = [{'role': 'assistant', 'content': SECTION_PROFILES['Business Mission'].follow_up},
+               {'role': 'user', 'content': 'To give every child a creative outlet, wherever they live.'}]
+    assert tracker.section_turns(history)['Business Mission'] == history
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+from fakes import LatencyModel
+from load_test import build_schedule, compare_to_baseline, percentile
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile([], 0.95) == 0.0
+
+
+def test_schedule_is_reproducible_and_retries_reuse_the_message_sid():
+    schedule = build_schedule(users=5, rate=20, duration=5, seed=3, retry_rate=0.5, retry_delay=1.0)
+    assert schedule == build_schedule(users=5, rate=20, duration=5, seed=3, retry_rate=0.5, retry_delay=1.0)
+    assert [entry[0] for entry in schedule] == sorted(entry[0] for entry in schedule)
+    sids = [entry[3] for entry in schedule]
+    assert len(sids) > len(set(sids))
+
+
+def test_latency_model_parses_specs():
+    assert LatencyModel.parse('fixed:0.25').sample() == 0.25
+    model = LatencyModel.parse('lognormal:2.0:0.4', seed=1)
+    assert all(sample > 0 for sample in (model.sample() for _ in range(20)))
+
+
+def test_compare_to_baseline_flags_p95_regressions(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'latency': {'p95_ms': 100.0}, 'stages': {'assistant': {'p95_ms': 50.0}}}))
+    results = {'latency': {'p95_ms': 110.0}, 'stages': {'assistant': {'p95_ms': 80.0}}}
+    assert compare_to_baseline(results, str(baseline), 0.15) == ['assistant: p95 50.0ms -> 80.0ms']
+
+
+def test_short_run_against_the_fakes(tmp_path):
+    output = tmp_path / 'results.json'
+    completed = subprocess.run(
+        [sys.executable, os.path.join(SRC, 'load_test.py'), '--duration', '1', '--rate', '10', '--users', '5',
+         '--run-latency', 'fixed:0.01', '--api-latency', 'fixed:0.001', '--output', str(output)],
+        cwd=tmp_path, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    results = json.loads(output.read_text())
+    assert results['requests'] > 0 and results['errors'] == 0
+    assert results['latency']['p95_ms'] > 0
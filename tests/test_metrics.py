@@ -0,0 +1,73 @@
+from instrumentation import collect_stages, payload, stage
+from metrics import Counter, Histogram, MetricsRegistry, register_stats
+
+
+def test_counter_renders_one_line_per_label_set():
+    counter = Counter('requests_total', 'Requests.', ('outcome',))
+    counter.inc(outcome='ok')
+    counter.inc(2, outcome='ok')
+    counter.inc(outcome='error')
+    assert counter.value(outcome='ok') == 3
+    assert counter.render() == ['# HELP requests_total Requests.', '# TYPE requests_total counter',
+                                'requests_total{outcome="error"} 1', 'requests_total{outcome="ok"} 3']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert histogram.snapshot() == {'count': 4, 'sum': 4.25}
+
+
+def test_broken_gauge_does_not_break_the_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('ok_total', 'Fine.').inc()
+
+    def broken():
+        raise RuntimeError('boom')
+
+    registry.gauge_callback('broken', 'Broken.', broken)
+    registry.gauge_callback('queue_depth', 'Depth.', lambda: [({'queue': 'replies'}, 3)])
+    text = registry.render()
+    assert 'ok_total 1' in text
+    assert 'queue_depth{queue="replies"} 3' in text
+    assert 'broken' not in text
+
+
+def test_register_stats_exposes_numeric_entries():
+    register_stats('test_component', 'Test component.', lambda: {'hits': 2, 'enabled': True, 'name': 'x'})
+    from metrics import REGISTRY
+    text = REGISTRY.render()
+    assert 'test_component{stat="hits"} 2' in text
+    assert 'stat="enabled"' not in text and 'stat="name"' not in text
+
+
+def test_stages_accumulate_within_a_request():
+    with collect_stages() as stages:
+        with stage('llm_wait'):
+            pass
+        with stage('llm_wait'):
+            pass
+        with stage('twiml'):
+            pass
+    assert set(stages) == {'llm_wait', 'twiml'}
+    with stage('outside'):
+        pass
+    assert 'outside' not in stages
+
+
+def test_payload_logs_only_the_length_by_default():
+    assert payload('secret business idea') == '<20 chars>'
+    assert payload(None) == '<none>'
+
+
+def test_metrics_endpoint(fakes):
+    import whatsapp_bot
+
+    response = whatsapp_bot.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert '# TYPE whatsapp_stage_seconds histogram' in response.get_data(as_text=True)
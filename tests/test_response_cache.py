@@ -0,0 +1,56 @@
+from response_cache import ResponseCache, context_free, normalize_prompt
+
+QUESTION = "How should I price a B2C storytelling course in India?"
+
+
+def test_normalize_prompt_ignores_case_punctuation_and_spacing():
+    assert normalize_prompt("  How do I   PRICE it?! ") == normalize_prompt("how do i price it")
+
+
+def test_exact_hit_after_normalization():
+    cache = ResponseCache(embed=None)
+    cache.put(QUESTION, 'model', 'answer')
+    assert cache.get(QUESTION.upper() + '!!', 'model') == 'answer'
+    assert cache.get(QUESTION, 'other-model') is None
+
+
+def test_miss_then_put_embeds_the_prompt_once():
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return [1.0, 0.0]
+
+    cache = ResponseCache(embed=embed)
+    assert cache.get(QUESTION, 'model') is None
+    cache.put(QUESTION, 'model', 'answer')
+    assert calls == [QUESTION]
+    assert cache.get(QUESTION.replace('India', 'Kerala'), 'model') == 'answer'
+
+
+def test_context_free_only_for_opening_turns():
+    assert context_free([], None)
+    assert not context_free([{'role': 'user', 'content': 'hi'}], None)
+    assert not context_free([], 'thread_1')
+
+
+def test_bot_does_not_share_answers_that_depend_on_history(fakes, monkeypatch):
+    import whatsapp_bot
+
+    cache = ResponseCache(embed=None)
+    monkeypatch.setattr(whatsapp_bot, 'response_cache', cache)
+    monkeypatch.setattr(whatsapp_bot, 'model_router', None)
+
+    # A follow-up in an ongoing conversation is neither served from nor stored in the cache
+    history = [{'role': 'user', 'content': 'I run a course'}, {'role': 'assistant', 'content': 'Tell me more'}]
+    whatsapp_bot._handle_message(QUESTION, list(history), None, conversation_id='alice')
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['misses'] == 0
+
+    # An opening question is cached and served to the next new conversation
+    whatsapp_bot._handle_message(QUESTION, [], None, conversation_id='bob')
+    runs = fakes.openai.calls.get('runs.create', 0)
+    response, _, _ = whatsapp_bot._handle_message(QUESTION, [], None, conversation_id='carol')
+    assert cache.stats()['exact_hits'] == 1
+    assert fakes.openai.calls.get('runs.create', 0) == runs
+    assert response.strip() == fakes.openai.backend.reply_text.strip()
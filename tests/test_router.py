@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+
+from router import ASSISTANT, CLARIFICATION, FAST, MENTOR, TRIVIAL, ModelRouter, classify_message
+
+QUESTION = "How should I price a B2C storytelling course in India?"
+
+
+def make_router(primary_seconds, **kwargs):
+    def primary(prompt, thread_id):
+        time.sleep(primary_seconds)
+        return 'primary answer', thread_id
+
+    router = ModelRouter(primary=primary, fast=lambda prompt: 'fast answer', hedge_min_delay=0.2,
+                         min_samples=1, **kwargs)
+    router.latency[ASSISTANT].observe(0.01)
+    return router
+
+
+def test_classify_message():
+    assert classify_message('thanks so much!') == TRIVIAL
+    assert classify_message('what do you mean?') == CLARIFICATION
+    assert classify_message(QUESTION) == MENTOR
+
+
+def test_slow_primary_is_hedged_on_the_fast_path():
+    router = make_router(0.6)
+    assert router.answer(QUESTION, QUESTION, 'thread_1') == ('fast answer', 'thread_1')
+    assert router.stats()['lagging_runs'] == 1
+
+
+def test_hedge_delay_starts_when_the_primary_starts_running():
+    router = make_router(0.1, max_workers=1)
+    release = threading.Event()
+    # Another request's run holds the only primary worker for part of the hedge delay
+    router._primary_executor.submit(release.wait, 5)
+    threading.Timer(0.1, release.set).start()
+    assert router.answer(QUESTION, QUESTION, 'thread_1') == ('primary answer', 'thread_1')
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.done = threading.Event()
+
+    def __call__(self, thread_id, answer, question, superseded):
+        self.calls.append((thread_id, answer, question, superseded))
+        self.done.set()
+
+
+def test_queued_primary_is_hedged_and_cancelled():
+    record = Recorder()
+    router = make_router(0.05, max_workers=1, record=record)
+    release = threading.Event()
+    router._primary_executor.submit(release.wait, 5)
+    started = time.monotonic()
+    assert router.answer(QUESTION, 'prompt', 'thread_1') == ('fast answer', 'thread_1')
+    assert time.monotonic() - started < 0.5
+    release.set()
+    assert record.done.wait(2)
+    # The primary never ran, so the thread gets the whole exchange
+    assert record.calls == [('thread_1', 'fast answer', 'prompt', None)]
+    assert router.latency[ASSISTANT].count() == 1
+
+
+def test_losing_primary_reply_is_replaced_by_the_answer_sent():
+    record = Recorder()
+    router = make_router(0.4, record=record)
+    assert router.answer(QUESTION, 'prompt', 'thread_1') == ('fast answer', 'thread_1')
+    assert not record.done.is_set()
+    assert record.done.wait(2)
+    assert record.calls == [('thread_1', 'fast answer', None, 'primary answer')]
+
+
+def test_fast_path_answers_are_recorded_in_the_thread():
+    record = Recorder()
+    router = make_router(0.01, record=record)
+    assert router.answer('thanks!', 'prompt', 'thread_1') == ('fast answer', 'thread_1')
+    assert record.done.wait(2)
+    assert record.calls == [('thread_1', 'fast answer', 'prompt', None)]
+    # A new conversation has no thread to record into
+    router.answer('thanks!', 'prompt', None)
+    assert len(record.calls) == 1
+
+
+def test_fast_prompt_is_only_built_on_the_fast_path():
+    built = []
+
+    def fast_prompt():
+        built.append(True)
+        return 'fast prompt'
+
+    router = make_router(0.01)
+    router.answer(QUESTION, QUESTION, 'thread_1', fast_prompt=fast_prompt)
+    assert built == []
+    router.answer('thanks!', QUESTION, 'thread_1', fast_prompt=fast_prompt)
+    assert built == [True]
+
+
+def test_record_assistant_exchange_replaces_the_superseded_reply(fakes):
+    from clients import get_openai_client
+    from utils import record_assistant_exchange
+
+    client = get_openai_client()
+    thread_id = client.beta.threads.create().id
+    client.beta.threads.messages.create(thread_id=thread_id, role='user', content='prompt')
+    client.beta.threads.messages.create(thread_id=thread_id, role='assistant', content='primary answer')
+    record_assistant_exchange(thread_id, 'fast answer', superseded='primary answer\n')
+    messages = client.beta.threads.messages.list(thread_id=thread_id, order='asc').data
+    assert [(message.role, message.content[0].text.value) for message in messages] == [
+        ('user', 'prompt'), ('assistant', 'fast answer')]
+
+
+def test_hedges_do_not_queue_behind_primary_runs():
+    router = make_router(0.6, max_workers=1, hedge_workers=1)
+    started = time.monotonic()
+    assert router.answer(QUESTION, QUESTION, 'thread_1')[0] == 'fast answer'
+    assert time.monotonic() - started < 0.5
+    assert router.latency[FAST].count() == 1
+
+
+def test_async_fast_path_builds_its_prompt_and_records_the_answer():
+    recorded = []
+
+    async def fast_async(prompt):
+        return f'fast answer to {prompt}'
+
+    async def fast_prompt():
+        return 'fast prompt'
+
+    async def record_async(thread_id, answer, question, superseded):
+        recorded.append((thread_id, answer, question, superseded))
+
+    router = ModelRouter(primary=None, fast=None, fast_async=fast_async, record_async=record_async)
+
+    async def main():
+        answer = await router.answer_async('thanks!', 'prompt', 'thread_1', fast_prompt=fast_prompt)
+        await asyncio.sleep(0.05)
+        return answer
+
+    assert asyncio.run(main()) == ('fast answer to fast prompt', 'thread_1')
+    assert recorded == [('thread_1', 'fast answer to fast prompt', 'prompt', None)]
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from fakes import FakeAsyncOpenAI, FakeOpenAI, LatencyModel
+from run_completion import BackoffPollingStrategy, RunFailedError, RunTimeoutError, StreamingRunStrategy
+
+
+class ScriptedRuns:
+    """`runs` resource whose run moves through the given statuses, one per retrieve."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.cancelled = []
+
+    def create(self, thread_id, assistant_id):
+        return SimpleNamespace(id='run_1', status='queued')
+
+    def retrieve(self, thread_id, run_id):
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return SimpleNamespace(id=run_id, status=status, last_error=None, usage={'total_tokens': 7})
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+
+def client_for(runs):
+    return SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+
+
+def strategy(clock, **kwargs):
+    def sleep(seconds):
+        clock[0] += seconds
+    return BackoffPollingStrategy(sleep=sleep, clock=lambda: clock[0], jitter=0.0, **kwargs)
+
+
+def test_backoff_delays_grow_up_to_the_maximum():
+    delays = BackoffPollingStrategy(initial_delay=0.5, max_delay=2.0, multiplier=2.0, jitter=0.0).delays()
+    assert [next(delays) for _ in range(5)] == [0.5, 1.0, 2.0, 2.0, 2.0]
+
+
+def test_polls_until_the_run_completes():
+    clock = [0.0]
+    outcome = strategy(clock).run(client_for(ScriptedRuns(['in_progress', 'in_progress', 'completed'])), 't', 'a')
+    assert (outcome.status, outcome.polls, outcome.usage) == ('completed', 3, {'total_tokens': 7})
+
+
+def test_failed_run_raises():
+    with pytest.raises(RunFailedError):
+        strategy([0.0]).run(client_for(ScriptedRuns(['failed'])), 't', 'a')
+
+
+def test_run_is_cancelled_at_the_deadline():
+    runs = ScriptedRuns(['in_progress'])
+    clock = [0.0]
+    with pytest.raises(RunTimeoutError):
+        strategy(clock, deadline=5.0).run(client_for(runs), 't', 'a')
+    assert runs.cancelled == ['run_1']
+    assert clock[0] == pytest.approx(5.0)
+
+
+def test_run_waiting_for_tool_outputs_is_cancelled():
+    runs = ScriptedRuns(['in_progress', 'requires_action'])
+    with pytest.raises(RunFailedError) as raised:
+        strategy([0.0]).run(client_for(runs), 't', 'a')
+    assert raised.value.status == 'requires_action'
+    assert runs.cancelled == ['run_1']
+
+
+def test_failed_run_is_not_cancelled():
+    runs = ScriptedRuns(['failed'])
+    with pytest.raises(RunFailedError):
+        strategy([0.0]).run(client_for(runs), 't', 'a')
+    assert runs.cancelled == []
+
+
+def slow_run_client(client_class):
+    client = client_class(run_latency=LatencyModel.parse('fixed:1.0'), api_latency=LatencyModel.parse('fixed:0.001'))
+    thread_id = client.backend.create_thread().id
+    client.backend.add_message(thread_id, 'user', 'hello')
+    return client, thread_id
+
+
+def test_streaming_run_is_cancelled_at_the_deadline():
+    client, thread_id = slow_run_client(FakeOpenAI)
+    with pytest.raises(RunTimeoutError):
+        StreamingRunStrategy(deadline=0.1).run(client, thread_id, 'asst_1')
+    assert client.calls['runs.cancel'] == 1
+    assert [run['status'] for run in client.backend.runs.values()] == ['cancelled']
+
+
+def test_async_streaming_run_is_cancelled_at_the_deadline():
+    client, thread_id = slow_run_client(FakeAsyncOpenAI)
+    with pytest.raises(RunTimeoutError):
+        asyncio.run(StreamingRunStrategy(deadline=0.1).run_async(client, thread_id, 'asst_1'))
+    assert client.calls['runs.cancel'] == 1
+
+
+def test_streaming_strategy_collects_the_reply_without_polling(fakes):
+    client = fakes.openai
+    thread_id = client.beta.threads.create().id
+    client.beta.threads.messages.create(thread_id=thread_id, role='user', content='hello')
+    outcome = StreamingRunStrategy().run(client, thread_id, 'asst_1')
+    assert outcome.status == 'completed'
+    assert outcome.polls == 0
+    assert outcome.text == fakes.openai.backend.reply_text
@@ -0,0 +1,38 @@
+from delivery import text_units
+from streaming import MessageChunker, fake_delta_stream, stream_chunks
+
+
+def chunks_of(text, delta_size=7, **kwargs):
+    return list(stream_chunks(fake_delta_stream(text, delta_size), MessageChunker(**kwargs)))
+
+
+def test_releases_a_message_at_each_paragraph_break():
+    first = 'First paragraph with enough words to pass the minimum length of a message.'
+    second = 'Second paragraph, also long enough to be sent as its own WhatsApp message.'
+    assert chunks_of(f"{first}\n\n{second}", min_length=20) == [first, second]
+
+
+def test_emoji_heavy_paragraph_stays_within_the_utf16_limit():
+    # Each emoji is two UTF-16 code units, so this is far over the limit in units
+    text = ' '.join(['🚀🚀🚀 launch'] * 400)
+    chunks = chunks_of(text, max_length=160, min_length=20)
+    assert len(chunks) > 1
+    assert all(text_units(chunk) <= 160 for chunk in chunks)
+    assert ' '.join(chunks) == text
+
+
+def test_unbroken_emoji_run_is_not_split_inside_a_sequence():
+    family = '👩‍👩‍👧'
+    text = family * 60
+    chunks = chunks_of(text, max_length=50, min_length=10)
+    assert all(text_units(chunk) <= 50 for chunk in chunks)
+    assert ''.join(chunks) == text
+    assert not any(chunk.startswith('‍') for chunk in chunks)
+
+
+def test_long_text_without_boundaries_is_cut_between_words():
+    chunker = MessageChunker(max_length=40, min_length=10)
+    text = 'word ' * 30
+    chunks = chunker.feed(text) + chunker.flush()
+    assert all(text_units(chunk) <= 40 for chunk in chunks)
+    assert ' '.join(chunks) == text.strip()
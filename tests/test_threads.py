@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from conversation_store import SQLiteConversationStore
+from threads import ThreadManager
+
+
+class FakeThreads:
+    def __init__(self):
+        self.deleted = []
+
+    def delete(self, thread_id):
+        self.deleted.append(thread_id)
+
+
+def manager_for(store):
+    threads = FakeThreads()
+    client = SimpleNamespace(beta=SimpleNamespace(threads=threads))
+    return ThreadManager(pool_size=0, idle_ttl=-1, store=store, client=client), threads
+
+
+def test_expire_idle_deletes_and_detaches_idle_threads(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / 'conversations.db'))
+    store.append_turns('alice', [{'role': 'user', 'content': 'hi'}], thread_id='thread_1')
+    manager, threads = manager_for(store)
+    assert manager.expire_idle() == 1
+    assert threads.deleted == ['thread_1']
+    assert store.load('alice').thread_id is None
+
+
+def test_expire_idle_keeps_a_thread_used_after_the_sweep_found_it(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / 'conversations.db'))
+    store.append_turns('alice', [{'role': 'user', 'content': 'hi'}], thread_id='thread_1')
+    manager, threads = manager_for(store)
+
+    find_idle = store.idle_threads
+
+    def idle_then_active(idle_seconds, limit):
+        idle = find_idle(idle_seconds, limit)
+        # The conversation gets a new message between the query and the clear
+        store.append_turns('alice', [{'role': 'user', 'content': 'back again'}], thread_id='thread_1')
+        return idle
+
+    store.idle_threads = idle_then_active
+    assert manager.expire_idle() == 0
+    assert threads.deleted == []
+    assert store.load('alice').thread_id == 'thread_1'
+
+
+class CreatingThreads(FakeThreads):
+    def __init__(self):
+        super().__init__()
+        self.created = 0
+
+    def create(self):
+        self.created += 1
+        return SimpleNamespace(id=f'pooled_{self.created}')
+
+
+def test_close_deletes_the_pooled_threads():
+    threads = CreatingThreads()
+    manager = ThreadManager(pool_size=2, client=SimpleNamespace(beta=SimpleNamespace(threads=threads)))
+    manager._refill()
+    assert manager.stats()['pooled'] == 2
+    manager.close()
+    assert sorted(threads.deleted) == ['pooled_1', 'pooled_2']
+    assert manager.stats()['pooled'] == 0
+
+
+def test_thread_created_while_closing_is_deleted():
+    threads = CreatingThreads()
+    manager = ThreadManager(pool_size=2, client=SimpleNamespace(beta=SimpleNamespace(threads=threads)))
+    create = threads.create
+    threads.create = lambda: (manager.close(), create())[1]
+    manager._refill()
+    assert threads.deleted == ['pooled_1']
+    assert manager.stats()['pooled'] == 0
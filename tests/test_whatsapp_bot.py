@@ -0,0 +1,18 @@
+from dispatcher import FakeSender
+
+
+def test_document_links_go_through_the_dispatchers_paced_sender(fakes, monkeypatch):
+    import whatsapp_bot
+
+    monkeypatch.setattr(whatsapp_bot, 'reply_dispatcher', None)
+    monkeypatch.setattr(whatsapp_bot, 'paced_sender', None)
+    sender = FakeSender()
+    dispatcher = whatsapp_bot.get_reply_dispatcher(sender)
+    shared = whatsapp_bot.get_paced_sender()
+    assert dispatcher.sender is shared
+    assert shared.sender is sender
+
+    url = whatsapp_bot.export_business_plan('whatsapp:+15550001', 'whatsapp:+15550000', 'The plan', 'txt').result(10)
+    assert whatsapp_bot.get_paced_sender() is shared
+    assert sender.sent == [{'to': 'whatsapp:+15550001', 'from_': 'whatsapp:+15550000',
+                            'body': f'Your business plan is ready: {url}'}]